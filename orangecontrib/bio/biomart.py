@@ -2,7 +2,10 @@ from __future__ import print_function
 import os
 import errno
 import sys
-import shelve
+import time
+import zlib
+import sqlite3
+import threading
 import itertools
 import warnings
 import io
@@ -10,22 +13,20 @@ import io
 from functools import wraps, reduce
 from collections import namedtuple
 from operator import itemgetter
-from contextlib import closing
 from xml.dom import pulldom
 
 
 if sys.version_info < (3,):
     from urllib2 import HTTPError, urlopen, quote
     from urllib import addinfourl
-    import anydbm
 else:
     from urllib.request import urlopen
     from urllib.response import addinfourl
     from urllib.parse import quote
     from urllib.error import HTTPError
-    import dbm as anydbm
 
 import six
+from six.moves import cPickle as pickle
 
 try:
     from Orange.utils import environ
@@ -234,13 +235,138 @@ DEFAULT_ADDRESS = "http://www.biomart.org/biomart/martservice"
 
 # The cache is python version depended (due to use of pickle)
 _PY_TAG = "py{0.major}.{0.minor}".format(sys.version_info)
-_CACHE_VER = 2  # Cache structure version
+_CACHE_VER = 3  # Cache structure version
 _CACHE_TAG = "v{}-{}".format(_CACHE_VER, _PY_TAG)
 
-DATA_CACHE = os.path.join(environ.buffer_dir,
-                          "biomart-data.cache.{}.db".format(_CACHE_TAG))
-META_CACHE = os.path.join(environ.buffer_dir,
-                          "biomart-mata.cache.{}.db".format(_CACHE_TAG))
+CACHE_FILE = os.path.join(environ.buffer_dir,
+                          "biomart-cache.{}.sqlite".format(_CACHE_TAG))
+
+
+class ResponseCache(object):
+    """
+    A persistent cache of BioMart responses in an SQLite database.
+
+    Response data is stored compressed, with an expiry time depending on
+    the kind of request (`TTL`). When the total size of stored responses
+    exceeds `max_size` bytes the least recently used ones are removed.
+    The database is opened once and can be shared by multiple processes.
+
+    """
+    #: Time to live (in seconds) for "meta" (registry, datasets,
+    #: configuration, ...) and "data" (query) responses.
+    TTL = {"meta": 30 * 24 * 3600, "data": 7 * 24 * 3600}
+
+    def __init__(self, filename=CACHE_FILE, max_size=512 * 2 ** 20):
+        self.filename = filename
+        self.max_size = max_size
+        self._lock = threading.RLock()
+        self._con = None
+
+    def _connection(self):
+        if self._con is None:
+            ensure_dir_exists(os.path.dirname(self.filename))
+            con = sqlite3.connect(self.filename, timeout=30,
+                                  check_same_thread=False,
+                                  isolation_level=None)
+            try:
+                con.execute("PRAGMA journal_mode=WAL")
+            except sqlite3.OperationalError:
+                pass
+            con.executescript("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    kind TEXT,
+                    expires REAL,
+                    accessed REAL,
+                    size INTEGER,
+                    info BLOB,
+                    data BLOB
+                );
+                CREATE INDEX IF NOT EXISTS responses_accessed
+                    ON responses (accessed);
+            """)
+            self._con = con
+        return self._con
+
+    def get(self, key):
+        """
+        Return a (non expired) cached tuple (data, headers, url, code)
+        or None.
+        """
+        now = time.time()
+        with self._lock:
+            try:
+                con = self._connection()
+                row = con.execute(
+                    "SELECT info, data FROM responses "
+                    "WHERE key = ? AND expires > ?", (key, now)).fetchone()
+                if row is None:
+                    return None
+                con.execute("UPDATE responses SET accessed = ? "
+                            "WHERE key = ?", (now, key))
+            except sqlite3.OperationalError:
+                return None
+        headers, url, code = pickle.loads(bytes(row[0]))
+        return (zlib.decompress(bytes(row[1])), headers, url, code)
+
+    def set(self, key, kind, data, headers, url, code):
+        """
+        Store a response of `kind` ("meta" or "data").
+        """
+        now = time.time()
+        info = pickle.dumps((headers, url, code), pickle.HIGHEST_PROTOCOL)
+        blob = zlib.compress(data, 6)
+        size = len(blob) + len(info)
+        with self._lock:
+            try:
+                con = self._connection()
+                con.execute(
+                    "INSERT OR REPLACE INTO responses "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (key, kind, now + self.TTL[kind], now, size,
+                     sqlite3.Binary(info), sqlite3.Binary(blob)))
+                self._evict(con, now)
+            except sqlite3.OperationalError:
+                pass  # e.g. the database is locked; skip caching
+
+    def _evict(self, con, now):
+        con.execute("DELETE FROM responses WHERE expires <= ?", (now,))
+        total, = con.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()
+        if total > self.max_size:
+            # remove the least recently used responses exceeding max_size
+            evict = []
+            cur = con.execute("SELECT key, size FROM responses "
+                              "ORDER BY accessed")
+            for key, size in cur:
+                if total <= self.max_size:
+                    break
+                evict.append((key,))
+                total -= size
+            con.executemany("DELETE FROM responses WHERE key = ?", evict)
+
+    def clear(self):
+        """
+        Remove all cached responses.
+        """
+        with self._lock:
+            self._connection().execute("DELETE FROM responses")
+
+    def close(self):
+        with self._lock:
+            if self._con is not None:
+                self._con.close()
+                self._con = None
+
+
+_shared_cache = None
+
+
+def _default_cache():
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = ResponseCache()
+    return _shared_cache
 
 
 def checkBioMartServerError(response):
@@ -266,38 +392,21 @@ class BioMartConnection(object):
 
     FOLLOW_REDIRECTS = False
 
-    def __init__(self, address=None, timeout=30):
+    def __init__(self, address=None, timeout=30, cache=None):
 
         self.address = address if address is not None else DEFAULT_ADDRESS
         self.timeout = timeout
+        self.cache = cache if cache is not None else _default_cache()
         self._error_cache = {}
 
-    def _get_cache_for_args(self, kwargs):
+    def _cache_kind(self, kwargs):
         if "type" in kwargs:
-            return self._open_meta_cache
+            return "meta"
         elif "query" in kwargs:
-            return self._open_data_cache
+            return "data"
         else:
             raise ValueError
 
-    def _open_data_cache(self, flag="r"):
-        return self._open_cache(DATA_CACHE, flag=flag)
-
-    def _open_meta_cache(self, flag="r"):
-        return self._open_cache(META_CACHE, flag=flag)
-
-    def _open_cache(self, filename, flag="r"):
-        # Ensure the cache db actualy exists (r,w flags do not create it)
-        ensure_dir_exists(os.path.dirname(filename))
-        if flag in ["r", "w"]:
-            try:
-                return shelve.open(filename, flag)
-            except anydbm.error:
-                shelve.open(filename, "c").close()
-                return shelve.open(filename, flag)
-        else:
-            return shelve.open(filename, flag)
-
     def request_url(self, **kwargs):
         order = ["type", "dataset", "mart", "virtualSchema", "query"]
         items = sorted(
@@ -322,19 +431,10 @@ class BioMartConnection(object):
         if cache_key in self._error_cache:
             raise self._error_cache[cache_key]
 
-        cache_open = self._get_cache_for_args(kwargs)
-
-        with closing(cache_open(flag="r")) as cache:
-            response = cache.get(cache_key, None)
-
+        kind = self._cache_kind(kwargs)
+        response = self.cache.get(cache_key)
         if response is not None:
-            rtype, rargs = response
-            if rtype == "Success":
-                response = BioMartConnection._Response(*rargs)
-            elif rtype == "Failure":
-                raise BioMartError(*rargs)
-            else:
-                assert False
+            response = BioMartConnection._Response(*response)
 
         if response is None:
             try:
@@ -354,8 +454,7 @@ class BioMartConnection(object):
                     self._error_cache[url] = err
                     raise
 
-            with closing(cache_open(flag="w")) as cache:
-                cache[cache_key] = ("Success", tuple(response))
+            self.cache.set(cache_key, kind, *response)
 
         return addinfourl(io.BytesIO(response.data), response.headers,
                           response.url, response.code)
@@ -376,12 +475,7 @@ class BioMartConnection(object):
         return self.request(type="configuration", dataset=dataset, **kwargs)
 
     def clear_cache(self):
-        with closing(self._open_data_cache(flag="n")):
-            pass
-
-        with closing(self._open_meta_cache(flag="n")):
-            pass
-
+        self.cache.clear()
         self._error_cache.clear()
 
     # Back compatibility
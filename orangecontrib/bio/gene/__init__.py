@@ -2,8 +2,15 @@ from __future__ import absolute_import
 import sys
 import os
 import time
+import hashlib
+import struct
+import sqlite3
+import tempfile
+
+import numpy
 
 from ..utils import serverfiles
+from ..utils import snapshot
 
 from .. import taxonomy as obiTaxonomy
 from .. import kegg as obiKEGG
@@ -81,6 +88,215 @@ class GeneHistory(object):
             setattr(self, attr, value)
 
 
+class GeneInfoTable(object):
+    """
+    An indexed on-disk (SQLite) table of lines of a tab separated file
+    (gene info or gene history), keyed by one of the columns, with an
+    optional (case insensitive) index of gene aliases.
+
+    Use :obj:`GeneInfoTable.open` to convert the file once and reuse
+    the table while it is newer than the file.
+    """
+    VERSION = 1
+
+    def __init__(self, path):
+        self.path = path
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        self._con.text_factory = str
+
+    @classmethod
+    def table_path(cls, source):
+        return source + ".sqlite"
+
+    @classmethod
+    def open(cls, source, key_column=1, aliases=False):
+        """
+        Return a table for the `source` file, (re)building it if missing
+        or older than `source`.
+        """
+        path = cls.table_path(source)
+        if not cls.is_fresh(path, source):
+            cls.build(path, source, key_column, aliases)
+        return cls(path)
+
+    @classmethod
+    def is_fresh(cls, path, source):
+        if not os.path.exists(path) or \
+                os.path.getmtime(source) > os.path.getmtime(path):
+            return False
+        try:
+            con = sqlite3.connect(path)
+            try:
+                version, = con.execute("PRAGMA user_version").fetchone()
+            finally:
+                con.close()
+        except sqlite3.Error:
+            return False
+        return version == cls.VERSION
+
+    @classmethod
+    def build(cls, path, source, key_column=1, aliases=False):
+        """
+        Build the table of `source` lines at `path`. The table is written
+        to a temporary file and then renamed.
+        """
+        writer = GeneInfoTableWriter(path, key_column, aliases)
+        try:
+            with open(source, "rt") as f:
+                for line in f:
+                    writer.add(line)
+        except Exception:
+            writer.abort()
+            raise
+        writer.close()
+
+    def line(self, key):
+        """ Return the line of `key` or raise KeyError. """
+        row = self._con.execute("SELECT line FROM lines WHERE key = ?",
+                                (key,)).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return row[0]
+
+    def keys(self):
+        return [key for key, in self._con.execute(
+            "SELECT key FROM lines ORDER BY rowid")]
+
+    def lines(self):
+        return (line for line, in self._con.execute(
+            "SELECT line FROM lines ORDER BY rowid"))
+
+    def lookup(self, name):
+        """ Return keys of lines with alias `name` (ignoring case). """
+        return [key for key, in self._con.execute(
+            "SELECT DISTINCT key FROM aliases WHERE alias = ?",
+            (name.lower(),))]
+
+    def __contains__(self, key):
+        return self._con.execute("SELECT 1 FROM lines WHERE key = ?",
+                                 (key,)).fetchone() is not None
+
+    def __len__(self):
+        return self._con.execute("SELECT count(*) FROM lines").fetchone()[0]
+
+
+def _gene_info_aliases(fields):
+    """ Return the set of aliases (gene id, symbol, locus tag and synonyms)
+    of a gene from `fields` of its gene info line (as in GMNCBI). """
+    names = set([fields[1]] + fields[2:4] + fields[4].split("|"))
+    names.discard("-")
+    names.discard("")
+    return names
+
+
+class GeneInfoTableWriter(object):
+    """
+    Build a :obj:`GeneInfoTable` at `path` from lines added one at a
+    time (with :obj:`add`). The table is written to a temporary file
+    which replaces `path` on :obj:`close`.
+    """
+    BATCH_SIZE = 10000
+
+    def __init__(self, path, key_column=1, aliases=False):
+        self.path = path
+        self.key_column = key_column
+        self.aliases = aliases
+        fd, self._tmppath = tempfile.mkstemp(
+            prefix=".geneinfo", dir=os.path.dirname(os.path.abspath(path)))
+        os.close(fd)
+        self._con = sqlite3.connect(self._tmppath)
+        self._con.text_factory = str
+        self._con.execute("PRAGMA synchronous = OFF")
+        self._con.execute("CREATE TABLE lines (key TEXT PRIMARY KEY, line TEXT)")
+        self._con.execute("CREATE TABLE aliases (alias TEXT, key TEXT)")
+        self._lines = []
+        self._alias_rows = []
+
+    def add(self, line):
+        """ Add a line of a gene info (or history) file. """
+        line = line.rstrip("\r\n")
+        if not line.strip() or line.startswith("#"):
+            return
+        fields = line.split("\t")
+        key = fields[self.key_column]
+        self._lines.append((key, line))
+        if self.aliases:
+            self._alias_rows.extend((name.lower(), key)
+                                    for name in _gene_info_aliases(fields))
+        if len(self._lines) >= self.BATCH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        self._con.executemany("INSERT OR REPLACE INTO lines VALUES (?, ?)",
+                              self._lines)
+        self._con.executemany("INSERT INTO aliases VALUES (?, ?)",
+                              self._alias_rows)
+        self._lines, self._alias_rows = [], []
+
+    def close(self):
+        """ Index and commit the table and move it to `path`. """
+        try:
+            self._flush()
+            self._con.execute("CREATE INDEX aliases_alias ON aliases (alias)")
+            self._con.execute("PRAGMA user_version = %i" % GeneInfoTable.VERSION)
+            self._con.commit()
+            self._con.close()
+            if os.path.exists(self.path):
+                os.remove(self.path)
+            os.rename(self._tmppath, self.path)
+        except Exception:
+            self.abort()
+            raise
+
+    def abort(self):
+        """ Discard the table. """
+        self._con.close()
+        if os.path.exists(self._tmppath):
+            os.remove(self._tmppath)
+
+
+class GeneInfoTableMapping(object):
+    """
+    A read only dictionary-like view of a :obj:`GeneInfoTable` with
+    values constructed (once) by `factory` (GeneInfo or GeneHistory).
+    """
+    def __init__(self, table, factory):
+        self.table = table
+        self.factory = factory
+        self._cache = {}
+
+    def __getitem__(self, key):
+        try:
+            return self._cache[key]
+        except KeyError:
+            value = self._cache[key] = self.factory(self.table.line(key))
+            return value
+
+    def get(self, key, def_=None):
+        try:
+            return self[key]
+        except KeyError:
+            return def_
+
+    def __contains__(self, key):
+        return key in self._cache or key in self.table
+
+    def __len__(self):
+        return len(self.table)
+
+    def __iter__(self):
+        return iter(self.table.keys())
+
+    def keys(self):
+        return self.table.keys()
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+
 class NCBIGeneInfo(dict):
     TAX_MAP = {
             "2104": "272634",  # Mycoplasma pneumoniae
@@ -88,11 +304,18 @@ class NCBIGeneInfo(dict):
             "5833": "36329",  # Plasmodium falciparum
             "4932": "559292",  # Saccharomyces cerevisiae
             }
+
+    _table = None
        
-    def __init__(self, organism, genematcher=None):
+    def __init__(self, organism, genematcher=None, indexed=False):
         """ An dictionary like object for accessing NCBI gene info
         Arguments::
                 - *organism*    Organism id
+                - *genematcher* Gene matcher for __call__ (by default the
+                                NCBI gene matcher)
+                - *indexed*     Keep gene info in an indexed on-disk table
+                                instead of in memory (GeneInfo objects are
+                                created on access and cached)
 
         Example::
             >>> info = NCBIGeneInfo("Homo sapiens")
@@ -102,11 +325,20 @@ class NCBIGeneInfo(dict):
 
 
         fname = serverfiles.localpath_download("NCBI_geneinfo", "gene_info.%s.db" % self.taxid)
-        file = open(fname, "rt")
-        self.update(dict([(line.split("\t", 3)[1], line) for line in file.read().splitlines() if line.strip() and not line.startswith("#")]))
+        self._table = None
+        if indexed:
+            self._table = GeneInfoTableMapping(
+                GeneInfoTable.open(fname, key_column=1, aliases=True),
+                GeneInfo)
+        else:
+            file = open(fname, "rt")
+            self.update(dict([(line.split("\t", 3)[1], line) for line in file.read().splitlines() if line.strip() and not line.startswith("#")]))
 
         self.matcher = genematcher
-        if self.matcher == None:
+        if self.matcher == None and indexed and self.taxid != '352472':
+            # matches like matcher([GMNCBI(taxid)]) with the table's index
+            self.matcher = MatcherGeneInfoTable(self._table.table)
+        elif self.matcher == None:
             if self.taxid == '352472':
                 self.matcher = matcher([GMNCBI(self.taxid), GMDicty(), [GMNCBI(self.taxid), GMDicty()]])
             else:
@@ -119,7 +351,12 @@ class NCBIGeneInfo(dict):
         if getattr(self, "_history", None) is None:
             fname = serverfiles.localpath_download("NCBI_geneinfo", "gene_history.%s.db" % self.taxid)
             try:
-                self._history = dict([(line.split("\t")[2], GeneHistory(line)) for line in open(fname, "rb").read().splitlines()])
+                if self._table is not None:
+                    self._history = GeneInfoTableMapping(
+                        GeneInfoTable.open(fname, key_column=2),
+                        GeneHistory)
+                else:
+                    self._history = dict([(line.split("\t")[2], GeneHistory(line)) for line in open(fname, "rb").read().splitlines()])
                 
             except Exception as ex:
                 print >> sys.srderr, "Loading NCBI gene history failed.", ex
@@ -177,8 +414,33 @@ class NCBIGeneInfo(dict):
 
     def __getitem__(self, key):
 #        return self.get(gene_id, self.matcher[gene_id])
+        if self._table is not None:
+            return self._table[key]
         return GeneInfo(dict.__getitem__(self, key))
 
+    def __contains__(self, key):
+        if self._table is not None:
+            return key in self._table
+        return dict.__contains__(self, key)
+
+    def __len__(self):
+        if self._table is not None:
+            return len(self._table)
+        return dict.__len__(self)
+
+    def __iter__(self):
+        if self._table is not None:
+            return iter(self._table)
+        return dict.__iter__(self)
+
+    def keys(self):
+        if self._table is not None:
+            return self._table.keys()
+        return dict.keys(self)
+
+    def iterkeys(self):
+        return iter(self)
+
     def __setitem__(self, key, value):
         if type(value) == str:
             dict.__setitem__(self, key, value)
@@ -192,6 +454,10 @@ class NCBIGeneInfo(dict):
             return def_
 
     def itervalues(self):
+        if self._table is not None:
+            for key in self._table:
+                yield self._table[key]
+            return
         for val in dict.itervalues(self):
             yield GeneInfo(val)
 
@@ -207,9 +473,13 @@ class NCBIGeneInfo(dict):
             return list(self.iteritems())
     else:
         def values(self):
+            if self._table is not None:
+                return self._table.values()
             return map(GeneInfo, super().values())
 
         def items(self):
+            if self._table is not None:
+                return self._table.items()
             return ((key, GeneInfo(value)) for key, value in super().items())
 
     @staticmethod
@@ -447,6 +717,135 @@ def join_sets_l(lsets, lower=False):
         current = join_sets(current, b, lower=lower)
     return current
 
+def _alias_key(alias, lower=False):
+    """ Return the UTF-8 encoded (lower case if `lower`) form of alias. """
+    if lower:
+        alias = alias.lower()
+    if not isinstance(alias, bytes):
+        alias = alias.encode("utf-8")
+    return alias
+
+def _alias_hash(key):
+    """ Return a stable 64 bit hash of an encoded alias key. """
+    return struct.unpack("<Q", hashlib.md5(key).digest()[:8])[0]
+
+class AliasIndex(object):
+    """
+    A compact (read only) mapping of gene aliases to sets of ids of groups
+    of aliases, equivalent to the result of :obj:`create_mapping`.
+
+    Aliases are stored sorted by their hashes in an encoded blob, and group
+    ids in a compressed sparse row layout, so that an index saved with
+    :obj:`save` can be memory mapped with :obj:`load` instead of building
+    the mapping from all aliases.
+    """
+
+    def __init__(self, hashes, key_offsets, key_blob, indptr, ids,
+                 lower=False):
+        # plain ndarray views (of memory maps) are faster to index
+        self.hashes = numpy.asarray(hashes)
+        self.key_offsets = numpy.asarray(key_offsets)
+        self.key_blob = numpy.asarray(key_blob)
+        self.indptr = numpy.asarray(indptr)
+        self.ids = numpy.asarray(ids)
+        self.lower = lower
+
+    @classmethod
+    def build(cls, groups, lower=False):
+        """ Build an index of groups of aliases (see :obj:`create_mapping`). """
+        mapping = {}
+        for i, group in enumerate(groups):
+            for alias in group:
+                mapping.setdefault(_alias_key(alias, lower), set()).add(i)
+        keys = list(mapping)
+        hashes = numpy.array([_alias_hash(k) for k in keys], dtype=numpy.uint64)
+        order = numpy.argsort(hashes, kind="mergesort")
+        keys = [keys[i] for i in order]
+        key_offsets = numpy.zeros(len(keys) + 1, dtype=numpy.int64)
+        key_offsets[1:] = numpy.cumsum([len(k) for k in keys])
+        key_blob = numpy.frombuffer(b"".join(keys), dtype=numpy.uint8)
+        idsets = [sorted(mapping[k]) for k in keys]
+        indptr = numpy.zeros(len(keys) + 1, dtype=numpy.int64)
+        indptr[1:] = numpy.cumsum([len(g) for g in idsets])
+        ids = numpy.fromiter((i for g in idsets for i in g),
+                             dtype=numpy.int32, count=indptr[-1])
+        return cls(hashes[order], key_offsets, key_blob, indptr, ids,
+                   lower=lower)
+
+    def save(self, path, version):
+        """ Save the index to directory `path`. """
+        snapshot.write(path, {"hashes": self.hashes,
+                              "key_offsets": self.key_offsets,
+                              "key_blob": self.key_blob,
+                              "indptr": self.indptr,
+                              "ids": self.ids,
+                              "lower": numpy.array(self.lower)}, version)
+
+    @classmethod
+    def load(cls, path):
+        """ Load (memory map) an index saved with :obj:`save`. """
+        c = snapshot.read(path)
+        return cls(c["hashes"], c["key_offsets"], c["key_blob"],
+                   c["indptr"], c["ids"], lower=bool(c["lower"]))
+
+    def positions(self, aliases):
+        """
+        Return an array with positions of `aliases` in the index
+        (-1 for missing aliases).
+        """
+        keys = [_alias_key(a, self.lower) for a in aliases]
+        qhashes = numpy.array([_alias_hash(k) for k in keys],
+                              dtype=numpy.uint64)
+        pos = numpy.searchsorted(self.hashes, qhashes)
+        found = pos < len(self.hashes)
+        found[found] = self.hashes[pos[found]] == qhashes[found]
+        result = numpy.full(len(keys), -1, dtype=numpy.int64)
+        candidates = numpy.flatnonzero(found)
+        starts = self.key_offsets[pos[candidates]].tolist()
+        ends = self.key_offsets[pos[candidates] + 1].tolist()
+        blob = self.key_blob
+        for i, start, end in zip(candidates.tolist(), starts, ends):
+            if blob[start:end].tobytes() == keys[i]:
+                result[i] = pos[i]
+            else:
+                # resolve a hash collision
+                p = pos[i] + 1
+                while p < len(self.hashes) and self.hashes[p] == qhashes[i]:
+                    start, end = self.key_offsets[p], self.key_offsets[p + 1]
+                    if blob[start:end].tobytes() == keys[i]:
+                        result[i] = p
+                        break
+                    p += 1
+        return result
+
+    def ids_at(self, position):
+        """ Return a set of group ids of the alias at `position`. """
+        return self.ids_many([position])[0]
+
+    def ids_many(self, positions):
+        """ Return a list of sets of group ids for each of `positions`
+        (as returned by :obj:`positions`). """
+        positions = numpy.asarray(positions)
+        valid = positions >= 0
+        starts = numpy.where(valid, self.indptr[positions], 0).tolist()
+        ends = numpy.where(valid, self.indptr[positions + 1], 0).tolist()
+        ids = self.ids
+        return [set(ids[start:end].tolist())
+                for start, end in zip(starts, ends)]
+
+    def __getitem__(self, alias):
+        return self.ids_at(self.positions([alias])[0])
+
+    def get(self, alias, default=None):
+        position = self.positions([alias])[0]
+        return self.ids_at(position) if position >= 0 else default
+
+    def __contains__(self, alias):
+        return self.positions([alias])[0] >= 0
+
+    def __len__(self):
+        return len(self.hashes)
+
 class Matcher(object):
     """
     Matches an input gene to some target gene (set in advance).
@@ -472,6 +871,14 @@ class Matcher(object):
         mat = self.match(gene)
         return mat[0] if len(mat) == 1 else None
 
+    def match_many(self, genes):
+        """
+        Return a list with an index of the single (unique) matching target
+        (in the list of targets given to set_targets) or None for each
+        of the input genes.
+        """
+        return self.matcho.match_many(genes)
+
     def explain(self, gene):
         """ 
         Return gene matches with explanations as lists of tuples:
@@ -548,19 +955,28 @@ class MatcherAliases(Matcher):
             gene = gene.lower()
         return self.mdict[gene]
 
+    def to_ids_many(self, genes):
+        """ Return a list of ids of sets of aliases for each gene. """
+        mdict = self.mdict
+        if isinstance(mdict, AliasIndex):
+            return mdict.ids_many(mdict.positions(genes))
+        if self.ignore_case:
+            genes = [gene.lower() for gene in genes]
+        return [mdict.get(gene, ()) for gene in genes]
+
     def set_targets(self, targets):
         """
         A reverse dictionary is made according to each target's membership
         in the sets of aliases.
         """
         d = defaultdict(list)
+        targets = list(targets)
         #d = id: [ targets ], where id is index of the set of aliases
-        for target in targets:
-            ids = self.to_ids(target)
+        for target, ids in zip(targets, self.to_ids_many(targets)):
             if ids != None:
                 for id in ids:
                     d[id].append(target)
-        mo = MatchAliases(d, self)
+        mo = MatchAliases(d, self, targets)
         self.matcho = mo #backward compatibility - default match object
         return mo
 
@@ -576,12 +992,47 @@ class Match(object):
         """Returns an unique (only one matching target) target or None"""
         mat = self.match(gene)
         return mat[0] if len(mat) == 1 else None
- 
+
+    def target_index(self):
+        """ Returns a dictionary of target positions in self.targets. """
+        if getattr(self, "_target_index", None) is None:
+            self._target_index = {}
+            for i, target in enumerate(self.targets):
+                self._target_index.setdefault(target, i)
+        return self._target_index
+
+    #: _match_many codes of genes without matching targets and of genes
+    #: with multiple matching targets
+    NO_MATCH, AMBIGUOUS = -1, -2
+
+    def _match_many(self, genes):
+        """ Returns a list with an index of the unique target, NO_MATCH or
+        AMBIGUOUS for each gene. """
+        index = self.target_index()
+        codes = []
+        for gene in genes:
+            mat = self.match(gene)
+            if not mat:
+                codes.append(self.NO_MATCH)
+            elif len(mat) == 1:
+                codes.append(index[mat[0]])
+            else:
+                codes.append(self.AMBIGUOUS)
+        return codes
+
+    def match_many(self, genes):
+        """ Returns a list with an index of the unique target (or None)
+        for each gene. """
+        return [code if code >= 0 else None
+                for code in self._match_many(genes)]
+
 class MatchAliases(Match):
 
-    def __init__(self, to_targets, parent):
+    def __init__(self, to_targets, parent, targets=()):
         self.to_targets = to_targets
         self.parent = parent
+        self.targets = list(targets)
+        self._cache = {}
 
     def match(self, gene):
         """
@@ -599,6 +1050,29 @@ class MatchAliases(Match):
         inputgeneids = self.parent.to_ids(gene)
         return [ (self.to_targets[igid], self.parent.aliases[igid]) for igid in inputgeneids ]
 
+    def _match_many(self, genes):
+        """
+        Genes are mapped to ids of sets of aliases in one batch. Results
+        are cached per gene.
+        """
+        genes = list(genes)
+        cache = self._cache
+        new = [gene for gene in set(genes) if gene not in cache]
+        if new:
+            index = self.target_index()
+            to_targets = self.to_targets
+            for gene, ids in zip(new, self.parent.to_ids_many(new)):
+                code = self.NO_MATCH
+                for id in ids:
+                    for target in to_targets.get(id, ()):
+                        i = index[target]
+                        if code == self.NO_MATCH:
+                            code = i
+                        elif code != i:
+                            code = self.AMBIGUOUS
+                cache[gene] = code
+        return [cache[gene] for gene in genes]
+
 class MatcherAliasesPickled(MatcherAliases):
     """
     Gene matchers based on sets of aliases supporting pickling should
@@ -623,9 +1097,14 @@ class MatcherAliasesPickled(MatcherAliases):
     aliases = property(get_aliases, set_aliases)
 
     def get_mdict(self):
-        """ Creates mdict. Aliases are loaded if needed. """
+        """ Creates mdict (an :obj:`AliasIndex` if it can be saved).
+        Aliases are loaded if needed. """
         if not self.saved_mdict:
-            self.saved_mdict = create_mapping(self.aliases, self.ignore_case)
+            index = self.load_alias_index()
+            if index is not None:
+                self.saved_mdict = index
+            else:
+                self.saved_mdict = create_mapping(self.aliases, self.ignore_case)
         return self.saved_mdict
 
     def set_mdict(self, mdict):
@@ -648,6 +1127,40 @@ class MatcherAliasesPickled(MatcherAliases):
         """ Returns gene aliases. """
         notImplemented()
 
+    def alias_index_path(self):
+        """ Returns the path of the saved alias index (or None, if the
+        aliases can not be pickled). """
+        fn = self.filename()
+        if fn is None:
+            return None
+        elif isinstance(fn, tuple):
+            return fn[0] + (".icindex" if self.ignore_case else ".index")
+        else:
+            return os.path.join(buffer_path(),
+                fn + (".icindex" if self.ignore_case else ".index"))
+
+    def load_alias_index(self):
+        """
+        Load the saved :obj:`AliasIndex` of aliases or build and save it
+        if it is missing or outdated. Return None if the aliases can not
+        be pickled.
+        """
+        path = self.alias_index_path()
+        if path is None:
+            return None
+        version = self.create_aliases_version()
+        fn = self.filename()
+        source = fn[0] if isinstance(fn, tuple) else None
+        version = "v1." + (version if version is not None else "")
+        if snapshot.is_fresh(path, source, version):
+            return AliasIndex.load(path)
+        index = AliasIndex.build(self.aliases, self.ignore_case)
+        try:
+            index.save(path, version)
+        except (IOError, OSError):
+            pass
+        return index
+
     def load_aliases(self):
         fn = self.filename()
         ver = self.create_aliases_version() #if version == None ignore it
@@ -899,7 +1412,7 @@ class MatcherSequence(Matcher):
                                 #be problematic if a generator was passed
         for matcher in self.matchers:
             ms.append(matcher.set_targets(targets))
-        om = MatchSequence(ms)
+        om = MatchSequence(ms, targets)
         self.matcho = om
         return om
 
@@ -912,8 +1425,9 @@ class MatcherSequence(Matcher):
 
 class MatchSequence(Match):
 
-    def __init__(self, ms):
+    def __init__(self, ms, targets=()):
         self.ms = ms
+        self.targets = list(targets)
 
     def match(self, gene):
         for match in self.ms:
@@ -929,6 +1443,94 @@ class MatchSequence(Match):
                 return match.explain(gene)
         return []
 
+    def _match_many(self, genes):
+        """ Each matcher in sequence gets the genes left unmatched by the
+        previous ones. """
+        genes = list(genes)
+        result = [self.NO_MATCH] * len(genes)
+        remaining = list(range(len(genes)))
+        for match in self.ms:
+            if not remaining:
+                break
+            codes = match._match_many([genes[i] for i in remaining])
+            for i, code in zip(remaining, codes):
+                result[i] = code
+            remaining = [i for i, code in zip(remaining, codes)
+                         if code == self.NO_MATCH]
+        return result
+
+class MatchGeneInfoTable(Match):
+    """
+    Match genes to gene ids of a :obj:`GeneInfoTable` like
+    ``matcher([GMNCBI(taxid)])`` with the same `targets`: first directly
+    to the targets, then through the table's index of gene ids, symbols,
+    locus tags and synonyms (ignoring case). If `targets` is None, all
+    gene ids in the table are targets.
+    """
+    def __init__(self, table, targets=None):
+        self.table = table
+        self._to_targets = None
+        if targets is not None:
+            self._targets = list(targets)
+            self._to_targets = defaultdict(list)
+            for target in self._targets:
+                self._to_targets[target.lower()].append(target)
+
+    @property
+    def targets(self):
+        if getattr(self, "_targets", None) is None:
+            self._targets = self.table.keys()
+        return self._targets
+
+    def _find_targets(self, names):
+        """ Return targets equal to any of `names` (ignoring case). """
+        if self._to_targets is None:
+            return [name for name in names if name in self.table]
+        return [target for name in names
+                for target in self._to_targets.get(name.lower(), ())]
+
+    def _alias_sets(self, gene):
+        """ Return the sets of aliases which contain `gene`. """
+        return [_gene_info_aliases(self.table.line(key).split("\t"))
+                for key in self.table.lookup(gene)]
+
+    def match(self, gene):
+        direct = self._find_targets([gene])
+        if direct:
+            return list(set(direct))
+        return list(set(target for aliases in self._alias_sets(gene)
+                        for target in self._find_targets(aliases)))
+
+    def explain(self, gene):
+        direct = self._find_targets([gene])
+        if direct:
+            return [(direct, set([target])) for target in direct]
+        explanation = [(self._find_targets(aliases), aliases)
+                       for aliases in self._alias_sets(gene)]
+        if any(targets for targets, _ in explanation):
+            return explanation
+        return []
+
+
+class MatcherGeneInfoTable(Matcher):
+    """
+    Match genes with the alias index of a :obj:`GeneInfoTable`
+    (see :obj:`MatchGeneInfoTable`).
+    """
+    def __init__(self, table):
+        self.table = table
+
+    def set_targets(self, targets):
+        self.matcho = MatchGeneInfoTable(self.table, targets)
+        return self.matcho
+
+    #this two functions are solely for backward compatibility
+    def match(self, gene):
+        return self.matcho.match(gene)
+    def explain(self, gene):
+        return self.matcho.explain(gene)
+
+
 class MatcherDirect(Matcher):
     """
     Directly match target names. Can ignore case. Alias: GMDirect.
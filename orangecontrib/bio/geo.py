@@ -4,6 +4,7 @@ import os
 import gzip
 import re
 import io
+import warnings
 
 from collections import defaultdict
 
@@ -111,12 +112,58 @@ class GDSInfo:
     
 
 class GeneData:
-    """Store mapping between spot id and gene."""
+    """Store mapping between spot id and gene.
+
+    .. deprecated:: GDS keeps its values in :obj:`GDS.values`.
+    """
     def __init__(self, spot_id, gene_name, d):
         self.spot_id = spot_id
         self.gene_name = gene_name
         self.data = d
 
+
+def _soft_values(rows):
+    """Convert a list of rows of SOFT data table values to a float matrix
+    (with NaN for 'null' or missing values)."""
+    values = numpy.array(rows)
+    values = numpy.where((values == "null") | (values == ""), "nan", values)
+    return values.astype(float)
+
+
+def _merge_spot_values(values, sizes, merge_function):
+    """Merge consecutive groups of rows (of `sizes`) of a spots by samples
+    matrix with `merge_function` applied to each sample."""
+    if not len(sizes):
+        return numpy.zeros((0, values.shape[1]))
+    starts = numpy.r_[0, numpy.cumsum(sizes)[:-1]]
+    if merge_function is spots_mean:
+        known = ~numpy.isnan(values)
+        sums = numpy.add.reduceat(numpy.where(known, values, 0), starts)
+        counts = numpy.add.reduceat(known, starts)
+        with numpy.errstate(invalid="ignore", divide="ignore"):
+            return sums / counts
+    elif merge_function is spots_min:
+        return numpy.fmin.reduceat(values, starts)
+    elif merge_function is spots_max:
+        return numpy.fmax.reduceat(values, starts)
+
+    merged = numpy.empty((len(sizes), values.shape[1]))
+    for i, (start, size) in enumerate(zip(starts, sizes)):
+        for j, column in enumerate(values[start:start + size].T.tolist()):
+            v = merge_function([x if x == x else compat.unknown
+                                for x in column])
+            merged[i, j] = numpy.nan if compat.isunknown(v) else float(v)
+    return merged
+
+
+def _table_rows(X):
+    """Return X as expected by compat.create_table."""
+    if compat.OR3:
+        return X
+    return [[v if v == v else compat.unknown for v in row]
+            for row in X.tolist()]
+
+
 class GDS():
     """ 
     Retrieval of a specific GEO DataSet as a :obj:`Orange.data.Table`.
@@ -133,6 +180,8 @@ class GDS():
     :param force_download: Force the download.
 
     """
+    #: Number of data table rows converted to floats at once.
+    block_size = 4096
 
     def __init__(self, gdsname, verbose=False, force_download=False):
         self.gdsname = gdsname
@@ -142,12 +191,11 @@ class GDS():
         d = os.path.dirname(self.filename)
         if not os.path.exists(d):
             os.makedirs(d)
-        self._getinfo() # to get the info
+        self._download()
+        self._read_soft() # info, spot ids, genes and values
         taxid = taxonomy.search(self.info["sample_organism"], exact=True)
         self.info["taxid"] = taxid[0] if len(taxid)==1 else None
-        self._getspotmap() # to get gene->spot and spot->gene mapping
-        self.genes = sorted(self.gene2spots.keys())        
-        self.spots = sorted(self.spot2gene.keys())        
+        self._set_spots() # to get gene->spot and spot->gene mapping
         self.info["gene_count"] = len(self.genes)
         self.gdsdata = None
         self.data = None
@@ -171,11 +219,12 @@ class GDS():
                     f.read() #verify the download
                 os.rename(targetfn + "2", targetfn)
 
-    def _getinfo(self):
-        """Parse GDS data file and return a dictionary with info."""
+    def _read_soft(self):
+        """Parse GDS data file in a single pass: the info dictionary,
+        spot ids and genes and the data table (a spots by samples float
+        matrix with NaN for unknown values)."""
         getstate = lambda x: x.split(" ")[0][1:] 
         getid = lambda x: x.rstrip().split(" ")[2]
-        self._download()
         f = gzip.open(self.filename, "rb")
         if six.PY3:
             f = io.TextIOWrapper(f, encoding=SOFT_ENCODING)
@@ -215,38 +264,84 @@ class GDS():
                 info[t] = int(v)
                 
         # sample information
-        state = None
         for line in f:
-            if state == "header":
-                info["samples"] = line.rstrip().split("\t")[2:]
-                break
             if line.startswith("!dataset_table_begin"):
-                state = "header"
+                break
+        info["samples"] = f.readline().rstrip().split("\t")[2:]
         self.info = info
 
-    def _getspotmap(self, include_spots=None):
-        """Return gene to spot and spot to genes mapings."""
-        f = gzip.open(self.filename, "rb")
-        if six.PY3:
-            f = io.TextIOWrapper(f, encoding=SOFT_ENCODING)
+        # data table
+        spots, genes, rows, blocks = [], [], [], []
         for line in f:
-            if line.startswith("!dataset_table_begin"):
+            if line.startswith("!dataset_table_end"):
                 break
-        f.readline() # skip header
+            spot, gene, values = line.rstrip("\r\n").split("\t", 2)
+            spots.append(spot)
+            genes.append(gene)
+            rows.append(values.split("\t"))
+            if len(rows) == self.block_size:
+                blocks.append(_soft_values(rows))
+                rows = []
+        f.close()
+        if rows:
+            blocks.append(_soft_values(rows))
+
+        #: Spot ids and genes (in the order of the data table).
+        self.spot_ids = spots
+        self.spot_genes = genes
+        #: A spots by samples matrix of values (NaN for unknown values).
+        self.values = numpy.vstack(blocks) if blocks else \
+            numpy.zeros((0, len(info["samples"])))
+
+    def _set_spots(self, include=None):
+        """Set gene to spot and spot to genes mappings (of spots marked
+        by a boolean array `include`)."""
         spot2gene = {}
         gene2spots = {}
-        for line in f:
-            if line.startswith("!dataset_table_end"):
-                break
-            spot, gene = line.rstrip().split("\t")[0:2]
-            if include_spots and (spot not in include_spots):
-                continue 
+        spot_index = {}
+        for i, (spot, gene) in enumerate(zip(self.spot_ids, self.spot_genes)):
+            if include is not None and not include[i]:
+                continue
             spot2gene[spot] = gene
-            gene2spots[gene] = gene2spots.get(gene, []) + [spot]
+            gene2spots.setdefault(gene, []).append(spot)
+            spot_index[spot] = i
     
         self.spot2gene = spot2gene
         self.gene2spots = gene2spots
+        self._spot_index = spot_index
+        self.genes = sorted(self.gene2spots.keys())
+        self.spots = sorted(self.spot2gene.keys())
         
+    def _getinfo(self):
+        """Parse GDS data file (deprecated, see :obj:`_read_soft`)."""
+        warnings.warn("'GDS._getinfo' is deprecated", DeprecationWarning)
+        self._download()
+        self._read_soft()
+
+    def _getspotmap(self, include_spots=None):
+        """Set gene to spot and spot to genes mappings (deprecated, see
+        :obj:`_set_spots`)."""
+        warnings.warn("'GDS._getspotmap' is deprecated", DeprecationWarning)
+        include = None
+        if include_spots:
+            include = [spot in include_spots for spot in self.spot_ids]
+        self._set_spots(include=include)
+
+    def _parse_soft(self, remove_unknown=None):
+        """Set a dictionary of :obj:`GeneData` of spots (deprecated, use
+        :obj:`values`)."""
+        warnings.warn("'GDS._parse_soft' is deprecated", DeprecationWarning)
+        unknown = numpy.isnan(self.values).mean(axis=1) \
+            if self.values.shape[1] else numpy.zeros(len(self.spot_ids))
+        data = {}
+        for i, (spot, gene) in enumerate(zip(self.spot_ids, self.spot_genes)):
+            if remove_unknown and unknown[i] > remove_unknown:
+                continue
+            data[spot] = GeneData(spot, gene,
+                                  [compat.unknown if v != v else v
+                                   for v in self.values[i].tolist()])
+        self.gdsdata = data
+
     def sample_annotations(self, sample_type=None):
         """Return a dictionary with sample annotation."""
         annotation = {}
@@ -267,32 +362,6 @@ class GDS():
         """Return a set of sample types."""
         return set([info["type"] for info in self.info["subsets"]])
     
-    def _parse_soft(self, remove_unknown=None):
-        """Parse GDS data, returns data dictionary."""
-        f = gzip.open(self.filename, "rb")
-        if six.PY3:
-            f = io.TextIOWrapper(f, encoding=SOFT_ENCODING)
-
-        mfloat = lambda x: float(x) if x != 'null' else compat.unknown
-    
-        data = {}
-        # find the start of the data part
-        for line in f:
-            if line.startswith("!dataset_table_begin"):
-                break
-        f.readline()
-        
-        # load data
-        for line in f:
-            if line.startswith("!dataset_table_end"):
-                break
-            d = line.rstrip().split("\t")
-            if remove_unknown and (float(d[2:].count('null')) / len(d[2:]) > remove_unknown):
-#                print "ZZZ", float(d[2:].count('null')) / len(d[2:]), d[2:]
-                continue 
-            data[d[0]] = GeneData(d[0], d[1], [mfloat(v) for v in d[2:]])
-        self.gdsdata = data
-    
     def _to_ExampleTable(self, report_genes=True, merge_function=spots_mean,
                                 sample_type=None, transpose=False):
         """Convert parsed GEO format to orange, save by genes or by spots."""
@@ -320,19 +389,15 @@ class GDS():
             metasvar = [ DiscreteVariable(name=n, values=sorted(values)) 
                 for n,values in ad.items() if n != sample_type ]
 
-            X = []
+            X = self._table_values(report_genes, merge_function).T
             Y = []
             metas = []
             for (i, sampleid) in enumerate(self.info["samples"]):
-                vals = [ ( (merge_function([self.gdsdata[spot].data[i] for spot in self.gene2spots[gene]]) )
-                         if report_genes else self.gdsdata[gene].data[i] ) 
-                         for gene in spots ]
-                X.append(vals)
                 Y.append(sample2class.get(sampleid, None))
                 metas.append([samp_ann[sampleid].get(n, None) for n,_ in ad.items() if n != sample_type ])
 
             domain = compat.create_domain(atts, classvar, metasvar)
-            return compat.create_table(domain, X, Y, metas)
+            return compat.create_table(domain, _table_rows(X), Y, metas)
 
         else: # genes in rows
             annotations = self.sample_annotations(sample_type)
@@ -344,17 +409,22 @@ class GDS():
             metasvar = [ StringVariable(geneatname) ]
             nameval = self.genes if report_genes else self.spots
 
-            X = []
-            metas = []
-            for g in nameval:
-                if report_genes:
-                    X.append(list(map(lambda *x: merge_function(x),
-                        *[self.gdsdata[spot].data for spot in self.gene2spots[g]])))
-                else:
-                    X.append(self.gdsdata[g].data)
+            X = self._table_values(report_genes, merge_function)
             metas = [ [a] for a in nameval]
             domain = compat.create_domain(atts, None, metasvar)
-            return compat.create_table(domain, X, None, metas)
+            return compat.create_table(domain, _table_rows(X), None, metas)
+
+    def _table_values(self, report_genes, merge_function):
+        """Return a genes (or spots) by samples matrix of values."""
+        if report_genes:
+            rows = [self._spot_index[spot] for gene in self.genes
+                    for spot in self.gene2spots[gene]]
+            sizes = [len(self.gene2spots[gene]) for gene in self.genes]
+            return _merge_spot_values(self.values[rows], sizes,
+                                      merge_function)
+        else:
+            return self.values[[self._spot_index[spot]
+                                for spot in self.spots]]
 
     def getdata(self, report_genes=True, merge_function=spots_mean,
                  sample_type=None, transpose=False, remove_unknown=None):
@@ -382,12 +452,12 @@ class GDS():
           of samples with unknown values is above the threshold set by
           ``remove_unknown``. If None, nothing is removed.
         """
-        if self.verbose: print("Reading data ...")
-#        if not self.gdsdata:
-        self._parse_soft(remove_unknown = remove_unknown)
-#        if remove_unknown:
-            # some spots were filtered out, need to revise spot<>gene mappings
-        self._getspotmap(include_spots=set(self.gdsdata.keys()))
+        if remove_unknown and self.values.shape[1]:
+            # some spots are filtered out, need to revise spot<>gene mappings
+            unknown = numpy.isnan(self.values).mean(axis=1)
+            self._set_spots(include=~(unknown > remove_unknown))
+        else:
+            self._set_spots()
         if self.verbose: print("Converting to example table ...")
         self.data = self._to_ExampleTable(merge_function=merge_function,
                                           sample_type=sample_type, transpose=transpose,
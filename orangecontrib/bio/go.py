@@ -20,6 +20,8 @@ except ImportError:
 
 import shutil
 
+import numpy
+
 try:
     from urllib2 import urlopen
 except ImportError:
@@ -46,6 +48,7 @@ except NameError:
     intern = sys.intern
 
 from orangecontrib.bio.utils import serverfiles
+from orangecontrib.bio.utils import snapshot
 from orangecontrib.bio.utils import stats
 
 from orangecontrib.bio import gene as obiGene, taxonomy as obiTaxonomy
@@ -190,6 +193,7 @@ class OBOObject(object):
 
     def parse_stanza(self, stanza):
         intern_tags = set(self._INTERN_TAGS)
+        lines = []
         for line in stanza.splitlines():
             if ":" not in line:
                 continue
@@ -207,6 +211,15 @@ class OBOObject(object):
             comment = comment.strip()
             if tag in intern_tags:
                 value, comment = intern(value), intern(comment)
+            lines.append((tag, value, modifiers, comment))
+        self.set_lines(lines)
+
+    def set_lines(self, lines):
+        """Set the object's contents from a list of parsed
+        (tag, value, modifiers, comment) tuples.
+
+        """
+        for tag, value, modifiers, comment in lines:
             self._lines.append((tag, value, modifiers, comment))
             if tag in multipleTagSet:
                 self.values.setdefault(tag, []).append(value)
@@ -298,7 +311,9 @@ class Ontology(object):
         self.reverse_alias_mapper = defaultdict(set)
         self.header = ""
 
-        if filename is not None:
+        if isinstance(filename, basestring) and os.path.isfile(filename):
+            self._load_file(filename, progress_callback)
+        elif filename is not None:
             self.parse_file(filename, progress_callback)
         elif rev is not None:
             if not _CVS_REVISION_RE.match(rev):
@@ -311,14 +326,14 @@ class Ontology(object):
                                     "gene_ontology_edit@rev%s.obo" % rev)
             if not os.path.exists(filename):
                 self.download_ontology_at_rev(rev, filename, pc)
-            self.parse_file(filename,
+            self._load_file(filename,
                             lambda v: progress_callback(v / 2.0 + 50)
                             if progress_callback else None)
         else:
             filename = serverfiles.localpath_download(
                 "GO", "gene_ontology_edit.obo.tar.gz"
             )
-            self.parse_file(filename, progress_callback)
+            self._load_file(filename, progress_callback)
 
     @classmethod
     def load(cls, progress_callback=None):
@@ -373,6 +388,9 @@ class Ontology(object):
             if progress_callback and i in milestones:
                 progress_callback(90.0 * i / len(data))
 
+        self._update_relations(progress_callback)
+
+    def _update_relations(self, progress_callback=None):
         self.alias_mapper = {}
         self.reverse_alias_mapper = defaultdict(set)
         milestones = progress_bar_milestones(len(self.terms), 10)
@@ -388,6 +406,78 @@ class Ontology(object):
             if progress_callback and i in milestones:
                 progress_callback(90.0 + 10.0 * i / len(self.terms))
 
+    _OBJECT_TYPES = [Term, Typedef, Instance]
+
+    def _load_file(self, filename, progress_callback=None):
+        """Load the ontology from `filename` using its snapshot if it is
+        up to date, otherwise parse the file and (try to) write the
+        snapshot.
+        """
+        path = snapshot.snapshot_path(filename)
+        if snapshot.is_fresh(path, filename, self.version):
+            self._read_snapshot(path, progress_callback)
+        else:
+            self.parse_file(filename, progress_callback)
+            try:
+                self._write_snapshot(path)
+            except (IOError, OSError):
+                pass
+
+    def _write_snapshot(self, path):
+        """Write a snapshot of the parsed ontology to `path`.
+        """
+        objects = list(self.terms.values()) + \
+                  list(self.typedefs.values()) + \
+                  list(self.instances.values())
+        lines = [line for obj in objects for line in obj._lines]
+        object_lines = numpy.zeros(len(objects) + 1, dtype=numpy.int64)
+        object_lines[1:] = numpy.cumsum([len(obj._lines) for obj in objects])
+        columns = {
+            "object_type": numpy.array(
+                [self._OBJECT_TYPES.index(type(obj)) for obj in objects],
+                dtype=numpy.int8),
+            "object_lines": object_lines
+        }
+        columns.update(snapshot.string_column("header", [self.header]))
+        columns.update(snapshot.categorical_column(
+            "tag", [line[0] for line in lines]))
+        for i, name in enumerate(["value", "modifiers", "comment"], 1):
+            columns.update(snapshot.string_column(
+                name, [line[i] for line in lines]))
+        snapshot.write(path, columns, self.version)
+
+    def _read_snapshot(self, path, progress_callback=None):
+        """Load the ontology from a snapshot written by `_write_snapshot`.
+        """
+        columns = snapshot.read(path)
+        self.header = snapshot.strings(columns, "header")[0]
+        intern_tags = set(OBOObject._INTERN_TAGS)
+        codes, tags = snapshot.categories(columns, "tag")
+        tags = [intern(tag) for tag in tags]
+        tag_codes = codes.tolist()
+        values = snapshot.strings(columns, "value")
+        modifiers = snapshot.strings(columns, "modifiers")
+        comments = snapshot.strings(columns, "comment")
+        object_lines = columns["object_lines"].tolist()
+        object_type = columns["object_type"].tolist()
+        containers = [self.terms, self.typedefs, self.instances]
+
+        milestones = progress_bar_milestones(len(object_type), 90)
+        for i, type_code in enumerate(object_type):
+            lines = []
+            for j in range(object_lines[i], object_lines[i + 1]):
+                tag, value, comment = tags[tag_codes[j]], values[j], comments[j]
+                if tag in intern_tags:
+                    value, comment = intern(value), intern(comment)
+                lines.append((tag, value, modifiers[j], comment))
+            obj = self._OBJECT_TYPES[type_code](None, self)
+            obj.set_lines(lines)
+            containers[type_code][obj.id] = obj
+            if progress_callback and i in milestones:
+                progress_callback(90.0 * i / len(object_type))
+
+        self._update_relations(progress_callback)
+
     def defined_slims_subsets(self):
         """
         Return a list of defined subsets in the ontology.
@@ -620,6 +710,260 @@ class AnnotationRecord(_AnnotationRecordBase):
         return list(map(intern, self.DB_Object_Synonym.split("|")))
 
 
+class AnnotationTable(object):
+    """
+    A compact, column oriented sequence of :class:`AnnotationRecord`.
+
+    Each field is stored as an int32 array of codes into a list of
+    (interned) field values, so repeated values (gene names, term ids,
+    evidence codes, ...) are stored only once. Records are created on
+    access.
+
+    :param list columns: A list of code arrays (one per field).
+    :param list categories: A list of value lists (one per field).
+
+    """
+    #: Number of records materialized at once when iterating.
+    block = 4096
+
+    def __init__(self, columns=None, categories=None):
+        nfields = len(annotationFields)
+        if columns is None:
+            columns = [numpy.zeros(0, dtype=numpy.int32)] * nfields
+            categories = [[] for _ in range(nfields)]
+        self.columns = list(columns)
+        self.categories = [list(cats) for cats in categories]
+        self._category_index = [dict((c, i) for i, c in enumerate(cats))
+                                for cats in self.categories]
+        self._pending = []
+        self._groups = {}
+
+    def _flush(self):
+        if self._pending:
+            pending = numpy.array(self._pending, dtype=numpy.int32)
+            self.columns = [numpy.concatenate([column, pending[:, i]])
+                            for i, column in enumerate(self.columns)]
+            self._pending = []
+
+    def append(self, record):
+        """
+        Append an :class:`AnnotationRecord` to the table.
+        """
+        codes = []
+        for value, cats, index in zip(record, self.categories,
+                                      self._category_index):
+            code = index.get(value)
+            if code is None:
+                code = index[value] = len(cats)
+                cats.append(value)
+            codes.append(code)
+        self._pending.append(codes)
+        self._groups = {}
+
+    def __len__(self):
+        return len(self.columns[0]) + len(self._pending)
+
+    def records(self, rows):
+        """
+        Return a list of :class:`AnnotationRecord` for `rows` (a sequence
+        or array of row indices).
+        """
+        self._flush()
+        values = [[cats[c] for c in column[rows].tolist()]
+                  for column, cats in zip(self.columns, self.categories)]
+        return [AnnotationRecord._make(r) for r in zip(*values)]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.records(numpy.arange(len(self))[index])
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        return self.records([index])[0]
+
+    def __iter__(self):
+        for start in range(0, len(self), self.block):
+            for record in self.records(numpy.arange(
+                    start, min(start + self.block, len(self)))):
+                yield record
+
+    def field_index(self, field):
+        return annotationFields.index(field)
+
+    def codes(self, field):
+        """
+        Return the code array of `field`.
+        """
+        self._flush()
+        return self.columns[self.field_index(field)]
+
+    def values(self, field, rows=None):
+        """
+        Return a list of `field` values (of all rows or of `rows`).
+        """
+        codes = self.codes(field)
+        if rows is not None:
+            codes = codes[rows]
+        cats = self.categories[self.field_index(field)]
+        return [cats[c] for c in codes.tolist()]
+
+    def rows(self, field, value):
+        """
+        Return an array of row indices where `field` equals `value`.
+        """
+        i = self.field_index(field)
+        code = self._category_index[i].get(value)
+        if code is None:
+            return numpy.zeros(0, dtype=int)
+        if field not in self._groups:
+            codes = self.codes(field)
+            order = numpy.argsort(codes, kind="mergesort")
+            indptr = numpy.zeros(len(self.categories[i]) + 1, dtype=int)
+            indptr[1:] = numpy.cumsum(
+                numpy.bincount(codes, minlength=len(self.categories[i])))
+            self._groups[field] = (order, indptr)
+        order, indptr = self._groups[field]
+        return order[indptr[code]:indptr[code + 1]]
+
+
+class AnnotationIndex(object):
+    """
+    A read only mapping from values of `field` to lists of
+    :class:`AnnotationRecord` with that value in an
+    :class:`AnnotationTable`. Lists are created on access, and missing
+    keys map to empty lists (as with a defaultdict).
+
+    """
+    def __init__(self, table, field):
+        self.table = table
+        self.field = field
+
+    def __getitem__(self, key):
+        return self.table.records(self.table.rows(self.field, key))
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def __contains__(self, key):
+        return len(self.table.rows(self.field, key)) > 0
+
+    def keys(self):
+        cats = self.table.categories[self.table.field_index(self.field)]
+        counts = numpy.bincount(self.table.codes(self.field),
+                                minlength=len(cats))
+        return [c for c, count in zip(cats, counts) if count]
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.keys())
+
+    def values(self):
+        return [self[key] for key in self.keys()]
+
+    def items(self):
+        return [(key, self[key]) for key in self.keys()]
+
+
+def _aspects_set(aspect):
+    if aspect is None:
+        return set(["P", "C", "F"])
+    elif isinstance(aspect, basestring):
+        return set([aspect])
+    else:
+        return set(aspect)
+
+
+class TermGeneIndex(object):
+    """
+    An index of genes annotated to GO terms (or any of their sub terms).
+
+    Genes are numbered by their position in the sorted list of gene
+    names (:obj:`genes`), and the genes of each term are stored as a
+    sorted integer array in a compressed sparse row layout
+    (:obj:`indptr`, :obj:`indices`), so that the genes of ``terms[i]``
+    are ``indices[indptr[i]:indptr[i + 1]]``.
+
+    Use :func:`Annotations.get_term_gene_index` to get an index for a
+    set of evidence codes and aspects.
+
+    """
+    def __init__(self, annotations, ontology, evidence_codes=None,
+                 aspects=None):
+        evidence_codes = set(evidence_codes or evidenceDict.keys())
+        aspects = set(aspects or ["P", "C", "F"])
+
+        #: A sorted list of gene names.
+        self.genes = sorted(annotations.gene_names)
+        #: A dictionary mapping gene names to their indices.
+        self.gene_index = dict((g, i) for i, g in enumerate(self.genes))
+
+        table = annotations.annotations
+        if isinstance(table, AnnotationTable):
+            fields = ["Evidence_Code", "Aspect", "GO_ID", "DB_Object_Symbol"]
+            records = zip(*[table.values(field) for field in fields])
+        else:
+            records = ((ann.Evidence_Code, ann.Aspect, ann.GO_ID, ann.geneName)
+                       for ann in table)
+
+        direct = defaultdict(set)
+        #: A dictionary mapping annotated term ids which are not in the
+        #: ontology to sets of indices of their genes.
+        self.missing_terms = defaultdict(set)
+        for evidence, aspect, go_id, gene in records:
+            if evidence in evidence_codes and aspect in aspects:
+                term = ontology.alias_mapper.get(go_id, go_id)
+                if term in ontology.terms:
+                    direct[term].add(self.gene_index[gene])
+                else:
+                    self.missing_terms[go_id].add(self.gene_index[gene])
+
+        propagated = defaultdict(set)
+        for term, genes in six.iteritems(direct):
+            for super_term in ontology.extract_super_graph([term]):
+                propagated[super_term].update(genes)
+
+        #: A list of term ids.
+        self.terms = sorted(propagated)
+        #: A dictionary mapping term ids to their indices.
+        self.term_index = dict((t, i) for i, t in enumerate(self.terms))
+
+        sizes = [len(propagated[t]) for t in self.terms]
+        self.indptr = numpy.zeros(len(self.terms) + 1, dtype=int)
+        self.indptr[1:] = numpy.cumsum(sizes)
+        self.indices = numpy.fromiter(
+            (g for t in self.terms for g in sorted(propagated[t])),
+            dtype=int, count=self.indptr[-1])
+        #: Term index of each element of indices.
+        self.term_of = numpy.repeat(numpy.arange(len(self.terms)), sizes)
+
+    def gene_mask(self, genes):
+        """
+        Return a boolean array over all indexed genes marking `genes`
+        (gene names not in the index are ignored).
+        """
+        mask = numpy.zeros(len(self.genes), dtype=bool)
+        mask[[self.gene_index[g] for g in genes
+              if g in self.gene_index]] = True
+        return mask
+
+    def term_genes(self, term):
+        """
+        Return the gene indices of `term`.
+        """
+        i = self.term_index[term]
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def counts(self, mask):
+        """
+        Return the number of genes in `mask` annotated to each term.
+        """
+        return numpy.bincount(self.term_of, weights=mask[self.indices],
+                              minlength=len(self.terms)).astype(int)
+
+
 class Annotations(object):
     """
     :class:`Annotations` object holds the annotations.
@@ -639,20 +983,19 @@ class Annotations(object):
         (see `GO web CVS
         <http://cvsweb.geneontology.org/cgi-bin/cvsweb.cgi/go/gene-associations/>`_)
 
+    :param bool columnar:
+        Store the annotations in a compact :class:`AnnotationTable`
+        instead of a list of records. `gene_annotations` and
+        `term_anotations` are then :class:`AnnotationIndex` mappings
+        that create the records on access.
+
     """
     version = 2
 
     def __init__(self, filename_or_organism=None, ontology=None, genematcher=None,
-                 progress_callback=None, rev=None):
+                 progress_callback=None, rev=None, columnar=False):
         self.ontology = ontology
-
-        #: A dictionary mapping a gene name (DB_Object_Symbol) to a
-        #: set of all annotations of that gene.
-        self.gene_annotations = defaultdict(list)
-
-        #: A dictionary mapping a GO term id to a set of annotations that
-        #: are directly annotated to that term
-        self.term_anotations = defaultdict(list)
+        self.columnar = columnar
 
         self.all_annotations = defaultdict(list)
 
@@ -660,8 +1003,7 @@ class Annotations(object):
         self._gene_names_dict = None
         self._alias_mapper = None
 
-        #: A list of all :class:`AnnotationRecords` instances.
-        self.annotations = []
+        self._set_table(AnnotationTable() if columnar else None)
         self.header = ""
         self.genematcher = genematcher
         self.taxid = None
@@ -672,6 +1014,10 @@ class Annotations(object):
             if type(filename_or_organism, Annotations):
                 self.taxid = filename_or_organism.taxid
 
+        elif isinstance(filename_or_organism, basestring) and \
+                os.path.isfile(filename_or_organism):
+            self._load_file(filename_or_organism, progress_callback)
+
         elif isinstance(filename_or_organism, basestring) and \
                 os.path.exists(filename_or_organism):
             self.parse_file(filename_or_organism, progress_callback)
@@ -693,10 +1039,11 @@ class Annotations(object):
                     self.DownloadAnnotationsAtRev(
                         code, rev, filename, progress_callback)
 
-                self.parse_file(filename, progress_callback)
+                self._load_file(filename, progress_callback)
                 self.taxid = to_taxid(code).pop()
             else:
-                a = self.Load(filename_or_organism, ontology, genematcher, progress_callback)
+                a = self.Load(filename_or_organism, ontology, genematcher,
+                              progress_callback, columnar=columnar)
                 self.__dict__ = a.__dict__
                 self.taxid = to_taxid(organism_name_search(filename_or_organism)).pop()
         elif filename_or_organism is not None:
@@ -715,6 +1062,24 @@ class Annotations(object):
         if self.genematcher:
             self.genematcher.set_targets(self.gene_names)
 
+    def _set_table(self, table=None):
+        if table is not None:
+            #: An :class:`AnnotationTable` (in columnar mode) or a list
+            #: of all :class:`AnnotationRecords` instances.
+            self.annotations = table
+
+            #: A dictionary mapping a gene name (DB_Object_Symbol) to a
+            #: set of all annotations of that gene.
+            self.gene_annotations = AnnotationIndex(table, "DB_Object_Symbol")
+
+            #: A dictionary mapping a GO term id to a set of annotations
+            #: that are directly annotated to that term
+            self.term_anotations = AnnotationIndex(table, "GO_ID")
+        else:
+            self.annotations = []
+            self.gene_annotations = defaultdict(list)
+            self.term_anotations = defaultdict(list)
+
     @classmethod
     def organism_name_search(cls, org):
         ids = to_taxid(org)
@@ -751,6 +1116,7 @@ class Annotations(object):
         """Set the ontology to use in the annotations mapping.
         """
         self.all_annotations = defaultdict(list)
+        self._term_gene_index = {}
         self._ontology = ontology
 
     def get_ontology(self):
@@ -765,7 +1131,7 @@ class Annotations(object):
 
     @classmethod
     def load(cls, org, ontology=None, genematcher=None,
-             progress_callback=None):
+             progress_callback=None, columnar=False):
         """A class method that tries to load the association file for the
         given organism from default_database_path.
         """
@@ -783,7 +1149,7 @@ class Annotations(object):
             serverfiles.download("GO", filename)
 
         return cls(path, ontology=ontology, genematcher=genematcher,
-                   progress_callback=progress_callback)
+                   progress_callback=progress_callback, columnar=columnar)
 
     Load = load
 
@@ -825,6 +1191,65 @@ class Annotations(object):
             if progress_callback and i in milestones:
                 progress_callback(100.0 * i / len(lines))
 
+    def _load_file(self, filename, progress_callback=None):
+        """Load the annotations from `filename` using its snapshot if it
+        is up to date, otherwise parse the file and (try to) write the
+        snapshot.
+        """
+        path = snapshot.snapshot_path(filename)
+        if snapshot.is_fresh(path, filename, self.version):
+            self._read_snapshot(path, progress_callback)
+        else:
+            self.parse_file(filename, progress_callback)
+            try:
+                self._write_snapshot(path)
+            except (IOError, OSError):
+                pass
+
+    def _write_snapshot(self, path):
+        """Write a snapshot of the annotations to `path`.
+        """
+        columns = snapshot.string_column("header", [self.header])
+        if self.columnar:
+            for field, cats in zip(annotationFields,
+                                   self.annotations.categories):
+                columns.update(snapshot.string_column(
+                    field + "_categories", cats))
+                columns[field + "_codes"] = self.annotations.codes(field)
+        else:
+            for i, field in enumerate(annotationFields):
+                columns.update(snapshot.categorical_column(
+                    field, [ann[i] for ann in self.annotations]))
+        snapshot.write(path, columns, self.version)
+
+    def _read_snapshot(self, path, progress_callback=None):
+        """Load the annotations from a snapshot written by
+        `_write_snapshot`.
+        """
+        columns = snapshot.read(path)
+        self.header = snapshot.strings(columns, "header")[0]
+        codes, categories = [], []
+        for field in annotationFields:
+            field_codes, values = snapshot.categories(columns, field)
+            codes.append(field_codes)
+            categories.append([intern(value) for value in values])
+
+        if self.columnar:
+            # the code arrays stay memory mapped
+            self._set_table(AnnotationTable(codes, categories))
+            self._annotations_changed()
+            return
+
+        fields = [[values[c] for c in field_codes.tolist()]
+                  for field_codes, values in zip(codes, categories)]
+
+        count = len(fields[0])
+        milestones = progress_bar_milestones(count, 100)
+        for i, record in enumerate(zip(*fields)):
+            self.add_annotation(AnnotationRecord._make(record))
+            if progress_callback and i in milestones:
+                progress_callback(100.0 * i / count)
+
     def add_annotation(self, a):
         """Add a single :class:`AnotationRecord` instance to this object.
         """
@@ -833,10 +1258,15 @@ class Annotations(object):
         if not a.geneName or not a.GOId or a.Qualifier == "NOT":
             return
 
-        self.gene_annotations[a.geneName].append(a)
         self.annotations.append(a)
-        self.term_anotations[a.GOId].append(a)
+        if not self.columnar:
+            self.gene_annotations[a.geneName].append(a)
+            self.term_anotations[a.GOId].append(a)
+        self._annotations_changed()
+
+    def _annotations_changed(self):
         self.all_annotations = defaultdict(list)
+        self._term_gene_index = {}
 
         self._gene_names_dict = None
         self._gene_names = None
@@ -853,7 +1283,12 @@ class Annotations(object):
     @property
     def gene_names(self):
         if self._gene_names is None:
-            self._gene_names = set([ann.geneName for ann in self.annotations])
+            if self.columnar:
+                self._gene_names = set(
+                    self.gene_annotations.keys())
+            else:
+                self._gene_names = set([ann.geneName
+                                        for ann in self.annotations])
         return self._gene_names
 
     @property
@@ -914,6 +1349,8 @@ class Annotations(object):
         """
         self._ensure_ontology()
         id = self.ontology.alias_mapper.get(id, id)
+        if self.columnar:
+            return set(self.annotations.records(self._all_rows(id)))
         if id not in self.all_annotations or \
                 type(self.all_annotations[id]) == list:
             annot_set = set()
@@ -934,14 +1371,50 @@ class Annotations(object):
 
         """
         evidence_codes = set(evidence_codes or evidenceDict.keys())
+        if self.columnar:
+            self._ensure_ontology()
+            rows = self._all_rows(self.ontology.alias_mapper.get(id, id))
+            evidence = self.annotations.values("Evidence_Code", rows)
+            genes = self.annotations.values("DB_Object_Symbol", rows)
+            return list(set([gene for gene, code in zip(genes, evidence)
+                             if code in evidence_codes]))
         annotations = self.get_all_annotations(id)
         return list(set([ann.geneName for ann in annotations
                          if ann.Evidence_Code in evidence_codes]))
 
+    def _all_rows(self, id):
+        """ Return (and cache) an array of annotation table rows annotated
+        to GO term `id` or any of its sub terms (columnar mode only).
+        """
+        if id not in self.all_annotations:
+            terms = self.ontology.extract_sub_graph([id])
+            alt_ids = [alt_id for term in terms
+                       for alt_id in self.ontology.reverse_alias_mapper.get(
+                           term, ())]
+            rows = [self.annotations.rows("GO_ID", term)
+                    for term in terms.union(alt_ids)]
+            self.all_annotations[id] = numpy.unique(numpy.concatenate(rows))
+        return self.all_annotations[id]
+
+    def get_term_gene_index(self, evidence_codes=None, aspect=None):
+        """ Return a :class:`TermGeneIndex` of genes annotated to terms
+        (including their sub terms) with `evidence_codes` and `aspect`.
+        The index is cached until annotations or the ontology change.
+
+        """
+        evidence_codes = frozenset(evidence_codes or evidenceDict.keys())
+        aspects = frozenset(_aspects_set(aspect))
+        key = (evidence_codes, aspects)
+        if key not in self._term_gene_index:
+            self._ensure_ontology()
+            self._term_gene_index[key] = TermGeneIndex(
+                self, self.ontology, evidence_codes, aspects)
+        return self._term_gene_index[key]
+
     def get_enriched_terms(self, genes, reference=None, evidence_codes=None,
                            slims_only=False, aspect=None,
                            prob=stats.Binomial(), use_fdr=True,
-                           progress_callback=None):
+                           progress_callback=None, use_index=True):
         """ Return a dictionary of enriched terms, with tuples of
         (list_of_genes, p_value, reference_count) for items and term
         ids as keys. P-Values are FDR adjusted if use_fdr is True (default).
@@ -955,6 +1428,10 @@ class Annotations(object):
         :param aspect:
             Which aspects to use. Use all by default. "P", "F", "C"
             or a set containing these elements.
+        :param use_index:
+            If `True` (default) count genes with a precomputed
+            :class:`TermGeneIndex` (see :func:`get_term_gene_index`),
+            otherwise intersect annotation sets of each term.
 
         """
         revGenesDict = self.get_gene_names_translator(genes)
@@ -965,14 +1442,81 @@ class Annotations(object):
         else:
             reference = self.gene_names
 
-        if aspect == None:
-            aspects_set = set(["P", "C", "F"])
-        elif isinstance(aspect, basestring):
-            aspects_set = set([aspect])
+        aspects_set = _aspects_set(aspect)
+        evidence_codes = set(evidence_codes or evidenceDict.keys())
+
+        self._ensure_ontology()
+        if slims_only and not self.ontology.slims_subset:
+            warnings.warn("Unspecified slims subset in the ontology! "
+                          "Using 'goslim_generic' subset", UserWarning)
+            self.ontology.set_slims_subset("goslim_generic")
+
+        if use_index:
+            res = self._enriched_terms_indexed(
+                genes, reference, revGenesDict, evidence_codes, aspects_set,
+                slims_only, prob, progress_callback)
         else:
-            aspects_set = aspect
+            res = self._enriched_terms_by_annotations(
+                genes, reference, revGenesDict, evidence_codes, aspects_set,
+                slims_only, prob, progress_callback)
 
-        evidence_codes = set(evidence_codes or evidenceDict.keys())
+        if use_fdr:
+            res = sorted(res.items(), key=lambda x: x[1][1])
+            res = dict([(id, (genes, p, ref))
+                        for (id, (genes, _, ref)), p in
+                        zip(res, stats.FDR([p for _, (_, p, _) in res]))])
+        return res
+
+    def _enriched_terms_indexed(self, genes, reference, revGenesDict,
+                                evidence_codes, aspects_set, slims_only,
+                                prob, progress_callback=None):
+        if progress_callback:
+            progress_callback(0.0)
+        index = self.get_term_gene_index(evidence_codes, aspects_set)
+        query = index.gene_mask(genes)
+        refmask = index.gene_mask(reference)
+        mapped = query & refmask
+
+        termDiff = [term for term, term_genes in index.missing_terms.items()
+                    if query[list(term_genes)].any()]
+        if termDiff:
+            warnings.warn("%s terms in the annotations were not found in the "
+                          "ontology." % ",".join(map(repr, termDiff)),
+                          UserWarning)
+
+        # terms annotated by any of the query genes
+        terms = numpy.flatnonzero(index.counts(query))
+        if slims_only:
+            terms = [t for t in terms
+                     if index.terms[t] in self.ontology.slims_subset]
+
+        terms = numpy.asarray(terms, dtype=int)
+        mapped_counts = index.counts(mapped)[terms]
+        ref_counts = index.counts(refmask)[terms]
+
+        if hasattr(prob, "p_values"):
+            p_values = prob.p_values(mapped_counts, len(reference),
+                                     ref_counts, len(genes))
+        else:
+            p_values = [prob.p_value(int(k), len(reference), int(m),
+                                     len(genes))
+                        for k, m in zip(mapped_counts, ref_counts)]
+
+        res = {}
+        for t, p, ref_count in zip(terms, p_values, ref_counts):
+            term_genes = index.indices[index.indptr[t]:index.indptr[t + 1]]
+            term_genes = term_genes[mapped[term_genes]]
+            res[index.terms[t]] = (
+                [revGenesDict[index.genes[g]] for g in term_genes],
+                float(p), int(ref_count))
+        if progress_callback:
+            progress_callback(100.0)
+        return res
+
+    def _enriched_terms_by_annotations(self, genes, reference, revGenesDict,
+                                       evidence_codes, aspects_set,
+                                       slims_only, prob,
+                                       progress_callback=None):
         annotations = [ann
                        for gene in genes for ann in self.gene_annotations[gene]
                        if ann.Evidence_Code in evidence_codes and
@@ -989,12 +1533,6 @@ class Annotations(object):
         for ann in annotations:
             annotationsDict[ann.GO_ID].add(ann)
 
-        self._ensure_ontology()
-        if slims_only and not self.ontology.slims_subset:
-            warnings.warn("Unspecified slims subset in the ontology! "
-                          "Using 'goslim_generic' subset", UserWarning)
-            self.ontology.set_slims_subset("goslim_generic")
-
         terms = annotationsDict.keys()
         filteredTerms = [term for term in terms if term in self.ontology]
 
@@ -1026,11 +1564,6 @@ class Annotations(object):
                          len(mappedReferenceGenes))
             if progress_callback and i in milestones:
                 progress_callback(100.0 * i / len(terms))
-        if use_fdr:
-            res = sorted(res.items(), key=lambda x: x[1][1])
-            res = dict([(id, (genes, p, ref))
-                        for (id, (genes, _, ref)), p in
-                        zip(res, stats.FDR([p for _, (_, p, _) in res]))])
         return res
 
     def get_annotated_terms(self, genes, direct_annotation_only=False,
@@ -1116,7 +1649,7 @@ class Annotations(object):
         return self.annotations[index]
 
     def __getslice__(self, *args):
-        return self.annotations.__getslice__(*args)
+        return self.annotations[slice(*args)]
 
     def add(self, line):
         """ Add one annotation
@@ -1,8 +1,12 @@
 from __future__ import absolute_import
 
 from collections import defaultdict
+import os
 import random
+import shutil
+import tempfile
 import time
+import warnings
 
 import numpy
 
@@ -69,7 +73,7 @@ def enrichmentScoreRanked(subset, lcor, ordered, p=1.0, rev2=None):
 
     subset = set(subset)
 
-    if rev2 == None:
+    if rev2 is None:
         def rev(l):
             return numpy.argsort(l)
         rev2 = rev(ordered)
@@ -140,6 +144,225 @@ def enrichmentScoreRanked(subset, lcor, ordered, p=1.0, rev2=None):
     """
     return (maxSum if abs(maxSum) > abs(minSum) else minSum, [])
 
+def subsetsMembership(subsets):
+    """
+    Return gene set membership in a compressed sparse row format: a pair
+    of integer arrays (indptr, indices), where genes of the i-th subset
+    are indices[indptr[i]:indptr[i+1]]. Repeated genes are removed.
+    """
+    genes = [ sorted(set(subset)) for subset in subsets ]
+    sizes = [ len(g) for g in genes ]
+    indptr = numpy.zeros(len(genes)+1, dtype=int)
+    indptr[1:] = numpy.cumsum(sizes)
+    indices = numpy.array([ i for g in genes for i in g ], dtype=int)
+    return indptr, indices
+
+def enrichmentScoresBatch(membership, rankings, p=1.0, block=2**21):
+    """
+    Vectorized enrichmentScoreRanked for multiple subsets and rankings.
+
+    membership: gene set membership as returned by subsetsMembership.
+    rankings: a matrix of correlations with class, one ranking per row.
+    block: maximum number of (ranking, gene in subset) pairs processed
+        at once; bounds memory use.
+
+    Returns a (subsets x rankings) matrix of enrichment scores.
+
+    Running sums are only evaluated on the positions of the subset genes
+    in the ordering, which keeps the cost proportional to the total size
+    of the subsets and not to the number of all genes.
+    """
+    indptr, indices = membership
+    rankings = numpy.atleast_2d(numpy.asarray(rankings, dtype=float))
+    nrank, ngenes = rankings.shape
+    sizes = numpy.diff(indptr)
+
+    es = numpy.zeros((len(sizes), nrank))
+
+    #empty subsets do not have any elements in indices, so the
+    #remaining subsets' segments are still contiguous
+    nonempty = numpy.flatnonzero(sizes)
+    if len(indices) == 0:
+        return es
+    starts = indptr[nonempty]
+    sizesne = sizes[nonempty]
+    setind = numpy.repeat(numpy.arange(len(nonempty)), sizesne)
+    #index of a gene within its subset
+    within = numpy.arange(len(indices)) - numpy.repeat(starts, sizesne)
+
+    with numpy.errstate(divide="ignore"):
+        notInA = numpy.where(ngenes > sizesne,
+            -1. / (ngenes - sizesne), 0.0)
+    notInAe = notInA[setind]
+    #running sum after the last gene
+    endSum = 1. + notInA*(ngenes - sizesne)
+
+    step = max(1, block // len(indices))
+
+    for b in range(0, nrank, step):
+        r = rankings[b:b+step]
+        rows = numpy.arange(len(r))[:, None]
+
+        #positions in the descending order; stable as orderedPointersCorr
+        ordered = numpy.argsort(-r, axis=1, kind="mergesort")
+        rev = numpy.empty_like(ordered)
+        rev[rows, ordered] = numpy.arange(ngenes)
+
+        #order subset genes by their position, subset by subset
+        pos = rev[:, indices]
+        srt = numpy.argsort(setind*ngenes + pos, axis=1, kind="mergesort")
+        pos = pos[rows, srt]
+        w = numpy.abs(r[rows, indices[srt]])**p
+
+        sumw = numpy.add.reduceat(w, starts, axis=1)
+        cumw = numpy.cumsum(w, axis=1)
+        base = cumw[:, starts] - w[:, starts]
+        cumw -= numpy.repeat(base, sizesne, axis=1)
+
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            inAb = numpy.repeat(1. / sumw, sizesne, axis=1)
+        misses = notInAe*(pos - within)
+        after = cumw*inAb + misses
+        before = (cumw - w)*inAb + misses
+
+        maxSum = numpy.maximum(numpy.maximum.reduceat(after, starts, axis=1), 0)
+        minSum = numpy.minimum(numpy.minimum.reduceat(before, starts, axis=1), 0)
+        minSum = numpy.minimum(minSum, endSum)
+
+        bes = numpy.where(numpy.abs(maxSum) > numpy.abs(minSum), maxSum, minSum)
+        bes[sumw == 0.0] = 0.0 #as in enrichmentScoreRanked
+        es[nonempty, b:b+step] = bes.T
+
+    return es
+
+def enrichmentNullsBatch(permutedRanking, permutations, membership,
+        callback=None, block=2**21):
+    """
+    Enrichment scores of subsets on permuted rankings, computed
+    in blocks with enrichmentScoresBatch. permutedRanking(i) returns
+    the ranking for the i-th permutation from permutations.
+    The callback is run once per permutation.
+
+    Returns a (subsets x permutations) matrix.
+    """
+    permutations = list(permutations)
+    nnz = max(1, len(membership[1]))
+    step = max(1, block // nnz)
+    nulls = numpy.zeros((len(membership[0])-1, len(permutations)))
+    for b in range(0, len(permutations), step):
+        perms = permutations[b:b+step]
+        r2 = [ permutedRanking(i) for i in perms ]
+        nulls[:, b:b+len(r2)] = enrichmentScoresBatch(membership, r2,
+            block=block)
+        for i in perms:
+            runOptCallbacks(callback)
+    return nulls
+
+def signalToNoiseMatrix(X, y):
+    """
+    MA_signalToNoise for all columns of X at once. Compares rows
+    with class 0 to rows with class 1 of y. Unknown values in X are nan.
+    """
+    stats = []
+    for c in (0, 1):
+        Xc = X[y == c]
+        cnt = (~numpy.isnan(Xc)).sum(axis=0)
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            m = numpy.nansum(Xc, axis=0) / cnt
+            std = numpy.sqrt(numpy.nansum((Xc - m)**2, axis=0) / (cnt - 1))
+        #return minmally 0.2*|mi|, where mi=0 is adjusted to mi=1
+        std = numpy.maximum(std, 0.2*numpy.abs(numpy.where(m == 0, 1.0, m)))
+        stats.append((m, std))
+    (ma, sa), (mb, sb) = stats
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        return (ma - mb) / (sa + sb)
+
+def permutationSeed(i):
+    """
+    Seed of the random generator for the i-th permutation. Permutations
+    do not depend on each other, so they can be computed in any order.
+    """
+    return 2000+i
+
+def shuffledClassOrder(n, i):
+    """
+    Return new positions of n class values in the i-th permutation
+    (as in shuffleClass).
+    """
+    locations = list(range(n))
+    random.Random(permutationSeed(i)).shuffle(locations)
+    return locations
+
+def _permutationNullsChunk(args):
+    """
+    Compute enrichment nulls for a chunk of permutations in a worker
+    process. The shared matrix is opened as a read only memory map.
+    """
+    path, labels, membership, permutations = args
+    shared = numpy.load(path, mmap_mode="r")
+    if labels is None: #gene permutation of a single ranking
+        rankings = list(shared)
+        def permutedRanking(i):
+            return shuffleList(rankings, random.Random(permutationSeed(i)))
+    else:
+        def permutedRanking(i):
+            y2 = numpy.empty_like(labels)
+            y2[shuffledClassOrder(len(labels), i)] = labels
+            return signalToNoiseMatrix(shared, y2)
+    return enrichmentNullsBatch(permutedRanking, permutations, membership)
+
+def enrichmentNullsParallel(shared, labels, n, membership, n_jobs=None,
+        callback=None):
+    """
+    Enrichment scores of subsets on n permutations computed in a
+    pool of n_jobs processes (all processors if None).
+
+    If labels are None, shared is a ranking and genes are permuted.
+    Otherwise shared is an examples x genes expression matrix (unknown
+    values are nan), labels are class indices (0 or 1) of the examples,
+    classes are permuted and genes are ranked with signalToNoiseMatrix.
+
+    The shared matrix is written once to a temporary file that workers
+    memory map, so it is not pickled for every task. Each permutation
+    uses its own seed and results are placed by permutation index, so
+    they do not depend on the number of workers. The callback is run
+    once per permutation whenever a chunk finishes.
+
+    Returns a (subsets x n) matrix.
+    """
+    import concurrent.futures
+
+    if n_jobs is None or n_jobs <= 0:
+        import multiprocessing
+        n_jobs = multiprocessing.cpu_count()
+
+    nulls = numpy.zeros((len(membership[0])-1, n))
+    if n == 0:
+        return nulls
+
+    #a few chunks per worker to balance the load and report progress
+    nchunks = min(n, n_jobs*4)
+    bounds = [ (n*c)//nchunks for c in range(nchunks+1) ]
+
+    tmpdir = tempfile.mkdtemp(prefix="gsea")
+    try:
+        path = os.path.join(tmpdir, "shared.npy")
+        numpy.save(path, numpy.asarray(shared, dtype=float))
+        with concurrent.futures.ProcessPoolExecutor(n_jobs) as executor:
+            futures = {}
+            for a, b in zip(bounds, bounds[1:]):
+                f = executor.submit(_permutationNullsChunk,
+                    (path, labels, membership, range(a, b)))
+                futures[f] = (a, b)
+            for f in concurrent.futures.as_completed(futures):
+                a, b = futures[f]
+                nulls[:, a:b] = f.result()
+                for i in range(a, b):
+                    runOptCallbacks(callback)
+    finally:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+    return nulls
+
 #from mOrngData
 def shuffleAttribute(data, attribute, locations):
     """
@@ -160,7 +383,7 @@ def shuffleClass(datai, rands=0):
     def shuffleOne(data):
         rand = random.Random(rands)
         d2 = orange.ExampleTable(data.domain, data)
-        locations = range(len(data))
+        locations = list(range(len(data)))
         rand.shuffle(locations)
         shuffleAttribute(d2, d2.domain.classVar, locations)
         return d2
@@ -217,7 +440,7 @@ def enrichmentScore(data, subset, rankingf):
     return es,l
 
 def gseaE(data, subsets, rankingf=None, \
-        n=100, permutation="class", callback=None):
+        n=100, permutation="class", callback=None, engine="python", n_jobs=1):
     """
     Run GSEA algorithm on an example table.
 
@@ -228,9 +451,19 @@ def gseaE(data, subsets, rankingf=None, \
     n: number of random permutations to sample null distribution.
     permutation: "class" for permutating class, else permutate attribute 
         order.
+    engine: "python" scores subsets one by one, "numpy" scores all 
+        subsets on blocks of permutations at once. With the default
+        ranking, the "numpy" engine ranks genes on class permutations
+        with signalToNoiseMatrix.
+    n_jobs: number of processes for permutations (None for all 
+        processors). Implies the "numpy" engine if not 1. Class 
+        permutations run in processes only with the default ranking
+        of a single data set, otherwise they run in this process (with
+        a warning).
 
     """
 
+    defaultRanking = not rankingf
     if not rankingf:
         rankingf=rankingFromOrangeMeas(MA_signalToNoise())
 
@@ -239,6 +472,31 @@ def gseaE(data, subsets, rankingf=None, \
     lcor = rankingf(data)
     #print lcor
 
+    if engine == "numpy" or n_jobs != 1:
+        if permutation != "class":
+            shared = (lcor, None)
+            def permutedRanking(i):
+                return shuffleList(lcor, random.Random(permutationSeed(i)))
+        elif defaultRanking and iset(data):
+            #rank as the worker processes do, so that the results do
+            #not depend on n_jobs
+            X, y = data.toNumpyMA("A/C")
+            shared = (X.filled(numpy.nan), y.filled(-1))
+            def permutedRanking(i):
+                y2 = numpy.empty_like(shared[1])
+                y2[shuffledClassOrder(len(y2), i)] = shared[1]
+                return signalToNoiseMatrix(shared[0], y2)
+        else:
+            shared = None
+            if n_jobs != 1:
+                warnings.warn("Class permutations run in a single process "
+                    "with a custom ranking function or multiple data sets.",
+                    UserWarning)
+            def permutedRanking(i):
+                return rankingf(shuffleClass(data, permutationSeed(i))) #fixed permutation
+        return gseaBatch(lcor, subsets, n, permutedRanking, callback=callback,
+            shared=shared, n_jobs=n_jobs)
+
     ordered = orderedPointersCorr(lcor)
 
     def rev(l):
@@ -259,10 +517,10 @@ def gseaE(data, subsets, rankingf=None, \
     for i in range(n):
 
         if permutation == "class":
-            d2 = shuffleClass(data, 2000+i) #fixed permutation
+            d2 = shuffleClass(data, permutationSeed(i)) #fixed permutation
             r2 = rankingf(d2)
         else:
-            r2 = shuffleList(lcor, random.Random(2000+i))
+            r2 = shuffleList(lcor, random.Random(permutationSeed(i)))
 
         ordered2 = orderedPointersCorr(r2)
         rev22 = rev(ordered2)
@@ -282,9 +540,18 @@ def runOptCallbacks(callback):
         except:
             callback()            
 
-def gseaR(rankings, subsets, n, callback=None):
+def gseaR(rankings, subsets, n, callback=None, engine="python", n_jobs=1):
     """
+    Run GSEA algorithm on precomputed rankings (correlations with class)
+    by permutating gene order. See gseaE for the engine and n_jobs
+    parameters.
     """
+    if engine == "numpy" or n_jobs != 1:
+        def permutedRanking(i):
+            return shuffleList(rankings, random.Random(permutationSeed(i)))
+        return gseaBatch(rankings, subsets, n, permutedRanking, callback=callback,
+            shared=(rankings, None), n_jobs=n_jobs)
+
     enrichmentScores = []
     ordered = orderedPointersCorr(rankings)
     
@@ -304,7 +571,7 @@ def gseaR(rankings, subsets, n, callback=None):
 
     for i in range(n):
         
-        r2 = shuffleList(rankings, random.Random(2000+i))
+        r2 = shuffleList(rankings, random.Random(permutationSeed(i)))
         ordered2 = orderedPointersCorr(r2)
         rev22 = rev(ordered2)
 
@@ -318,6 +585,25 @@ def gseaR(rankings, subsets, n, callback=None):
     return gseaSignificance(enrichmentScores, enrichmentNulls)
 
 
+def gseaBatch(rankings, subsets, n, permutedRanking, callback=None,
+        shared=None, n_jobs=1):
+    """
+    GSEA with the vectorized engine. permutedRanking(i) returns the
+    ranking for the i-th permutation. If n_jobs is not 1 and shared
+    is given, it is a (matrix, labels) pair for enrichmentNullsParallel.
+    """
+    membership = subsetsMembership(subsets)
+    enrichmentScores = enrichmentScoresBatch(membership, [rankings])[:,0]
+    runOptCallbacks(callback)
+    if n_jobs != 1 and shared is not None:
+        enrichmentNulls = enrichmentNullsParallel(shared[0], shared[1], n,
+            membership, n_jobs=n_jobs, callback=callback)
+    else:
+        enrichmentNulls = enrichmentNullsBatch(permutedRanking, range(n),
+            membership, callback=callback)
+    return gseaSignificance(enrichmentScores.tolist(),
+        enrichmentNulls.tolist())
+
 def gseaSignificance(enrichmentScores, enrichmentNulls):
 
     #print enrichmentScores
@@ -930,7 +1216,7 @@ class GSEA(object):
         """
         return dict( (gs, self.genesIndices(nth(self.genesets[gs],1))) for gs in gsets)
 
-    def compute(self, minSize=3, maxSize=1000, minPart=0.1, n=100, callback=None, rankingf=None, permutation="class"):
+    def compute(self, minSize=3, maxSize=1000, minPart=0.1, n=100, callback=None, rankingf=None, permutation="class", engine="python", n_jobs=1):
 
         subsetsok = self.selectGenesets(minSize=minSize, maxSize=maxSize, minPart=minPart)
 
@@ -944,10 +1230,10 @@ class GSEA(object):
             return {} # quick return if no genesets
 
         if len(itOrFirst(self.data)) > 1:
-            gseal = gseaE(self.data, nth(gsetsnumit,1), n=n, callback=callback, permutation=permutation, rankingf=rankingf)
+            gseal = gseaE(self.data, nth(gsetsnumit,1), n=n, callback=callback, permutation=permutation, rankingf=rankingf, engine=engine, n_jobs=n_jobs)
         else:
             rankings = [ self.data[0][at].native() for at in self.data.domain.attributes ]
-            gseal = gseaR(rankings, nth(gsetsnumit,1), n, callback=None)
+            gseal = gseaR(rankings, nth(gsetsnumit,1), n, callback=None, engine=engine, n_jobs=n_jobs)
 
         res = {}
 
@@ -965,7 +1251,7 @@ class GSEA(object):
         return res
 
 def direct(data, gene_sets, matcher, min_size=3, max_size=1000, min_part=0.1,
-    gene_desc=None, n=100, callback=None):
+    gene_desc=None, n=100, callback=None, engine="python", n_jobs=1):
     """ Gene Set Enrichment analysis for pre-computed correlations
     between genes and phenotypes. 
     
@@ -980,11 +1266,13 @@ def direct(data, gene_sets, matcher, min_size=3, max_size=1000, min_part=0.1,
 
     assert len(data.domain.attributes) == 1 or len(data) == 1
     return runGSEA(data, geneSets=gene_sets, matcher=matcher, minSize=min_size, 
-        maxSize=max_size, minPart=min_part, n=n, geneVar=gene_desc, callback=callback)
+        maxSize=max_size, minPart=min_part, n=n, geneVar=gene_desc, callback=callback,
+        engine=engine, n_jobs=n_jobs)
 
 def run(data, gene_sets, matcher, min_size=3, max_size=1000, min_part=0.1,
     at_least=3, phenotypes=None, gene_desc=None, phen_desc=None, n=100, 
-    permutation="phenotype", callback=None, rankingf=None):
+    permutation="phenotype", callback=None, rankingf=None, engine="python",
+    n_jobs=1):
     """ Run Gene Set Enrichment Analysis.
 
     :param Orange.data.Table data: Gene expression data.  
@@ -997,6 +1285,12 @@ def run(data, gene_sets, matcher, min_size=3, max_size=1000, min_part=0.1,
     :param n: Number of permutations for significance computation. Default: 100.
     :param str permutation: Permutation type, "phenotype" (default) for 
         phenotypes, "gene" for genes.
+    :param str engine: "python" (default) scores gene sets one at a time,
+        "numpy" scores all gene sets on blocks of permutations at once,
+        which is much faster for many gene sets or permutations.
+    :param int n_jobs: Number of processes that compute permutations
+        (None for all processors). Results do not depend on it. Values
+        other than 1 imply the "numpy" engine. Default: 1.
     :param int min_size:
     :param int max_size: Minimum and maximum allowed number of genes from
         gene set also the data set. Defaults: 3 and 1000.
@@ -1033,19 +1327,19 @@ def run(data, gene_sets, matcher, min_size=3, max_size=1000, min_part=0.1,
     return runGSEA(data, geneSets=gene_sets, matcher=matcher, minSize=min_size, 
         maxSize=max_size, minPart=min_part, n=n, permutation=permutation, 
         geneVar=gene_desc, callback=callback, phenVar=phen_desc, 
-        classValues=phenotypes)
+        classValues=phenotypes, engine=engine, n_jobs=n_jobs)
 
 def runGSEA(data, organism=None, classValues=None, geneSets=None, n=100, 
         permutation="class", minSize=3, maxSize=1000, minPart=0.1, atLeast=3, 
         matcher=None, geneVar=None, phenVar=None, caseSensitive=False, 
-        rankingf=None, callback=None):
+        rankingf=None, callback=None, engine="python", n_jobs=1):
     gso = GSEA(data, organism=organism, matcher=matcher, 
         classValues=classValues, atLeast=atLeast, caseSensitive=caseSensitive,
         geneVar=geneVar, phenVar=phenVar)
     gso.addGenesets(geneSets)
     res1 = gso.compute(n=n, permutation=permutation, minSize=minSize,
         maxSize=maxSize, minPart=minPart, rankingf=rankingf,
-        callback=callback)
+        callback=callback, engine=engine, n_jobs=n_jobs)
     return res1
 
 def etForAttribute(datal,a):
@@ -62,8 +62,9 @@ from itertools import chain
 from datetime import datetime
 from contextlib import contextmanager
 
+import numpy
+
 from orangecontrib.bio import utils, taxonomy
-from orangecontrib.bio.utils import progress_bar_milestones
 from orangecontrib.bio.kegg import databases
 from orangecontrib.bio.kegg import entry
 
@@ -90,6 +91,121 @@ KEGGPathway = pathway.Pathway
 DEFAULT_CACHE_DIR = conf.params["cache.path"]
 
 
+class PathwayGeneIndex(object):
+    """
+    An index of the genes in the pathways of an organism built from
+    KEGG ``link`` data (a list of (gene_id, pathway_id) pairs, as returned
+    by :func:`api.KeggApi.get_genes_pathway_organism`).
+
+    Genes are numbered by their position in the sorted list of gene ids
+    (:obj:`genes`), and the genes of each pathway are stored as a sorted
+    integer array in a compressed sparse row layout (:obj:`indptr`,
+    :obj:`indices`), so that the genes of ``pathways[i]`` are
+    ``indices[indptr[i]:indptr[i + 1]]``.
+
+    Use :func:`Organism.pathway_gene_index` to get the (cached) index
+    for an organism.
+
+    """
+    def __init__(self, links):
+        by_pathway = defaultdict(set)
+        for gene, pathway_id in links:
+            by_pathway[pathway_id].add(gene)
+
+        #: A sorted list of gene ids.
+        self.genes = sorted(set(chain(*by_pathway.values())))
+        #: A dictionary mapping gene ids to their indices.
+        self.gene_index = dict((g, i) for i, g in enumerate(self.genes))
+        #: A sorted list of pathway ids.
+        self.pathways = sorted(by_pathway)
+        #: A dictionary mapping pathway ids to their indices.
+        self.pathway_index = dict((p, i) for i, p in enumerate(self.pathways))
+
+        sizes = [len(by_pathway[p]) for p in self.pathways]
+        self.indptr = numpy.zeros(len(self.pathways) + 1, dtype=int)
+        self.indptr[1:] = numpy.cumsum(sizes)
+        self.indices = numpy.fromiter(
+            (self.gene_index[g] for p in self.pathways
+             for g in sorted(by_pathway[p])),
+            dtype=int, count=self.indptr[-1])
+        #: Pathway index of each element of indices.
+        self.pathway_of = numpy.repeat(numpy.arange(len(self.pathways)),
+                                       sizes)
+
+        gene_pathways = defaultdict(list)
+        for p, g in zip(self.pathway_of, self.indices):
+            gene_pathways[self.genes[g]].append(self.pathways[p])
+        #: A dictionary mapping gene ids to sorted lists of pathway ids.
+        self.gene_pathways = dict(gene_pathways)
+
+    def gene_mask(self, genes):
+        """
+        Return a boolean array over all indexed genes marking `genes`
+        (gene ids not in the index are ignored).
+        """
+        mask = numpy.zeros(len(self.genes), dtype=bool)
+        mask[[self.gene_index[g] for g in genes
+              if g in self.gene_index]] = True
+        return mask
+
+    def pathway_genes(self, pathway_id):
+        """
+        Return the gene indices of `pathway_id`.
+        """
+        i = self.pathway_index[pathway_id]
+        return self.indices[self.indptr[i]:self.indptr[i + 1]]
+
+    def counts(self, mask):
+        """
+        Return the number of genes in `mask` in each pathway.
+        """
+        return numpy.bincount(self.pathway_of, weights=mask[self.indices],
+                              minlength=len(self.pathways)).astype(int)
+
+    def pathways_by_genes(self, genes):
+        """
+        Return a sorted list of pathways that include all `genes`.
+        """
+        genes = set(genes)
+        if not genes:
+            return []
+        pathways = [set(self.gene_pathways.get(g, [])) for g in genes]
+        return sorted(reduce(set.intersection, pathways))
+
+    def enriched_pathways(self, genes, reference, prob=utils.stats.Binomial()):
+        """
+        Return a dictionary with pathways containing any of the `genes` as
+        keys and (list_of_genes, p_value, num_of_reference_genes) tuples
+        as items (see :func:`Organism.get_enriched_pathways`).
+        """
+        genes = list(genes)
+        reference = set(reference)
+        query = self.gene_mask(genes)
+        refmask = self.gene_mask(reference)
+
+        counts = self.counts(query)
+        pathways = numpy.flatnonzero(counts)
+        counts = counts[pathways]
+        ref_counts = self.counts(refmask)[pathways]
+
+        if hasattr(prob, "p_values"):
+            p_values = prob.p_values(counts, len(reference), ref_counts,
+                                     len(genes))
+        else:
+            p_values = [prob.p_value(int(k), len(reference), int(m),
+                                     len(genes))
+                        for k, m in zip(counts, ref_counts)]
+
+        res = {}
+        for p, p_value, ref_count in zip(pathways, p_values, ref_counts):
+            pathway_genes = self.indices[self.indptr[p]:self.indptr[p + 1]]
+            pathway_genes = pathway_genes[query[pathway_genes]]
+            res[self.pathways[p]] = (
+                [self.genes[g] for g in pathway_genes],
+                float(p_value), int(ref_count))
+        return res
+
+
 class Organism(object):
     """
     A convenience class for retrieving information regarding an
@@ -165,10 +281,24 @@ class Organism(object):
         Return a list of all pathways for this organism.
         """
         if with_ids is not None:
-            return self.api.get_pathways_by_genes(with_ids)
+            return self.get_pathways_by_genes(with_ids)
         else:
             return [p.entry_id for p in self.api.list_pathways(self.org_code)]
 
+    def pathway_gene_index(self):
+        """
+        Return a :class:`PathwayGeneIndex` of the genes in the pathways
+        of this organism. The index is built once per organism (and
+        process) from the KEGG link data.
+        """
+        with _pathway_gene_indices_lock:
+            index = _pathway_gene_indices.get(self.org_code)
+            if index is None:
+                links = self.api.get_genes_pathway_organism(self.org_code)
+                index = PathwayGeneIndex(links)
+                _pathway_gene_indices[self.org_code] = index
+        return index
+
     def list_pathways(self):
         """
         List all pathways for this organism.
@@ -196,37 +326,14 @@ class Organism(object):
         """
         if reference is None:
             reference = self.genes.keys()
-        reference = set(reference)
 
-        allPathways = defaultdict(lambda: [[], 1.0, []])
-        milestones = progress_bar_milestones(len(genes), 100)
-        pathways_db = KEGGPathways()
-
-        pathways_for_gene = []
-        for i, gene in enumerate(genes):
-            pathways_for_gene.append(self.pathways([gene]))
-            if callback and i in milestones:
-                callback(i * 50.0 / len(genes))
-
-        # pre-cache for speed
-        pathways_db.pre_cache([pid for pfg in pathways_for_gene
-                               for pid in pfg])
-        for i, (gene, pathways) in enumerate(zip(genes, pathways_for_gene)):
-            for pathway in pathways:
-                if pathways_db.get_entry(pathway).gene:
-                    allPathways[pathway][0].append(gene)
-            if callback and i in milestones:
-                callback(50.0 + i * 50.0 / len(genes))
-
-        pItems = allPathways.items()
-
-        for i, (p_id, entry) in enumerate(pItems):
-            pathway = pathways_db.get_entry(p_id)
-            entry[2].extend(reference.intersection(pathway.gene or []))
-            entry[1] = prob.p_value(len(entry[0]), len(reference),
-                                    len(entry[2]), len(genes))
-        return dict([(pid, (genes, p, len(ref)))
-                     for pid, (genes, p, ref) in allPathways.items()])
+        index = self.pathway_gene_index()
+        if callback:
+            callback(50.0)
+        res = index.enriched_pathways(genes, reference, prob)
+        if callback:
+            callback(100.0)
+        return res
 
     def get_genes_by_enzyme(self, enzyme):
         enzyme = KEGGEnzyme().get_entry(enzyme)
@@ -243,14 +350,7 @@ class Organism(object):
 
     def get_pathways_by_genes(self, gene_ids):
         """ Pathways that include all genes in gene_ids. """
-        l = self.api.get_genes_pathway_organism(self.org_code)
-        gene_ids = set(gene_ids)
-        gtp = defaultdict(set)
-        for a,b in l:
-            gtp[a].add(b)
-        pathways = [ gtp[g] for g in gene_ids ]
-        pathways = reduce(set.intersection, pathways)
-        return sorted(pathways)
+        return self.pathway_gene_index().pathways_by_genes(gene_ids)
 
     def get_pathways_by_enzymes(self, enzyme_ids):
         enzyme_ids = set(enzyme_ids)
@@ -331,6 +431,9 @@ class Organism(object):
 
 KEGGOrganism = Organism
 
+_pathway_gene_indices = {}
+_pathway_gene_indices_lock = threading.Lock()
+
 
 def organism_name_search(name):
     """
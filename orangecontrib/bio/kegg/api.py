@@ -5,7 +5,6 @@ KEGG api interface.
 from __future__ import absolute_import
 
 from datetime import datetime
-from contextlib import closing
 from operator import itemgetter
 import warnings
 import six
@@ -44,8 +43,10 @@ class KeggApi(object):
     An abstraction of a rest KEGG API.
     """
 
-    def __init__(self):
-        self.service = web_service()
+    def __init__(self, service=None):
+        if service is None:
+            service = web_service()
+        self.service = service
 
     def list_organisms(self):
         """
@@ -339,9 +340,10 @@ KEGG api with caching
 """
 
 import os
+import threading
 
 from . import caching
-from .caching import cached_method, cache_entry, touch_dir
+from .caching import cached_method, cache_entry
 
 try:
     from functools import lru_cache
@@ -351,9 +353,43 @@ except ImportError:
     from Orange.utils import lru_cache
 
 
+# Open mirrors (by filename)
+_mirrors = {}
+_mirrors_lock = threading.Lock()
+
+
+def _open_mirror(filename):
+    from .mirror import Mirror
+    filename = os.path.abspath(os.path.expanduser(filename))
+    with _mirrors_lock:
+        if filename not in _mirrors:
+            _mirrors[filename] = Mirror(filename)
+        return _mirrors[filename]
+
+
 class CachedKeggApi(KeggApi):
-    def __init__(self, store=None):
-        KeggApi.__init__(self)
+    """
+    A KEGG api with persistently cached responses.
+
+    :param str mirror:
+        A path to a local KEGG mirror snapshot (see :mod:`.mirror`) to
+        serve the requests from instead of the KEGG web service. By
+        default the ``service.mirror`` configuration option or the
+        ``KEGG_MIRROR`` environment variable is used. An empty string
+        disables the mirror.
+
+    """
+    def __init__(self, store=None, mirror=None):
+        if mirror is None:
+            from . import conf
+            mirror = os.environ.get("KEGG_MIRROR") or \
+                conf.params["service.mirror"]
+        service = None
+        if mirror:
+            from .mirror import MirrorService
+            service = MirrorService(_open_mirror(mirror))
+        KeggApi.__init__(self, service)
+        self.mirror = mirror or None
         if store is None:
             self.store = {}
 
@@ -361,15 +397,36 @@ class CachedKeggApi(KeggApi):
     def cache_store(self):
         from . import conf
         path = conf.params["cache.path"]
-        touch_dir(path)
-        return caching.Sqlite3Store(os.path.join(path,
-                                                 "kegg_api_cache_2.sqlite3"))
+        filename = os.path.join(path, "kegg_api_cache_2.sqlite3")
+        release = None
+        if not caching.has_shared_store(filename):
+            # query the release (possibly over the network) before the
+            # store is opened, without holding its lock
+            release = self.release()
+        return caching.shared_store(filename, release=release)
+
+    def release(self):
+        """
+        Return the current KEGG release string (or None if it can not
+        be retrieved). All cached entries of other releases are dropped
+        when the cache store is opened.
+        """
+        release = getattr(self, "default_release", None)
+        if release:
+            return release
+        try:
+            return KeggApi.info(self, "kegg").release
+        except Exception:
+            # offline, a service error or an unexpected response; the
+            # cache must stay usable
+            return None
 
     def last_modified(self, args, kwargs=None):
         return getattr(self, "default_release", "")
 
     def set_default_release(self, release):
         self.default_release = release
+        self.cache_store().set_release(release)
 
     @cached_method
     def list_organisms(self):
@@ -403,57 +460,61 @@ class CachedKeggApi(KeggApi):
             raise ValueError("Can batch at most 10 ids at a time.")
 
         get = self.get
-        uncached = []
-        unmatched = set()
+        store = get.store()
+        keys = [get.key_from_args((id,)) for id in ids]
 
-        with closing(get.cache_store()) as store:
-            # Which ids are already cached
-            # TODO: Invalidate entries by release string.
-            for id in ids:
-                key = get.key_from_args((id,))
-                if not get.key_has_valid_cache(key, store):
-                    uncached.append(id)
+        # Which ids are already cached
+        cached = dict((key, entry) for key, entry in
+                      store.get_many(set(keys)).items()
+                      if get.is_entry_valid(entry, None))
+        uncached = [id for id, key in zip(ids, keys) if key not in cached]
 
         if uncached:
-            # in case there are duplicate ids
-            uncached = sorted(set(uncached))
-
-            rval = KeggApi.get(self, uncached)
-
-            if rval is not None:
-                entries = rval.split("///\n")
-            else:
-                entries = []
-
-            if entries and not entries[-1].strip():
-                # Delete the last single newline entry if present
-                del entries[-1]
-
-            if len(entries) != len(uncached):
-                new_uncached, entries = match_by_ids(uncached, entries)
-                unmatched = set(uncached) - set(new_uncached)
-                uncached = new_uncached
-                warnings.warn("Unable to match entries for keys: %s." %
-                              ", ".join(map(repr, unmatched)))
-
-            with closing(get.cache_store()) as store:
-                for id, entry in zip(uncached, entries):
-                    key = get.key_from_args((id,))
-                    if entry is not None:
-                        entry = entry + "///\n"
-                    store[key] = cache_entry(entry, mtime=datetime.now())
+            mtime = datetime.now()
+            new = [(get.key_from_args((id,)), cache_entry(entry, mtime=mtime))
+                   for id, entry in self._fetch_entries(uncached)]
+            store.set_many(new)
+            cached.update(new)
 
         # Finally join all the results, but drop all None objects
-
-        with closing(get.cache_store()):
-            keys = [get.key_from_args((id,)) for id in ids]
-            entries = [store[key].value for key in keys]
-
+        entries = [cached[key].value for key in keys if key in cached]
         entries = filter(lambda e: e is not None, entries)
 
         rval = "".join(entries)
         return rval
 
+    def _fetch_entries(self, ids):
+        """
+        Retrieve the entries for `ids` (at most 10) from the KEGG service
+        (bypassing the cache). Return a list of (id, entry_text) pairs for
+        all ids matched to a returned entry.
+        """
+        if len(ids) > 10:
+            raise ValueError("Can batch at most 10 ids at a time.")
+
+        # in case there are duplicate ids
+        ids = sorted(set(ids))
+
+        rval = KeggApi.get(self, ids)
+
+        if rval is not None:
+            entries = rval.split("///\n")
+        else:
+            entries = []
+
+        if entries and not entries[-1].strip():
+            # Delete the last single newline entry if present
+            del entries[-1]
+
+        if len(entries) != len(ids):
+            matched, entries = match_by_ids(ids, entries)
+            unmatched = set(ids) - set(matched)
+            ids = matched
+            warnings.warn("Unable to match entries for keys: %s." %
+                          ", ".join(map(repr, unmatched)))
+
+        return [(id, entry + "///\n") for id, entry in zip(ids, entries)]
+
     @cached_method
     def conv(self, target_db, source):
         return KeggApi.conv(self, target_db, source)
@@ -4,22 +4,22 @@ Caching framework for cached kegg api calls.
 """
 import os
 import sqlite3
+import threading
 try:
     import cPickle as pickle
 except ImportError:
     import pickle
 
-from contextlib import closing
-
 from datetime import datetime, date, timedelta
 from . import conf
 
 import six
 
 try:
-    from UserDict import DictMixin
+    from collections.abc import MutableMapping
 except ImportError:
-    from collections import MutableMapping as DictMixin
+    from collections import MutableMapping
+
 
 class Store(object):
     def __init__(self):
@@ -34,88 +34,211 @@ class Store(object):
     def __exit__(self, *args):
         pass
 
+    def get_many(self, keys):
+        """
+        Return a dictionary with the values of all `keys` in the store.
+        """
+        values = {}
+        for key in keys:
+            try:
+                values[key] = self[key]
+            except KeyError:
+                pass
+        return values
+
+    def set_many(self, items):
+        """
+        Store all (key, value) pairs in `items`.
+        """
+        for key, value in items:
+            self[key] = value
+
+
+class Sqlite3Store(Store, MutableMapping):
+    """
+    A store of pickled values in an sqlite3 database.
+
+    Every entry is tagged with the store's :obj:`release` at the time it
+    was written; :func:`set_release` removes all entries of other
+    releases. The store keeps a single connection (in WAL mode) which
+    can be shared between threads.
 
-class Sqlite3Store(Store, DictMixin):
+    """
+    #: Max number of keys in a single query.
+    BATCH_SIZE = 500
 
-    def __init__(self, filename):
+    def __init__(self, filename, release=None):
+        Store.__init__(self)
         self.filename = filename
-        self.con = sqlite3.connect(filename)
-        self.con.execute("""
-            CREATE TABLE IF NOT EXISTS cache
-                (key TEXT UNIQUE,
-                 value TEXT
-                )
-        """)
-        self.con.execute("""
-            CREATE INDEX IF NOT EXISTS cache_index
-            ON cache (key)
-        """)
-        self.con.commit()
+        self.release = None
+        self._lock = threading.RLock()
+        self.con = sqlite3.connect(filename, timeout=30,
+                                   check_same_thread=False)
+        try:
+            self.con.execute("PRAGMA journal_mode=WAL")
+        except sqlite3.OperationalError:
+            pass
+        self.con.execute("PRAGMA synchronous=NORMAL")
+        with self.con:
+            columns = [row[1] for row in
+                       self.con.execute("PRAGMA table_info(cache)")]
+            if columns and "release" not in columns:
+                # a store written by a former version
+                self.con.execute("DROP TABLE cache")
+            self.con.execute("""
+                CREATE TABLE IF NOT EXISTS cache
+                    (key TEXT PRIMARY KEY,
+                     release TEXT,
+                     value BLOB
+                    )
+            """)
+            self.con.execute("""
+                CREATE TABLE IF NOT EXISTS meta
+                    (name TEXT PRIMARY KEY,
+                     value TEXT
+                    )
+            """)
+        if release is not None:
+            self.set_release(release)
+
+    def set_release(self, release):
+        """
+        Set the release string of new entries and remove all entries
+        written for a different release.
+        """
+        with self._lock, self.con:
+            cur = self.con.execute("""
+                SELECT value FROM meta WHERE name='release'
+            """)
+            row = cur.fetchone()
+            if row is None or row[0] != release:
+                self.con.execute("""
+                    DELETE FROM cache WHERE release IS NOT ?
+                """, (release,))
+                self.con.execute("""
+                    INSERT OR REPLACE INTO meta VALUES ('release', ?)
+                """, (release,))
+            self.release = release
+
+    @staticmethod
+    def _dumps(value):
+        return sqlite3.Binary(pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+
+    @staticmethod
+    def _loads(pickle_str):
+        if not six.PY3:
+            pickle_str = str(pickle_str)
+        return pickle.loads(pickle_str)
 
     def __getitem__(self, key):
-        cur = self.con.execute("""
-            SELECT value
-            FROM cache
-            WHERE key=?
-        """, (key,))
-        r = cur.fetchall()
+        with self._lock:
+            cur = self.con.execute("""
+                SELECT value
+                FROM cache
+                WHERE key=?
+            """, (key,))
+            r = cur.fetchall()
         if not r:
             raise KeyError(key)
         else:
-            pickle_str = r[0][0]
-            if not six.PY3:
-                pickle_str = str(pickle_str)
             try:
-                return pickle.loads(pickle_str)
+                return self._loads(r[0][0])
             except Exception:
                 raise KeyError(key)
 
+    def __contains__(self, key):
+        with self._lock:
+            cur = self.con.execute("""
+                SELECT 1 FROM cache WHERE key=?
+            """, (key,))
+            return cur.fetchone() is not None
+
     def __setitem__(self, key, value):
-        value = pickle.dumps(value)
-        self.con.execute("""
-            INSERT OR REPLACE INTO cache
-            VALUES (?, ?)
-        """, (key, value))
-        self.con.commit()
+        self.set_many([(key, value)])
 
     def __delitem__(self, key):
-        self.con.execute("""
-            DELETE FROM cache
-            WHERE key=?
-        """, (key,))
-        self.con.commit()
+        with self._lock, self.con:
+            self.con.execute("""
+                DELETE FROM cache
+                WHERE key=?
+            """, (key,))
+
+    def get_many(self, keys):
+        """
+        Return a dictionary with the values of all `keys` in the store.
+        """
+        keys = list(keys)
+        values = {}
+        for start in range(0, len(keys), self.BATCH_SIZE):
+            batch = keys[start:start + self.BATCH_SIZE]
+            with self._lock:
+                cur = self.con.execute("""
+                    SELECT key, value
+                    FROM cache
+                    WHERE key IN (%s)
+                """ % ", ".join("?" * len(batch)), batch)
+                rows = cur.fetchall()
+            for key, pickle_str in rows:
+                try:
+                    values[key] = self._loads(pickle_str)
+                except Exception:
+                    pass
+        return values
+
+    def set_many(self, items):
+        """
+        Store all (key, value) pairs in `items` in a single transaction.
+        """
+        rows = [(key, self.release, self._dumps(value))
+                for key, value in items]
+        with self._lock, self.con:
+            self.con.executemany("""
+                INSERT OR REPLACE INTO cache
+                VALUES (?, ?, ?)
+            """, rows)
 
     def keys(self):
-        cur = self.con.execute("""
-            SELECT key
-            FROM cache
-        """)
-        return [str(r[0]) for r in cur.fetchall()]
+        with self._lock:
+            cur = self.con.execute("""
+                SELECT key
+                FROM cache
+            """)
+            return [str(r[0]) for r in cur.fetchall()]
 
     def close(self):
+        # The connection is kept open for the lifetime of the store
         pass
 
     def __len__(self):
-        return None
+        with self._lock:
+            return self.con.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
 
     def __iter__(self):
-        return None
+        return iter(self.keys())
 
 
-
-class DictStore(Store, DictMixin):
+class DictStore(Store, MutableMapping):
     def __init__(self):
         Store.__init__(self)
+        self._data = {}
+
+    def __getitem__(self, key):
+        return self._data[key]
+
+    def __setitem__(self, key, value):
+        self._data[key] = value
+
+    def __delitem__(self, key):
+        del self._data[key]
 
     def close(self):
         pass
 
     def __len__(self):
-        return None
+        return len(self._data)
 
     def __iter__(self):
-        return None
-
+        return iter(self._data)
 
 
 class cache_entry(object):
@@ -138,10 +261,18 @@ class cached_wrapper(object):
         self.class_ = class_
         self.cache_store = cache_store
         self.last_modified = last_modified
+        self._store = None
+
+    def store(self):
+        """
+        Return the cache store (opened once per wrapper).
+        """
+        if self._store is None:
+            self._store = self.cache_store()
+        return self._store
 
     def has_key(self, key):
-        with closing(self.cache_store()) as store:
-            return key in store
+        return key in self.store()
 
     def key_from_args(self, args, kwargs=None):
         key = self.function.__name__ + repr(args)
@@ -150,8 +281,7 @@ class cached_wrapper(object):
         return key
 
     def invalidate_key(self, key):
-        with closing(self.cache_store()) as store:
-            del store[key]
+        del self.store()[key]
 
     def last_modified_from_args(self, args, kwargs=None):
         if self.instance is not None:
@@ -162,27 +292,26 @@ class cached_wrapper(object):
 
     def invalidate_all(self):
         prefix = self.key_from_args(()).rstrip(",)")
-        with self.cache_store() as store:
-            for key in store:
-                if key.startswith(prefix):
-                    del store[key]
+        store = self.store()
+        for key in list(store):
+            if key.startswith(prefix):
+                del store[key]
 
     def memoize(self, args, kwargs, value, timestamp=None):
         key = self.key_from_args(args, kwargs)
         if timestamp is None:
             timestamp = datetime.now()
 
-        with closing(self.cache_store()) as store:
-            store[key] = cache_entry(value, mtime=timestamp)
+        self.store()[key] = cache_entry(value, mtime=timestamp)
 
     def __call__(self, *args):
         key = self.key_from_args(args)
-        with closing(self.cache_store()) as store:
-            if self.key_has_valid_cache(key, store):
-                rval = store[key].value
-            else:
-                rval = self.function(self.instance, *args)
-                store[key] = cache_entry(rval, datetime.now(), None)
+        store = self.store()
+        if self.key_has_valid_cache(key, store):
+            rval = store[key].value
+        else:
+            rval = self.function(self.instance, *args)
+            store[key] = cache_entry(rval, datetime.now(), None)
 
         return rval
 
@@ -244,9 +373,9 @@ class cached_method(object):
     def get_cache_store(self, instance, owner):
         if hasattr(instance, "cache_store"):
             return instance.cache_store
-        elif not hasattr("_cached_method_cache"):
+        elif not hasattr(instance, "_cached_method_cache"):
             instance._cached_method_cache = DictStore()
-        return instance._cached_method_cache
+        return lambda: instance._cached_method_cache
 
 
 class bget_cached_method(cached_method):
@@ -268,6 +397,40 @@ def touch_dir(path):
         os.makedirs(path)
 
 
+_shared_stores = {}
+_shared_stores_lock = threading.Lock()
+
+
+def _store_path(filename):
+    return os.path.abspath(os.path.expanduser(filename))
+
+
+def has_shared_store(filename):
+    """
+    Is the shared :class:`Sqlite3Store` for `filename` already open?
+    """
+    with _shared_stores_lock:
+        return _store_path(filename) in _shared_stores
+
+
+def shared_store(filename, release=None):
+    """
+    Return a :class:`Sqlite3Store` for `filename` shared by all callers
+    (and threads) in this process.
+
+    The `release` is only used if the store is opened by this call (see
+    :class:`Sqlite3Store`).
+    """
+    filename = _store_path(filename)
+    with _shared_stores_lock:
+        store = _shared_stores.get(filename)
+        if store is None:
+            touch_dir(os.path.dirname(filename))
+            store = Sqlite3Store(filename, release=release)
+            _shared_stores[filename] = store
+    return store
+
+
 def clear_cache():
     """Clear all locally cached KEGG data.
     """
@@ -27,6 +27,8 @@ invalidate = weekly
 [service]
 transport = urllib2
 # transport = requests
+# path of a local KEGG mirror snapshot (see the mirror module)
+mirror =
 
 """
 
@@ -49,7 +51,8 @@ _ALL_PARAMS = [
     "cache.path",
     "cache.store",
     "cache.invalidate",
-    "service.transport"
+    "service.transport",
+    "service.mirror"
 ]
 
 for p in _ALL_PARAMS:
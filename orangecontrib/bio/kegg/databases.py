@@ -7,11 +7,14 @@ from __future__ import absolute_import
 
 import sys
 import re
-from contextlib import closing
+import time
+import threading
+from datetime import datetime
 
 from . import entry
 from .entry import fields
 from . import api
+from .caching import cache_entry
 
 
 def iter_take(source_iter, n):
@@ -41,6 +44,30 @@ def chain_iter(chains_iter):
             yield element
 
 
+class RateLimiter(object):
+    """
+    Limit the rate of some action (shared by all threads) to `rate`
+    per second (no limit if `rate` is ``None``).
+    """
+    def __init__(self, rate=None):
+        self.interval = 1.0 / rate if rate else 0.0
+        self._next = 0.0
+        self._lock = threading.Lock()
+
+    def wait(self):
+        """
+        Block until the action is allowed.
+        """
+        if not self.interval:
+            return
+        with self._lock:
+            now = time.time()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        if start > now:
+            time.sleep(start - now)
+
+
 # TODO: DBDataBase should be able to be constructed from a flat text
 # entry file. The precache etc. should be moved in caching api, that creates
 # simple file system hierarchy where the flat database is saved (with db
@@ -57,6 +84,9 @@ class DBDataBase(object):
     """
     Base class for a DBGET database interface.
 
+    :param api: A :class:`~.api.CachedKeggApi` instance used for the
+        requests (by default a new one).
+
     """
     #: ENTRY_TYPE constructor (a :class:`~.entry.DBEntry` subclass). This
     #: should be redefined in subclasses.
@@ -72,7 +102,7 @@ class DBDataBase(object):
             raise TypeError("Cannot make an instance of abstract base "
                             "class %r." % type(self).__name__)
 
-        self.api = api.CachedKeggApi()
+        self.api = kwargs.get("api") or api.CachedKeggApi()
         self._info = None
         #TODO invalidate cache by KEGG release
         #self.api.set_default_release(self.info.release)
@@ -204,13 +234,22 @@ class DBDataBase(object):
         res = self.api.find(self.DB, name).splitlines()
         return [r.split(" ", 1)[0] for r in res]
 
-    def pre_cache(self, keys=None, batch_size=10, progress_callback=None):
+    def pre_cache(self, keys=None, batch_size=10, progress_callback=None,
+                  max_workers=4, rate=3.0, retries=3):
         """
         Retrieve all the entries for `keys` and cache them locally for faster
         subsequent retrieval. If `keys` is ``None`` then all entries will be
         retrieved.
 
+        Batches of `batch_size` (at most 10) entries are retrieved by
+        `max_workers` threads in parallel issuing at most `rate` requests
+        per second (``None`` for no limit). A failed request is retried
+        `retries` times before the error is raised. The retrieved entries
+        are written to the cache in bulk.
+
         """
+        import concurrent.futures
+
         if not isinstance(self.api, api.CachedKeggApi):
             raise TypeError("Not an instance of api.CachedKeggApi")
 
@@ -220,28 +259,57 @@ class DBDataBase(object):
         if keys is None:
             keys = self.keys()
 
-        keys = map(self._add_db, keys)
+        keys = sorted(set(map(self._add_db, keys)))
 
         get = self.api.get
+        store = get.store()
 
         # drop all keys with a valid cache entry to minimize the number
         # of 'get' requests.
-        with closing(get.cache_store()) as store:
-            def is_uncached(key):
-                cache_key = get.key_from_args((key,))
-                return not get.key_has_valid_cache(cache_key, store)
-            keys = [key for key in keys if is_uncached(key)]
-
-        start = 0
-
-        while start < len(keys):
-            batch = keys[start: start + batch_size]
-            self.api.get(batch)
-
-            if progress_callback:
-                progress_callback(100.0 * start / len(keys))
-
-            start += batch_size
+        cache_keys = dict((key, get.key_from_args((key,))) for key in keys)
+        cached = store.get_many(cache_keys.values())
+        keys = [key for key in keys
+                if cache_keys[key] not in cached or
+                not get.is_entry_valid(cached[cache_keys[key]], None)]
+
+        batches = list(batch_iter(keys, batch_size))
+        limiter = RateLimiter(rate)
+
+        def fetch(batch):
+            for attempt in range(retries + 1):
+                limiter.wait()
+                try:
+                    return self.api._fetch_entries(batch)
+                except Exception:
+                    if attempt == retries:
+                        raise
+                    time.sleep(2 ** attempt)
+
+        pending = []
+
+        def flush():
+            mtime = datetime.now()
+            store.set_many((get.key_from_args((id,)),
+                            cache_entry(entry, mtime=mtime))
+                           for id, entry in pending)
+            del pending[:]
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+            futures = [executor.submit(fetch, batch) for batch in batches]
+            try:
+                for done, future in enumerate(
+                        concurrent.futures.as_completed(futures)):
+                    pending.extend(future.result())
+                    if len(pending) >= 500:
+                        flush()
+                    if progress_callback:
+                        progress_callback(100.0 * (done + 1) / len(batches))
+            except BaseException:
+                for future in futures:
+                    future.cancel()
+                raise
+            finally:
+                flush()
 
     def batch_get(self, keys):
         """
@@ -342,8 +410,8 @@ class Genome(DBDataBase):
         "4896": "284812",  # Schizosaccharomyces pombe 972h-
     }
 
-    def __init__(self):
-        DBDataBase.__init__(self)
+    def __init__(self, **kwargs):
+        DBDataBase.__init__(self, **kwargs)
         self._org_list = self.api.list_organisms()
         self._keys = [org.entry_id for org in self._org_list]
 
@@ -443,11 +511,11 @@ class Genes(DBDataBase):
     DB = None  # Needs to be set in __init__
     ENTRY_TYPE = GeneEntry
 
-    def __init__(self, org_code):
+    def __init__(self, org_code, **kwargs):
         # TODO: Map to org code from kegg id (T + 5 digits)
         self.DB = org_code
         self.org_code = org_code
-        DBDataBase.__init__(self)
+        DBDataBase.__init__(self, **kwargs)
         self._keys = self.api.get_genes_by_organism(org_code)
 
     def gene_aliases(self):
@@ -486,8 +554,8 @@ class Compound(DBDataBase):
     DB = "cpd"
     ENTRY_TYPE = CompoundEntry
 
-    def __init__(self):
-        DBDataBase.__init__(self)
+    def __init__(self, **kwargs):
+        DBDataBase.__init__(self, **kwargs)
         self._keys = [d.entry_id for d in self.api.list("cpd")]
 
 
@@ -506,8 +574,8 @@ class Reaction(DBDataBase):
     DB = "rn"
     ENTRY_TYPE = ReactionEntry
 
-    def __init__(self):
-        DBDataBase.__init__(self)
+    def __init__(self, **kwargs):
+        DBDataBase.__init__(self, **kwargs)
         self._keys = [d.entry_id for d in self.api.list("rn")]
 
 
@@ -549,8 +617,8 @@ class Enzyme(DBDataBase):
     DB = "ec"
     ENTRY_TYPE = EnzymeEntry
 
-    def __init__(self):
-        DBDataBase.__init__(self)
+    def __init__(self, **kwargs):
+        DBDataBase.__init__(self, **kwargs)
         self._keys = [d.entry_id for d in self.api.list("ec")]
 
 
@@ -569,8 +637,8 @@ class Orthology(DBDataBase):
     DB = "ko"
     ENTRY_TYPE = OrthologyEntry
 
-    def __init__(self):
-        DBDataBase.__init__(self)
+    def __init__(self, **kwargs):
+        DBDataBase.__init__(self, **kwargs)
         self._keys = [d.entry_id for d in self.api.list("ko")]
 
 
@@ -625,8 +693,8 @@ class Pathway(DBDataBase):
     DB = "path"
     ENTRY_TYPE = PathwayEntry
 
-    def __init__(self, prefix="map"):
-        DBDataBase.__init__(self)
+    def __init__(self, prefix="map", **kwargs):
+        DBDataBase.__init__(self, **kwargs)
         self.prefix = prefix
         valid = [d.org_code for d in self.api.list_organisms()] + \
                 ["map", "ko", "ec", "rn"]
@@ -0,0 +1,319 @@
+"""
+===========
+KEGG Mirror
+===========
+
+A local snapshot of KEGG REST responses in a single SQLite file, for
+use without internet access.
+
+A snapshot is built (on a machine with internet access) for selected
+organisms with::
+
+    python -m orangecontrib.bio.kegg.mirror kegg_mirror.sqlite hsa sce
+
+and used by :class:`~.api.CachedKeggApi` when the ``mirror`` option in
+the ``[service]`` section of the configuration (or the ``KEGG_MIRROR``
+environment variable) is set to its path. The `list`, `conv`, `info` and
+`find` responses of the snapshot are served as stored, `link` and `get`
+are indexed queries.
+
+"""
+from __future__ import absolute_import, print_function
+
+import os
+import sqlite3
+import threading
+
+#: Databases whose `info` is included in every snapshot
+INFO_DATABASES = ["kegg", "pathway", "genome"]
+
+
+class MirrorError(IOError):
+    """
+    The requested response is not in the mirror (raised in place of a
+    failed network request).
+    """
+
+
+class Mirror(object):
+    """
+    A KEGG mirror snapshot stored in an SQLite file `filename`.
+
+    :param bool create:
+        Create a new (empty) snapshot, replacing an existing file.
+
+    """
+    #: Max number of ids in a single query.
+    BATCH_SIZE = 500
+
+    def __init__(self, filename, create=False):
+        self.filename = filename
+        if create:
+            if os.path.exists(filename):
+                os.remove(filename)
+        elif not os.path.exists(filename):
+            raise ValueError("KEGG mirror %r does not exist" % filename)
+
+        self._lock = threading.RLock()
+        self.con = sqlite3.connect(filename, check_same_thread=False)
+        if create:
+            self._create()
+
+    def _create(self):
+        with self.con:
+            self.con.executescript("""
+                CREATE TABLE responses
+                    (path TEXT PRIMARY KEY,
+                     text TEXT);
+                CREATE TABLE links
+                    (target TEXT,
+                     source TEXT,
+                     entry_id1 TEXT,
+                     entry_id2 TEXT);
+                CREATE TABLE entries
+                    (entry_id TEXT PRIMARY KEY,
+                     text TEXT);
+            """)
+
+    def create_index(self):
+        """
+        Create the indices of the link lookups (after all links were added).
+        """
+        with self._lock, self.con:
+            self.con.executescript("""
+                CREATE INDEX IF NOT EXISTS links_source
+                    ON links (target, source);
+                CREATE INDEX IF NOT EXISTS links_entry_id1
+                    ON links (target, entry_id1);
+                ANALYZE;
+            """)
+
+    def close(self):
+        self.con.close()
+
+    def add_response(self, path, text):
+        with self._lock, self.con:
+            self.con.execute("INSERT OR REPLACE INTO responses VALUES (?, ?)",
+                             (path, text))
+
+    def add_links(self, target, source, text):
+        """
+        Add the response `text` of a ``link/<target>/<source>`` request.
+        """
+        rows = [line.split("\t", 1) for line in text.splitlines() if line]
+        with self._lock, self.con:
+            self.con.executemany(
+                "INSERT INTO links VALUES (?, ?, ?, ?)",
+                [(target, source, id1, id2) for id1, id2 in rows])
+
+    def add_entries(self, entries):
+        """
+        Add (entry_id, text) pairs of DBGET entries.
+        """
+        with self._lock, self.con:
+            self.con.executemany(
+                "INSERT OR REPLACE INTO entries VALUES (?, ?)", entries)
+
+    def response(self, path):
+        """
+        Return the stored response for a request `path` (e.g.
+        'list/pathway/hsa').
+        """
+        with self._lock:
+            row = self.con.execute(
+                "SELECT text FROM responses WHERE path=?", (path,)
+            ).fetchone()
+        if row is None:
+            raise MirrorError("%r is not in the KEGG mirror %r" %
+                              (path, self.filename))
+        return row[0]
+
+    def links(self, target, source=None, ids=None):
+        """
+        Return the ``link`` response text for `target` database and a
+        `source` database or a list of `ids`.
+        """
+        if source is not None:
+            with self._lock:
+                rows = self.con.execute("""
+                    SELECT entry_id1, entry_id2 FROM links
+                    WHERE target=? AND source=?
+                """, (target, source)).fetchall()
+            if not rows:
+                raise MirrorError("link/%s/%s is not in the KEGG mirror %r" %
+                                  (target, source, self.filename))
+        else:
+            rows = []
+            for start in range(0, len(ids), self.BATCH_SIZE):
+                batch = list(ids[start:start + self.BATCH_SIZE])
+                with self._lock:
+                    rows.extend(self.con.execute("""
+                        SELECT entry_id1, entry_id2 FROM links
+                        WHERE target=? AND entry_id1 IN (%s)
+                    """ % ", ".join("?" * len(batch)), [target] + batch))
+        return "".join("%s\t%s\n" % row for row in rows)
+
+    def entries(self, ids):
+        """
+        Return the concatenated DBGET entries for `ids` (ids missing in
+        the mirror are skipped).
+        """
+        entries = {}
+        for start in range(0, len(ids), self.BATCH_SIZE):
+            batch = list(ids[start:start + self.BATCH_SIZE])
+            with self._lock:
+                entries.update(self.con.execute("""
+                    SELECT entry_id, text FROM entries
+                    WHERE entry_id IN (%s)
+                """ % ", ".join("?" * len(batch)), batch))
+        return "".join(entries[id] for id in ids if id in entries)
+
+    def request(self, path):
+        """
+        Return the response for a KEGG REST request `path` (a sequence
+        of path components).
+        """
+        path = "/".join(path).split("/")
+        if path[0] == "link" and len(path) == 3:
+            target, source = path[1:]
+            if ":" in source or "+" in source:
+                return self.links(target, ids=source.split("+"))
+            else:
+                return self.links(target, source=source)
+        elif path[0] == "get" and len(path) == 2:
+            return self.entries(path[1].split("+"))
+        else:
+            return self.response("/".join(path))
+
+
+class MirrorService(object):
+    """
+    A drop in replacement for the `slumber` based KEGG REST service
+    (see :mod:`.service`) serving requests from a :class:`Mirror`.
+    """
+    def __init__(self, mirror, path=()):
+        self._mirror = mirror
+        self._path = tuple(path)
+
+    def __getattr__(self, name):
+        if name.startswith("_"):
+            raise AttributeError(name)
+        return MirrorService(self._mirror, self._path + (name,))
+
+    def __call__(self, part):
+        return MirrorService(self._mirror, self._path + (part,))
+
+    def get(self, *parts):
+        # `service.get(ids)` is a request path, `resource.get()` the request
+        if parts:
+            return MirrorService(self._mirror, self._path + ("get",) + parts)
+        return self._mirror.request(self._path)
+
+
+def _request(service, path):
+    resource = getattr(service, path[0])
+    for part in path[1:]:
+        resource = resource(part)
+    return resource.get()
+
+
+def export(filename, organisms, link_targets=("pathway",), genes=True,
+           progress_callback=None):
+    """
+    Export a snapshot of KEGG responses for `organisms` (a list of KEGG
+    organism codes) to a new mirror `filename`.
+
+    The snapshot includes the organism list, the genes and pathway lists,
+    the NCBI id conversions, links from the organism genes to all
+    `link_targets` databases, and the DBGET entries of the organisms'
+    genomes, pathways and (if `genes`) genes.
+
+    """
+    from . import api, databases
+
+    kegg = api.CachedKeggApi(mirror="")
+    mirror = Mirror(filename + ".tmp", create=True)
+
+    def report(step, nsteps, progress=0.0):
+        if progress_callback:
+            progress_callback((100.0 * step + progress) / nsteps)
+
+    try:
+        paths = [("info", db) for db in INFO_DATABASES]
+        paths.append(("list", "organism"))
+        for org in organisms:
+            paths.extend([("info", org), ("list", org),
+                          ("list", "pathway", org), ("find", "genome", org),
+                          ("conv", "ncbi-geneid", org),
+                          ("conv", "ncbi-proteinid", org)])
+        for path in paths:
+            mirror.add_response("/".join(path), _request(kegg.service, path))
+
+        for org in organisms:
+            for target in link_targets:
+                mirror.add_links(target, org,
+                                 _request(kegg.service, ("link", target, org)))
+        mirror.create_index()
+
+        # the databases must not read from a configured mirror either
+        genome = databases.Genome(api=kegg)
+        dbs = [(genome, [genome.org_code_to_entry_key(org)
+                         for org in organisms])]
+        for org in organisms:
+            pathways = databases.Pathway(org, api=kegg)
+            dbs.append((pathways, list(pathways.keys())))
+            if genes:
+                org_genes = databases.Genes(org, api=kegg)
+                dbs.append((org_genes, list(org_genes.keys())))
+
+        get = kegg.get
+        store = get.store()
+        for step, (db, keys) in enumerate(dbs):
+            keys = [db._add_db(key) for key in keys]
+            db.pre_cache(keys, progress_callback=lambda p, step=step:
+                         report(step, len(dbs), p))
+            cache_keys = dict((key, get.key_from_args((key,))) for key in keys)
+            cached = store.get_many(cache_keys.values())
+            mirror.add_entries(
+                (key, cached[cache_keys[key]].value) for key in keys
+                if cache_keys[key] in cached and
+                cached[cache_keys[key]].value is not None)
+            report(step + 1, len(dbs))
+    except BaseException:
+        mirror.close()
+        os.remove(filename + ".tmp")
+        raise
+
+    mirror.close()
+    if os.path.exists(filename):
+        os.remove(filename)
+    os.rename(filename + ".tmp", filename)
+
+
+def main(argv=None):
+    """Command line interface to :obj:`export`."""
+    import argparse
+    import sys
+    parser = argparse.ArgumentParser(
+        description="Export a snapshot of KEGG for offline use.")
+    parser.add_argument("filename", help="the mirror file to create")
+    parser.add_argument("organisms", nargs="+", metavar="ORG",
+                        help="KEGG organism codes (e.g. hsa)")
+    parser.add_argument("-l", "--links", nargs="*", default=["pathway"],
+                        help="databases linked to organism genes "
+                             "(default: pathway)")
+    parser.add_argument("--no-genes", action="store_true",
+                        help="do not include the gene entries")
+    args = parser.parse_args(argv)
+
+    def progress(value):
+        sys.stdout.write("\r%5.1f %%" % value)
+        sys.stdout.flush()
+
+    export(args.filename, args.organisms, link_targets=args.links,
+           genes=not args.no_genes, progress_callback=progress)
+    print()
+
+
+if __name__ == "__main__":
+    main()
@@ -11,6 +11,12 @@ import os
 import xml.parsers
 from xml.dom import minidom
 
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
+
+from collections import namedtuple
 from contextlib import closing
 from functools import reduce
 
@@ -32,6 +38,53 @@ def cached_method(func, cache_name="_cached_method_cache", store=None):
     return wrapper
 
 
+#: Contents of a KGML file: a dictionary of `pathway` element attributes
+#: and lists of `entries` ((attributes, graphics, components) tuples),
+#: `relations` ((attributes, subtypes) tuples) and `reactions`
+#: ((attributes, substrates, products) tuples).
+KGML = namedtuple("KGML", ["attributes", "entries", "relations", "reactions"])
+
+
+def parse_kgml(source):
+    """
+    Parse a KGML file (a filename or an open file) in a single pass
+    and return a :class:`KGML` record.
+
+    Raise :class:`ElementTree.ParseError` if the file is not valid XML.
+
+    """
+    attributes = {}
+    entries, relations, reactions = [], [], []
+    for event, elem in ElementTree.iterparse(source, events=("start", "end")):
+        tag = elem.tag
+        if event == "start":
+            if tag == "pathway":
+                attributes = dict(elem.attrib)
+            continue
+
+        if tag == "entry":
+            graphics = elem.find("graphics")
+            entries.append(
+                (dict(elem.attrib),
+                 dict(graphics.attrib) if graphics is not None else {},
+                 [c.get("id") for c in elem.iter("component")]))
+        elif tag == "relation":
+            relations.append(
+                (dict(elem.attrib),
+                 [list(s.attrib.items()) for s in elem.iter("subtype")]))
+        elif tag == "reaction":
+            reactions.append(
+                (dict(elem.attrib),
+                 [s.get("name") for s in elem.iter("substrate")],
+                 [p.get("name") for p in elem.iter("product")]))
+        else:
+            continue
+        # the record is complete, free the element subtree
+        elem.clear()
+
+    return KGML(attributes, entries, relations, reactions)
+
+
 class Pathway(object):
     """
     Class representing a KEGG Pathway (parsed from a "kgml" file)
@@ -52,8 +105,7 @@ class Pathway(object):
         self.connection = connection
 
     def cache_store(self):
-        caching.touch_path(self.local_cache)
-        return caching.Sqlite3Store(os.path.join(self.local_cache,
+        return caching.shared_store(os.path.join(self.local_cache,
                                                  "pathway_store.sqlite3"))
 
     def _open_last_modified_store(self):
@@ -142,35 +194,48 @@ class Pathway(object):
         return local_filename
 
     class entry(object):
-        def __init__(self, dom_element):
-            self.__dict__.update(dom_element.attributes.items())
-            self.graphics = ()
-            self.components = []
-
-            graphics = dom_element.getElementsByTagName("graphics")[0]
-            self.graphics = dict(graphics.attributes.items())
-
-            components = dom_element.getElementsByTagName("component")
-            self.components = [node.getAttribute("id") for node in components]
+        def __init__(self, attributes, graphics, components):
+            self.__dict__.update(attributes)
+            self.graphics = graphics
+            self.components = components
 
     class reaction(object):
-        def __init__(self, dom_element):
-            self.__dict__.update(dom_element.attributes.items())
-            self.substrates = [node.getAttribute("name") for node in
-                               dom_element.getElementsByTagName("substrate")]
-            self.products = [node.getAttribute("name") for node in
-                             dom_element.getElementsByTagName("product")]
+        def __init__(self, attributes, substrates, products):
+            self.__dict__.update(attributes)
+            self.substrates = substrates
+            self.products = products
 
     class relation(object):
-        def __init__(self, dom_element):
-            self.__dict__.update(dom_element.attributes.items())
-            self.subtypes = [node.attributes.items() for node in
-                             dom_element.getElementsByTagName("subtype")]
+        def __init__(self, attributes, subtypes):
+            self.__dict__.update(attributes)
+            self.subtypes = subtypes
+
+    @cached_method
+    def kgml(self):
+        """
+        Return the parsed KGML file of the pathway as a :class:`KGML`
+        record (or ``None`` if the file is not valid). Parsed files are
+        cached until the KGML file is modified.
+        """
+        with self._get_kgml() as kgml_file:
+            mtime = os.fstat(kgml_file.fileno()).st_mtime
+            store = self.cache_store()
+            cached = store.get(self.pathway_id)
+            if cached is not None and cached[0] == mtime:
+                return cached[1]
+            try:
+                kgml = parse_kgml(kgml_file)
+            except ElementTree.ParseError:
+                # TODO: Should delete the cached xml file.
+                return None
+        store[self.pathway_id] = (mtime, kgml)
+        return kgml
 
     @cached_method
     def pathway_attributes(self):
-        if self.pathway_dom():
-            return dict(self.pathway_dom().attributes.items())
+        kgml = self.kgml()
+        if kgml:
+            return dict(kgml.attributes)
         else:
             return None
 
@@ -218,6 +283,10 @@ class Pathway(object):
 
     @cached_method
     def pathway_dom(self):
+        """
+        Return the `pathway` DOM element of the KGML file (the other
+        methods use the parsed :func:`kgml` instead).
+        """
         with self._get_kgml() as kgml:
             try:
                 return minidom.parse(kgml).getElementsByTagName("pathway")[0]
@@ -227,25 +296,25 @@ class Pathway(object):
 
     @cached_method
     def entries(self):
-        dom = self.pathway_dom()
-        if dom:
-            return [self.entry(e) for e in dom.getElementsByTagName("entry")]
+        kgml = self.kgml()
+        if kgml:
+            return [self.entry(*e) for e in kgml.entries]
         else:
             return []
 
     @cached_method
     def reactions(self):
-        dom = self.pathway_dom()
-        if dom:
-            return [self.reaction(e) for e in dom.getElementsByTagName("reaction")]
+        kgml = self.kgml()
+        if kgml:
+            return [self.reaction(*r) for r in kgml.reactions]
         else:
             return []
 
     @cached_method
     def relations(self):
-        dom = self.pathway_dom()
-        if dom:
-            return [self.relation(e) for e in dom.getElementsByTagName("relation")]
+        kgml = self.kgml()
+        if kgml:
+            return [self.relation(*r) for r in kgml.relations]
         else:
             return []
 
@@ -278,10 +347,12 @@ class Pathway(object):
                       [])
 
     def _get_entries_by_type(self, type):
-        return sorted(reduce(set.union,
-                             [entry.name.split() for entry in self.entries()
-                              if entry.type == type],
-                             set()))
+        kgml = self.kgml()
+        if not kgml:
+            return []
+        return sorted(set(name for attributes, _, _ in kgml.entries
+                          if attributes.get("type") == type
+                          for name in attributes.get("name", "").split()))
 
     @cached_method
     def genes(self):
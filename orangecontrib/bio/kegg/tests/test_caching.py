@@ -0,0 +1,96 @@
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from orangecontrib.bio.kegg import caching
+
+
+class TestSqlite3Store(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "store.sqlite3")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_items(self):
+        store = caching.Sqlite3Store(self.filename)
+        store["a"] = caching.cache_entry([1, 2])
+        self.assertTrue("a" in store)
+        self.assertFalse("b" in store)
+        self.assertEqual(store["a"].value, [1, 2])
+        self.assertEqual(len(store), 1)
+        self.assertEqual(list(store), ["a"])
+        del store["a"]
+        self.assertRaises(KeyError, lambda: store["a"])
+
+    def test_many(self):
+        store = caching.Sqlite3Store(self.filename)
+        items = [("key%i" % i, i) for i in range(1200)]
+        store.set_many(items)
+        values = store.get_many(["key%i" % i for i in range(0, 1500, 3)])
+        self.assertEqual(values, dict(items[::3]))
+        self.assertEqual(caching.Sqlite3Store(self.filename).get_many(
+            ["key1", "missing"]), {"key1": 1})
+
+    def test_release(self):
+        store = caching.Sqlite3Store(self.filename, release="80.0")
+        store.set_many([("a", 1), ("b", 2)])
+        # the same release keeps the entries
+        store = caching.Sqlite3Store(self.filename, release="80.0")
+        self.assertEqual(len(store), 2)
+        store = caching.Sqlite3Store(self.filename, release="81.0")
+        self.assertEqual(len(store), 0)
+        store["c"] = 3
+        self.assertEqual(caching.Sqlite3Store(self.filename).release, None)
+        self.assertEqual(
+            len(caching.Sqlite3Store(self.filename, release="81.0")), 1)
+
+    def test_shared_store(self):
+        self.assertFalse(caching.has_shared_store(self.filename))
+        store = caching.shared_store(self.filename, release="80.0")
+        self.assertTrue(caching.has_shared_store(self.filename))
+        self.assertEqual(store.release, "80.0")
+        # an open store is not reopened for a different release
+        self.assertIs(caching.shared_store(self.filename, release="81.0"),
+                      store)
+        self.assertEqual(store.release, "80.0")
+
+    def test_former_schema(self):
+        con = sqlite3.connect(self.filename)
+        con.execute("CREATE TABLE cache (key TEXT UNIQUE, value TEXT)")
+        con.commit()
+        con.close()
+        store = caching.Sqlite3Store(self.filename)
+        store["a"] = 1
+        self.assertEqual(store["a"], 1)
+
+
+class TestCachedWrapper(unittest.TestCase):
+    def test_cached_method(self):
+        class Api(object):
+            calls = 0
+
+            def __init__(self, store):
+                self._store = store
+
+            def cache_store(self):
+                return self._store
+
+            @caching.cached_method
+            def square(self, x):
+                Api.calls += 1
+                return x * x
+
+        api = Api(caching.DictStore())
+        self.assertEqual([api.square(2), api.square(2), api.square(3)],
+                         [4, 4, 9])
+        self.assertEqual(Api.calls, 2)
+        api.square.invalidate_all()
+        self.assertEqual(len(api.cache_store()), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
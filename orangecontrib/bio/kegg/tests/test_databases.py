@@ -1,3 +1,4 @@
+import time
 import unittest
 import six
 
@@ -87,3 +88,16 @@ class TestUtils(unittest.TestCase):
         for exp, batch in zip(expected,
                               databases.batch_iter(iter, 10)):
             self.assertEqual(exp, batch)
+
+    def test_rate_limiter(self):
+        limiter = databases.RateLimiter(50)
+        start = time.time()
+        for _ in range(6):
+            limiter.wait()
+        self.assertGreaterEqual(time.time() - start, 0.09)
+
+        limiter = databases.RateLimiter(None)
+        start = time.time()
+        for _ in range(100):
+            limiter.wait()
+        self.assertLess(time.time() - start, 0.05)
@@ -0,0 +1,207 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from orangecontrib.bio import kegg
+from orangecontrib.bio.kegg import api, caching, conf, databases, mirror
+
+
+INFO = """kegg             Kyoto Encyclopedia of Genes and Genomes
+kegg             Release 80.0+/10-18, Oct 16
+                 Kanehisa Laboratories
+"""
+
+GENOME = """ENTRY       T01001            Complete  Genome
+NAME        hsa, HUMAN, 9606
+DEFINITION  Homo sapiens (human)
+TAXONOMY    TAX:9606
+///
+"""
+
+GENE = """ENTRY       %(id)s              CDS       T01001
+NAME        GENE%(id)s
+DEFINITION  gene %(id)s
+///
+"""
+
+
+def fixture_mirror(filename):
+    """
+    Create a small mirror of the human genome with 20 genes in 3 pathways.
+    """
+    m = mirror.Mirror(filename, create=True)
+    genes = ["hsa:%i" % i for i in range(1, 21)]
+    m.add_response("info/kegg", INFO)
+    m.add_response("list/organism",
+                   "T01001\thsa\tHomo sapiens (human)\tEukaryotes;Animals\n"
+                   "T00005\tsce\tSaccharomyces cerevisiae\tEukaryotes;Fungi\n")
+    m.add_response("list/hsa", "".join("%s\tGENE%s; gene %s\n" %
+                                       (g, g[4:], g[4:]) for g in genes))
+    m.add_response("list/pathway/hsa",
+                   "path:hsa00010\tGlycolysis\n"
+                   "path:hsa00020\tCitrate cycle\n"
+                   "path:hsa00030\tPentose phosphate pathway\n")
+    m.add_response("conv/ncbi-geneid/hsa", "".join(
+        "%s\tncbi-geneid:%s\n" % (g, g[4:]) for g in genes))
+    m.add_links("pathway", "hsa", "".join(
+        "%s\tpath:hsa000%i0\n" % (g, 1 + i % 3) for i, g in enumerate(genes)))
+    m.create_index()
+    m.add_entries([("genome:T01001", GENOME)] +
+                  [(g, GENE % {"id": g[4:]}) for g in genes])
+    m.close()
+    return genes
+
+
+class MirrorTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "kegg_mirror.sqlite")
+        self.genes = fixture_mirror(self.filename)
+        self._cache_path = conf.params["cache.path"]
+        conf.params["cache.path"] = os.path.join(self.tmpdir, "cache")
+        self.api = api.CachedKeggApi(mirror=self.filename)
+
+    def tearDown(self):
+        conf.params["cache.path"] = self._cache_path
+        os.environ.pop("KEGG_MIRROR", None)
+        shutil.rmtree(self.tmpdir)
+
+
+class TestMirror(MirrorTestCase):
+    def test_lists(self):
+        self.assertEqual(self.api.info("kegg").release, "80.0+/10-18, Oct 16")
+        self.assertEqual([o.org_code for o in self.api.list_organisms()],
+                         ["hsa", "sce"])
+        self.assertEqual(len(self.api.list_pathways("hsa")), 3)
+        self.assertEqual(self.api.get_genes_by_organism("hsa"), self.genes)
+        self.assertEqual(self.api.conv("ncbi-geneid", "hsa")[0],
+                         ("hsa:1", "ncbi-geneid:1"))
+        self.assertRaises(mirror.MirrorError, self.api.list, "sce")
+
+    def test_link(self):
+        links = self.api.link("pathway", "hsa")
+        self.assertEqual(len(links), 20)
+        self.assertEqual(self.api.link("pathway", ids=["hsa:1", "hsa:5"]),
+                         [("hsa:1", "path:hsa00010"),
+                          ("hsa:5", "path:hsa00020")])
+        self.assertEqual(self.api.link("pathway", ids=["hsa:99"]), [])
+        self.assertRaises(mirror.MirrorError, self.api.link, "ko", "hsa")
+
+        index = kegg.PathwayGeneIndex(
+            self.api.get_genes_pathway_organism("hsa"))
+        self.assertEqual(index.pathways_by_genes(["hsa:1", "hsa:4"]),
+                         ["path:hsa00010"])
+
+    def test_get(self):
+        text = self.api.get(["hsa:2", "hsa:1", "hsa:99"])
+        self.assertEqual(text, GENE % {"id": "2"} + GENE % {"id": "1"})
+        self.assertEqual(self.api.get("hsa:3"), GENE % {"id": "3"})
+
+    def test_databases(self):
+        os.environ["KEGG_MIRROR"] = self.filename
+        genome = databases.Genome()
+        self.assertEqual(genome.org_code_to_entry_key("hsa"), "T01001")
+        self.assertEqual(genome["T01001"].taxid, "9606")
+
+        genes = databases.Genes("hsa")
+        self.assertEqual(list(genes.keys()), self.genes)
+        genes.pre_cache(rate=None)
+        entries = genes.batch_get(self.genes[:12])
+        self.assertEqual([e.name for e in entries],
+                         ["GENE%i" % i for i in range(1, 13)])
+
+    def test_databases_api(self):
+        # the databases use the given api (and not the configured one)
+        os.environ["KEGG_MIRROR"] = os.path.join(self.tmpdir, "missing")
+        genome = databases.Genome(api=self.api)
+        self.assertIs(genome.api, self.api)
+        self.assertEqual(genome.org_code_to_entry_key("hsa"), "T01001")
+        pathways = databases.Pathway("hsa", api=self.api)
+        self.assertEqual(len(list(pathways.keys())), 3)
+        genes = databases.Genes("hsa", api=self.api)
+        self.assertEqual(genes["hsa:3"].name, "GENE3")
+
+    def test_cache_store(self):
+        store = self.api.cache_store()
+        self.assertEqual(store.release, "80.0+/10-18, Oct 16")
+        self.assertIs(api.CachedKeggApi(mirror=self.filename).cache_store(),
+                      store)
+        self.assertIs(caching.shared_store(os.path.join(
+            conf.params["cache.path"], "kegg_api_cache_2.sqlite3")), store)
+
+    def test_release_unavailable(self):
+        m = mirror.Mirror(self.filename)
+        m.add_response("info/kegg", "not a kegg info response")
+        m.close()
+        kegg_api = api.CachedKeggApi(mirror=self.filename)
+        self.assertIs(kegg_api.release(), None)
+        # the cache stays usable
+        self.assertEqual(kegg_api.get("hsa:3"), GENE % {"id": "3"})
+        self.assertIn("hsa:3", kegg_api.get_genes_by_organism("hsa"))
+
+    def test_missing(self):
+        self.assertRaises(ValueError, mirror.Mirror,
+                          os.path.join(self.tmpdir, "missing.sqlite"))
+
+
+class FlakyKeggApi(api.CachedKeggApi):
+    """
+    Fail the first `failures` requests of every batch of entries (and all
+    requests of batches with `broken` ids).
+    """
+    def __init__(self, mirror, failures=0, broken=()):
+        api.CachedKeggApi.__init__(self, mirror=mirror)
+        self.failures = failures
+        self.broken = set(broken)
+        self.attempts = {}
+        self._lock = threading.Lock()
+
+    def _fetch_entries(self, ids):
+        with self._lock:
+            attempt = self.attempts[tuple(ids)] = \
+                self.attempts.get(tuple(ids), 0) + 1
+        if attempt <= self.failures or self.broken.intersection(ids):
+            raise IOError("request failed")
+        return api.CachedKeggApi._fetch_entries(self, ids)
+
+
+class TestPreCache(MirrorTestCase):
+    def cached(self, kegg_api, keys):
+        get = kegg_api.get
+        cached = get.store().get_many(get.key_from_args((key,))
+                                      for key in keys)
+        return [key for key in keys if get.key_from_args((key,)) in cached]
+
+    def test_retries(self):
+        kegg_api = FlakyKeggApi(self.filename, failures=1)
+        genes = databases.Genes("hsa", api=kegg_api)
+        progress = []
+        genes.pre_cache(batch_size=5, rate=None, retries=1,
+                        progress_callback=progress.append)
+        self.assertEqual(sorted(kegg_api.attempts.values()), [2] * 4)
+        self.assertEqual(self.cached(kegg_api, self.genes), self.genes)
+        self.assertEqual(progress, sorted(progress))
+        self.assertEqual(progress[-1], 100)
+
+        # cached entries are not requested again
+        kegg_api.attempts.clear()
+        genes.pre_cache(batch_size=5, rate=None)
+        self.assertEqual(kegg_api.attempts, {})
+
+    def test_failure(self):
+        kegg_api = FlakyKeggApi(self.filename, failures=1, broken=["hsa:9"])
+        genes = databases.Genes("hsa", api=kegg_api)
+        with self.assertRaises(IOError):
+            genes.pre_cache(batch_size=5, rate=None, retries=1,
+                            max_workers=1)
+        # the batch with hsa:9 (the last in the sorted order) is retried,
+        # the entries of the other batches are kept
+        keys = sorted(self.genes)
+        self.assertEqual(kegg_api.attempts[tuple(keys[15:])], 2)
+        self.assertEqual(self.cached(kegg_api, keys), keys[:15])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+import unittest
+
+from orangecontrib.bio import kegg
+from orangecontrib.bio.utils import stats
+
+
+LINKS = [
+    ("hsa:1", "path:hsa00010"), ("hsa:2", "path:hsa00010"),
+    ("hsa:3", "path:hsa00010"), ("hsa:2", "path:hsa00020"),
+    ("hsa:4", "path:hsa00020"), ("hsa:5", "path:hsa00030"),
+    ("hsa:2", "path:hsa00010"),
+]
+
+
+class TestPathwayGeneIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = kegg.PathwayGeneIndex(LINKS)
+
+    def test_index(self):
+        index = self.index
+        self.assertEqual(index.genes, ["hsa:1", "hsa:2", "hsa:3", "hsa:4",
+                                       "hsa:5"])
+        self.assertEqual(index.pathways, ["path:hsa00010", "path:hsa00020",
+                                          "path:hsa00030"])
+        self.assertEqual(
+            [index.genes[g] for g in index.pathway_genes("path:hsa00010")],
+            ["hsa:1", "hsa:2", "hsa:3"])
+        self.assertEqual(index.gene_pathways["hsa:2"],
+                         ["path:hsa00010", "path:hsa00020"])
+        self.assertEqual(
+            list(index.counts(index.gene_mask(["hsa:2", "hsa:5", "x"]))),
+            [1, 1, 1])
+
+    def test_pathways_by_genes(self):
+        self.assertEqual(self.index.pathways_by_genes(["hsa:2"]),
+                         ["path:hsa00010", "path:hsa00020"])
+        self.assertEqual(self.index.pathways_by_genes(["hsa:1", "hsa:2"]),
+                         ["path:hsa00010"])
+        self.assertEqual(self.index.pathways_by_genes(["hsa:1", "hsa:4"]),
+                         [])
+        self.assertEqual(self.index.pathways_by_genes(["unknown"]), [])
+
+    def test_enriched_pathways(self):
+        prob = stats.Binomial()
+        genes = ["hsa:1", "hsa:2", "hsa:9"]
+        reference = ["hsa:%i" % i for i in range(1, 10)]
+        res = self.index.enriched_pathways(genes, reference, prob)
+        self.assertEqual(set(res), set(["path:hsa00010", "path:hsa00020"]))
+
+        pathway_genes, p, ref_count = res["path:hsa00010"]
+        self.assertEqual(pathway_genes, ["hsa:1", "hsa:2"])
+        self.assertEqual(ref_count, 3)
+        self.assertAlmostEqual(p, prob.p_value(2, 9, 3, 3))
+
+        pathway_genes, p, ref_count = res["path:hsa00020"]
+        self.assertEqual(pathway_genes, ["hsa:2"])
+        self.assertEqual(ref_count, 2)
+        self.assertAlmostEqual(p, prob.p_value(1, 9, 2, 3))
+
+
+if __name__ == "__main__":
+    unittest.main()
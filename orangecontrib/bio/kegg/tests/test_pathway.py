@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from orangecontrib.bio.kegg import pathway
+
+
+KGML = """<?xml version="1.0"?>
+<!DOCTYPE pathway SYSTEM "http://www.kegg.jp/kegg/xml/KGML_v0.7.1_.dtd">
+<pathway name="path:hsa00010" org="hsa" number="00010"
+         title="Glycolysis / Gluconeogenesis"
+         image="http://www.kegg.jp/kegg/pathway/hsa/hsa00010.png"
+         link="http://www.kegg.jp/kegg-bin/show_pathway?hsa00010">
+    <entry id="13" name="hsa:226 hsa:229" type="gene" reaction="rn:R01070"
+           link="http://www.kegg.jp/dbget-bin/www_bget?hsa:226+hsa:229">
+        <graphics name="ALDOA" fgcolor="#000000" bgcolor="#BFFFBF"
+             type="rectangle" x="483" y="407" width="46" height="17"/>
+    </entry>
+    <entry id="14" name="hsa:229 hsa:3101" type="gene">
+        <graphics name="HK3" type="rectangle" x="1" y="2" width="3"
+             height="4"/>
+    </entry>
+    <entry id="20" name="cpd:C00031" type="compound">
+        <graphics name="C00031" type="circle" x="5" y="6" width="8"
+             height="8"/>
+    </entry>
+    <entry id="30" name="undefined" type="group">
+        <graphics type="rectangle" x="0" y="0" width="1" height="1"/>
+        <component id="13"/>
+        <component id="14"/>
+    </entry>
+    <relation entry1="13" entry2="14" type="ECrel">
+        <subtype name="compound" value="20"/>
+    </relation>
+    <reaction id="13" name="rn:R01070" type="reversible">
+        <substrate id="20" name="cpd:C00031"/>
+        <product id="21" name="cpd:C00118"/>
+    </reaction>
+</pathway>
+"""
+
+
+class TestPathway(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "hsa00010.xml")
+        with open(self.filename, "w") as f:
+            f.write(KGML)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_parse_kgml(self):
+        kgml = pathway.parse_kgml(self.filename)
+        self.assertEqual(kgml.attributes["name"], "path:hsa00010")
+        self.assertEqual(len(kgml.entries), 4)
+        attributes, graphics, components = kgml.entries[3]
+        self.assertEqual(attributes["type"], "group")
+        self.assertEqual(components, ["13", "14"])
+        self.assertEqual(kgml.relations,
+                         [({"entry1": "13", "entry2": "14", "type": "ECrel"},
+                           [[("name", "compound"), ("value", "20")]])])
+        self.assertEqual(kgml.reactions[0][1:],
+                         (["cpd:C00031"], ["cpd:C00118"]))
+
+    def test_pathway(self):
+        path = pathway.Pathway("path:hsa00010", local_cache=self.tmpdir)
+        self.assertEqual(path.title, "Glycolysis / Gluconeogenesis")
+        self.assertEqual(path.org, "hsa")
+        self.assertEqual(path.genes(), ["hsa:226", "hsa:229", "hsa:3101"])
+        self.assertEqual(path.compounds(), ["cpd:C00031"])
+
+        entry = path.entries()[0]
+        self.assertEqual(entry.graphics["name"], "ALDOA")
+        self.assertTrue(entry.link.startswith("http://"))
+        self.assertFalse(hasattr(path.entries()[1], "link"))
+        self.assertEqual(path.relations()[0].subtypes,
+                         [[("name", "compound"), ("value", "20")]])
+        self.assertEqual(path.reactions()[0].products, ["cpd:C00118"])
+
+        # the same as parsed with the DOM
+        dom_entries = path.pathway_dom().getElementsByTagName("entry")
+        self.assertEqual([dict(e.attributes.items()) for e in dom_entries],
+                         [e[0] for e in path.kgml().entries])
+
+    def test_cache(self):
+        path = pathway.Pathway("path:hsa00010", local_cache=self.tmpdir)
+        path.kgml()
+        mtime, kgml = path.cache_store()["hsa00010"]
+        self.assertEqual(kgml, pathway.parse_kgml(self.filename))
+
+        # the cached record is used
+        path.cache_store()["hsa00010"] = (mtime, kgml._replace(entries=[]))
+        path = pathway.Pathway("path:hsa00010", local_cache=self.tmpdir)
+        self.assertEqual(path.genes(), [])
+
+        # until the KGML file changes
+        os.utime(self.filename, (time.time(), mtime + 10))
+        path = pathway.Pathway("path:hsa00010", local_cache=self.tmpdir)
+        self.assertEqual(len(path.genes()), 3)
+
+    def test_invalid(self):
+        with open(self.filename, "w") as f:
+            f.write(KGML[:300])
+        path = pathway.Pathway("path:hsa00010", local_cache=self.tmpdir)
+        self.assertIs(path.pathway_attributes(), None)
+        self.assertEqual(path.genes(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -11,6 +11,8 @@ from urllib import urlopen
 from sgmllib import SGMLParser
 import os.path
 
+import numpy
+
 import orange
 from Orange.orng import orngServerFiles
 
@@ -543,8 +545,11 @@ class obiMeSH(object):
                         self.statistics[k][1] += 1  # increased noCluster
         self.ratio = float(cln) / float(n)
         # enrichment
-        for i in self.statistics.iterkeys():
-            self.statistics[i][2] = HYPERG.p_value(int(self.statistics[i][1]), int(n), int(cln), int(self.statistics[i][0]))
+        ids = list(self.statistics.keys())
+        counts = numpy.array([self.statistics[i][:2] for i in ids], dtype=int).reshape(-1, 2)
+        pvalues = HYPERG.p_values(counts[:, 1], int(n), int(cln), counts[:, 0])
+        for i, pvalue in zip(ids, pvalues):
+            self.statistics[i][2] = float(pvalue)
             self.statistics[i][3] = float(self.statistics[i][1]) / float(self.statistics[i][0]) / self.ratio   # fold enrichment
         self.calculated = True
 
@@ -661,7 +661,7 @@ class GeneManiaDatabase(obiPPI.PPIDatabase):
         return map(itemgetter(0), cur)
         
     def _db(self, taxid=None):
-        """ Return an open sqlite3.Connection object.  
+        """ Return an open (per thread, read-only) sqlite3.Connection object.
         """
         taxid = taxid or self.taxid
         filename = orngServerFiles.localpath_download("PPI",
@@ -669,7 +669,7 @@ class GeneManiaDatabase(obiPPI.PPIDatabase):
         if not os.path.exists(filename):
             raise ValueError("Database is missing.")
         
-        return sqlite3.connect(filename)
+        return obiPPI.connections.connection(filename, immutable=True)
     
     @lru_cache(maxsize=1)
     def _gene_id_to_name(self):
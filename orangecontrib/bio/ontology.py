@@ -43,6 +43,7 @@ See the definition of the `.obo file format <http://www.geneontology.org/GO.form
 
 """
 from __future__ import print_function
+import os
 import sys
 import re
 import warnings
@@ -50,6 +51,8 @@ import keyword
 from collections import defaultdict
 import six
 
+import numpy
+
 from six import StringIO
 
 try:
@@ -514,18 +517,138 @@ class OBOParser(object):
         return self.parse()
 
 
+def _csr(sets):
+    """
+    Return a list of integer sets in a compressed sparse row format:
+    a pair of arrays (indptr, indices) where the sorted elements of the
+    i-th set are ``indices[indptr[i]:indptr[i + 1]]``.
+    """
+    sizes = [len(s) for s in sets]
+    indptr = numpy.zeros(len(sets) + 1, dtype=numpy.int32)
+    indptr[1:] = numpy.cumsum(sizes)
+    indices = numpy.fromiter((i for s in sets for i in sorted(s)),
+                             dtype=numpy.int32, count=indptr[-1])
+    return indptr, indices
+
+
+class ClosureIndex(object):
+    """
+    A transitive closure of the relations in an ontology.
+
+    Objects are numbered by their position in the ontology
+    (:obj:`OBOOntology.objects`) and the parents, ancestors and
+    descendants of each object are stored as sorted integer arrays
+    in a compressed sparse row format.
+
+    :param list ids: Ids of the objects in the ontology.
+    :param tuple parents: (indptr, indices) pair of direct parents.
+    :param tuple ancestors: (indptr, indices) pair of all super terms.
+    :param tuple descendants: (indptr, indices) pair of all sub terms.
+
+    """
+    def __init__(self, ids, parents, ancestors, descendants):
+        self.ids = list(ids)
+        #: A dictionary mapping ids to positions.
+        self.position = dict((id, i) for i, id in enumerate(self.ids))
+        self.parents = parents
+        self.ancestors = ancestors
+        self.descendants = descendants
+
+    @classmethod
+    def from_ontology(cls, ontology):
+        """
+        Build the index from the relations of an :class:`OBOOntology`.
+        """
+        objects = ontology.objects
+        position = dict((id(obj), i) for i, obj in enumerate(objects))
+        parents = [set(position[id(ontology.term(parent))]
+                       for _, parent in ontology.related_terms(obj))
+                   for obj in objects]
+
+        ancestors = [None] * len(objects)
+        for i in range(len(objects)):
+            visited = set()
+            queue = set(parents[i])
+            while queue:
+                term = queue.pop()
+                visited.add(term)
+                if ancestors[term] is not None:
+                    # already closed; no need to walk further up
+                    visited.update(ancestors[term])
+                else:
+                    queue.update(parents[term] - visited)
+            ancestors[i] = visited
+
+        descendants = [set() for _ in objects]
+        for i, anc in enumerate(ancestors):
+            for a in anc:
+                descendants[a].add(i)
+
+        return cls([obj.id for obj in objects], _csr(parents),
+                   _csr(ancestors), _csr(descendants))
+
+    @staticmethod
+    def _row(csr, i):
+        indptr, indices = csr
+        return indices[indptr[i]:indptr[i + 1]]
+
+    def parents_of(self, i):
+        """Return an array of indices of direct parents of the i-th object.
+        """
+        return self._row(self.parents, i)
+
+    def ancestors_of(self, i):
+        """Return an array of indices of all super terms of the i-th object.
+        """
+        return self._row(self.ancestors, i)
+
+    def descendants_of(self, i):
+        """Return an array of indices of all sub terms of the i-th object.
+        """
+        return self._row(self.descendants, i)
+
+    def save(self, file):
+        """
+        Save the index to a file (in numpy .npz format).
+        """
+        numpy.savez(file, ids=numpy.array(self.ids, dtype=six.text_type),
+                    parents_indptr=self.parents[0],
+                    parents=self.parents[1],
+                    ancestors_indptr=self.ancestors[0],
+                    ancestors=self.ancestors[1],
+                    descendants_indptr=self.descendants[0],
+                    descendants=self.descendants[1])
+
+    @classmethod
+    def load(cls, file):
+        """
+        Load the index saved with :func:`save`.
+        """
+        with numpy.load(file) as f:
+            return cls([six.text_type(i) for i in f["ids"]],
+                       (f["parents_indptr"], f["parents"]),
+                       (f["ancestors_indptr"], f["ancestors"]),
+                       (f["descendants_indptr"], f["descendants"]))
+
+
 class OBOOntology(object):
     """
     An class representing an OBO ontology.
 
     :param file-like file:
         A optional file like object describing the ontology in obo format.
+    :param bool closure_index:
+        If `True`, :func:`super_terms`, :func:`sub_terms` and
+        :func:`parent_terms` use a :class:`ClosureIndex`, which is built
+        on first use and rebuilt after the ontology changes. If the
+        ontology is loaded from a filename, the index is stored next to
+        it (with a ``.closure.npz`` suffix) and reused by later loads.
 
     """
 
     BUILTINS = BUILTIN_OBO_OBJECTS
 
-    def __init__(self, file=None):
+    def __init__(self, file=None, closure_index=False):
         self.objects = []
         self.header_tags = []
         self.id2term = {}
@@ -533,6 +656,9 @@ class OBOOntology(object):
         self._resolved_imports = []
         self._invalid_cache_flag = False
         self._related_to = {}
+        self.use_closure_index = closure_index
+        self._closure_index = None
+        self._closure_index_path = None
 
         # First load the built in OBO objects
         builtins = StringIO("\n" + "\n\n".join(self.BUILTINS) + "\n")
@@ -550,6 +676,9 @@ class OBOOntology(object):
         self.objects.append(obj)
         self.id2term[obj.id] = obj
         self._invalid_cache_flag = True
+        self._closure_index = None
+        # the saved index no longer describes the ontology
+        self._closure_index_path = None
 
     def add_header_tag(self, tag, value):
         """
@@ -567,8 +696,10 @@ class OBOOntology(object):
             An optional function callback to report on the progress.
 
         """
+        filename = None
         if isinstance(file, basestring):
-            file = open(file, "rb")
+            filename = file
+            file = open(file, "rb" if six.PY2 else "r")
 
         parser = OBOParser(file)
         current = None
@@ -595,6 +726,9 @@ class OBOOntology(object):
         if imports:
             warnings.warn("Import header tags are not supported")
 
+        if filename is not None:
+            self._closure_index_path = filename + ".closure.npz"
+
 #        while imports:
 #            url = imports.pop(0)
 #            if uri not in self._resolved_imports:
@@ -639,6 +773,51 @@ class OBOOntology(object):
             else:
                 self.add_object(term)
         self._invalid_cache_flag = True
+        self._closure_index = None
+        self._closure_index_path = None
+
+    def closure_index(self):
+        """
+        Return the :class:`ClosureIndex` of this ontology. The index is
+        built on first call and after the ontology changes.
+
+        """
+        if self._closure_index is None:
+            ids = [obj.id for obj in self.objects]
+            index = self._load_closure_index()
+            if index is None or index.ids != ids:
+                index = ClosureIndex.from_ontology(self)
+                self._save_closure_index(index)
+            self._closure_index = index
+        return self._closure_index
+
+    def _load_closure_index(self):
+        path = self._closure_index_path
+        if path is None or not os.path.exists(path):
+            return None
+        source = path[:-len(".closure.npz")]
+        if os.path.exists(source) and \
+                os.path.getmtime(source) > os.path.getmtime(path):
+            return None
+        try:
+            return ClosureIndex.load(path)
+        except Exception:
+            return None
+
+    def _save_closure_index(self, index):
+        path = self._closure_index_path
+        if path is None:
+            return
+        try:
+            # numpy.savez appends .npz to file names without it
+            with open(path + ".tmp", "wb") as f:
+                index.save(f)
+            os.rename(path + ".tmp", path)
+        except (IOError, OSError):
+            warnings.warn("Could not save the closure index to %r" % path)
+
+    def _closure_terms(self, rows):
+        return set(self.objects[i] for i in rows)
 
     def _cache_validate(self, force=False):
         """
@@ -757,6 +936,10 @@ class OBOOntology(object):
         """
         Return a set of all super terms of `term` up to the most general one.
         """
+        if self.use_closure_index:
+            index = self.closure_index()
+            return self._closure_terms(
+                index.ancestors_of(index.position[self.term(term).id]))
         terms = self.parent_terms(term)
         visited = set()
         queue = set(terms)
@@ -770,6 +953,10 @@ class OBOOntology(object):
         """
         Return a set of all sub terms for `term`.
         """
+        if self.use_closure_index:
+            index = self.closure_index()
+            return self._closure_terms(
+                index.descendants_of(index.position[self.term(term).id]))
         terms = self.child_terms(term)
         visited = set()
         queue = set(terms)
@@ -795,6 +982,9 @@ class OBOOntology(object):
         Return a set of all parent terms for this `term`.
         """
         term = self.term(term)
+        if self.use_closure_index:
+            index = self.closure_index()
+            return self._closure_terms(index.parents_of(index.position[term.id]))
         parents = []
         for rel_type, id in self.parent_edges(term):
             parents.append(self.term(id))
@@ -14,11 +14,19 @@ import sqlite3
 import errno
 import posixpath
 import textwrap
+import threading
 
 from io import StringIO
+try:
+    from urllib import pathname2url
+except ImportError:
+    from urllib.request import pathname2url
 from collections import defaultdict, namedtuple
 from operator import itemgetter
 
+import numpy
+import scipy.sparse
+
 from .utils import serverfiles
 try:
     from Orange.utils import ConsoleProgressBar, wget
@@ -40,6 +48,123 @@ def mkdir_p(path, mode=0o777):
             raise
 
 
+class ConnectionManager(object):
+    """
+    Per thread read-only connections to SQLite database files.
+
+    Connections are opened once per thread and file (with URI
+    ``mode=ro``, and ``immutable=1`` for files which are only replaced
+    but never modified in place, such as downloaded server files) and
+    reused, together with their caches of prepared statements. A file
+    which was replaced since (a different modification time, inode or
+    size) is opened again.
+
+    """
+    #: Bytes of the database file to memory map.
+    MMAP_SIZE = 256 * 2 ** 20
+    #: Page cache size (in KiB).
+    CACHE_SIZE = 64 * 2 ** 10
+    #: Number of prepared statements cached per connection.
+    CACHED_STATEMENTS = 256
+
+    def __init__(self):
+        self._local = threading.local()
+
+    def _connections(self):
+        try:
+            return self._local.connections
+        except AttributeError:
+            self._local.connections = {}
+            return self._local.connections
+
+    def connection(self, filename, immutable=False):
+        """
+        Return an open read-only connection to `filename` for the
+        calling thread.
+        """
+        key = (os.path.abspath(filename), immutable)
+        try:
+            stat = os.stat(key[0])
+            signature = (stat.st_mtime, stat.st_ino, stat.st_size)
+        except OSError:
+            signature = None
+        connections = self._connections()
+        con, con_signature = connections.get(key, (None, None))
+        if con is None or con_signature != signature:
+            # The old connection (of a replaced file) is not closed here,
+            # the caller may still hold its cursors.
+            con = self._connect(key[0], immutable)
+            connections[key] = (con, signature)
+        return con
+
+    def _connect(self, filename, immutable):
+        if not os.path.exists(filename):
+            raise ValueError("Database {0!r} is missing.".format(filename))
+        uri = "file:{0}?mode=ro{1}".format(
+            pathname2url(filename), "&immutable=1" if immutable else "")
+        try:
+            con = sqlite3.connect(uri, uri=True,
+                                  cached_statements=self.CACHED_STATEMENTS)
+        except TypeError:
+            # URI filenames are not supported (Python 2)
+            con = sqlite3.connect(filename,
+                                  cached_statements=self.CACHED_STATEMENTS)
+        con.execute("PRAGMA mmap_size={0:d}".format(self.MMAP_SIZE))
+        con.execute("PRAGMA cache_size=-{0:d}".format(self.CACHE_SIZE))
+        return con
+
+    def close(self):
+        """
+        Close all connections of the calling thread.
+        """
+        connections = self._connections()
+        for con, _ in connections.values():
+            con.close()
+        connections.clear()
+
+
+#: Shared connection manager of the PPI databases.
+connections = ConnectionManager()
+
+
+def _adjacency(edges, index):
+    """
+    Return a (symmetric) sparse adjacency matrix of edge scores between
+    nodes in `index` (a mapping of ids to node indices). The maximal
+    score is used for repeated edges; edges without a score have weight 1.
+    """
+    n = len(index)
+    rows, cols, scores = [], [], []
+    for id1, id2, score in edges:
+        i, j = index[id1], index[id2]
+        score = 1.0 if score is None else float(score)
+        rows.extend((i, j))
+        cols.extend((j, i))
+        scores.extend((score, score))
+    rows = numpy.array(rows, dtype=int)
+    cols = numpy.array(cols, dtype=int)
+    scores = numpy.array(scores, dtype=float)
+    # keep the maximal score of repeated (i, j) pairs
+    order = numpy.lexsort((scores, cols, rows))
+    rows, cols, scores = rows[order], cols[order], scores[order]
+    last = numpy.ones(len(rows), dtype=bool)
+    last[:-1] = (rows[1:] != rows[:-1]) | (cols[1:] != cols[:-1])
+    return scipy.sparse.csr_matrix(
+        (scores[last], (rows[last], cols[last])), shape=(n, n))
+
+
+def _query_ids(db, ids):
+    """
+    Fill a temporary table `query_ids` of the connection `db` with `ids`
+    (used to join queries with a set of ids).
+    """
+    db.execute("CREATE TEMP TABLE IF NOT EXISTS query_ids "
+               "(id TEXT PRIMARY KEY)")
+    db.execute("DELETE FROM temp.query_ids")
+    db.executemany("INSERT OR IGNORE INTO temp.query_ids VALUES (?)",
+                   ((id,) for id in ids))
+
+
 class PPIDatabase(object):
     """
     A general interface for protein-protein interaction database access.
@@ -98,6 +223,69 @@ class PPIDatabase(object):
         """
         raise NotImplementedError
 
+    def edges_many(self, ids, min_score=None, internal=False):
+        """
+        Return a list of all edges (3-tuples (id1, id2, score)) of any
+        of the `ids`, with score of at least `min_score` (if not None).
+        If `internal` is True return only edges between the `ids`.
+
+        """
+        ids = set(ids)
+        seen = set()
+        res = []
+        for id in ids:
+            for edge in self.edges(id):
+                if edge in seen:
+                    continue
+                seen.add(edge)
+                id1, id2, score = edge
+                if min_score is not None and \
+                        (score is None or score < min_score):
+                    continue
+                if internal and not (id1 in ids and id2 in ids):
+                    continue
+                res.append(edge)
+        return res
+
+    def synonyms_many(self, ids):
+        """
+        Return a dictionary of synonyms (as returned by `synonyms`) of
+        all `ids`.
+        """
+        return dict((id, self.synonyms(id)) for id in ids)
+
+    def subnetwork(self, ids, min_score=None, depth=0):
+        """
+        Return the network of proteins `ids` extended with their
+        neighbours up to `depth` edges away as a tuple (nodes, adjacency):
+        a list of node ids (`ids` first) and a :class:`scipy.sparse.csr_matrix`
+        of edge scores (edges without a score have weight 1). Only edges
+        with a score of at least `min_score` (if not None) are included.
+
+        """
+        nodes = []
+        index = {}
+        for id in ids:
+            if id not in index:
+                index[id] = len(nodes)
+                nodes.append(id)
+
+        frontier = list(nodes)
+        for _ in range(depth):
+            new = []
+            for id1, id2, _ in self.edges_many(frontier, min_score):
+                for id in (id1, id2):
+                    if id not in index:
+                        index[id] = len(nodes)
+                        nodes.append(id)
+                        new.append(id)
+            frontier = new
+            if not frontier:
+                break
+
+        edges = self.edges_many(nodes, min_score, internal=True)
+        return nodes, _adjacency(edges, index)
+
     def all_edges_annotated(self, taxid=None):
         """
         Return a list of all edges annotated. If taxid is not None
@@ -125,18 +313,19 @@ class PPIDatabase(object):
 
     def extract_network(self, ids):
         """
+        Return an `Orange.network.Graph` of proteins `ids` and all their
+        edges.
         """
         from Orange import network
 
+        ids = list(ids)
         graph = network.Graph()
+        synonyms = self.synonyms_many(ids)
         for id in ids:
-            graph.add_node(id, synonyms=",".join(self.synonyms(id)))
-
-        for id in ids:
-            edges = self.edges(id)
+            graph.add_node(id, synonyms=",".join(synonyms[id]))
 
-            for id1, id2, score in edges:
-                graph.add_edge(id1, id2, weight=score)
+        for id1, id2, score in self.edges_many(ids):
+            graph.add_edge(id1, id2, weight=score)
 
         return graph
 
@@ -244,9 +433,15 @@ class BioGRID(PPIDatabase):
             self.DOMAIN, self.SERVER_FILE)
 
         # assert version matches
-        self.db = sqlite3.connect(self.filename)
         self.init_db_index()
 
+    @property
+    def db(self):
+        """
+        A (per thread) read-only connection to the database.
+        """
+        return connections.connection(self.filename, immutable=True)
+
     def organisms(self):
         cur = self.db.execute("select distinct organism_interactor \n"
                               "from proteins")
@@ -328,6 +523,55 @@ class BioGRID(PPIDatabase):
         """, (id, id))
         return cur.fetchall()
 
+    def edges_many(self, ids, min_score=None, internal=False):
+        """
+        Return a list of all interactions (3-tuples (id_a, id_b, score))
+        of any of the `ids` (in a single query). If `internal` is True
+        return only interactions between the `ids`.
+
+        """
+        _query_ids(self.db, ids)
+        if internal:
+            where = """\
+                biogrid_id_interactor_a in temp.query_ids and
+                biogrid_id_interactor_b in temp.query_ids"""
+        else:
+            where = """\
+                (biogrid_id_interactor_a in temp.query_ids or
+                 biogrid_id_interactor_b in temp.query_ids)"""
+        params = ()
+        if min_score is not None:
+            where += " and score >= ?"
+            params = (min_score,)
+        cur = self.db.execute("""\
+            select biogrid_id_interactor_a, biogrid_id_interactor_b, score
+            from links
+            where """ + where, params)
+        return list(cur)
+
+    def synonyms_many(self, ids):
+        """
+        Return a dictionary of synonyms of all `ids` (in a single query).
+        """
+        ids = list(ids)
+        res = dict((id, []) for id in ids)
+        _query_ids(self.db, ids)
+        cur = self.db.execute("""\
+            select biogrid_id_interactor,
+                   entrez_gene_interactor,
+                   systematic_name_interactor,
+                   official_symbol_interactor,
+                   synonyms_interactor
+            from proteins
+            where biogrid_id_interactor in temp.query_ids""")
+        for rec in cur:
+            if res[rec[0]]:
+                continue  # synonyms returns the first record only
+            synonyms = list(rec[1:-1]) + \
+                       (rec[-1].split("|") if rec[-1] is not None else [])
+            res[rec[0]] = [s for s in synonyms if s is not None]
+        return res
+
     def all_edges_annotated(self, taxid=None):
         """
         Return a list of all edges annotated. If taxid is not None
@@ -492,18 +736,25 @@ class BioGRID(PPIDatabase):
         for faster searching by primary ids.
 
         """
-        self.db.execute("""\
-        create index if not exists index_on_biogrid_id_interactor_a
-           on links (biogrid_id_interactor_a)
-        """)
-        self.db.execute("""\
-        create index if not exists index_on_biogrid_id_interactor_b
-           on links (biogrid_id_interactor_b)
-        """)
-        self.db.execute("""\
-        create index if not exists index_on_biogrid_id_interactor
-           on proteins (biogrid_id_interactor)
-        """)
+        con = sqlite3.connect(self.filename)
+        try:
+            with con:
+                con.execute("""\
+                create index if not exists index_on_biogrid_id_interactor_a
+                   on links (biogrid_id_interactor_a)
+                """)
+                con.execute("""\
+                create index if not exists index_on_biogrid_id_interactor_b
+                   on links (biogrid_id_interactor_b)
+                """)
+                con.execute("""\
+                create index if not exists index_on_biogrid_id_interactor
+                   on proteins (biogrid_id_interactor)
+                """)
+        except sqlite3.OperationalError:
+            pass  # a read only database
+        finally:
+            con.close()
 
 
 STRINGInteraction = namedtuple(
@@ -566,15 +817,16 @@ class STRING(PPIDatabase):
         if taxid is not None and database is not None:
             raise ValueError("taxid and database parameters are exclusive.")
 
-        self.db = None
+        self._db = None
+        # server files are replaced (not modified) on update
+        self._immutable = database is None
 
         if taxid is None and database is not None:
             if isinstance(database, sqlite3.Connection):
-                self.db = database
+                self._db = database
                 self.filename = None
             else:
                 self.filename = database
-                self.db = sqlite3.connect(database)
         elif taxid is not None and database is None:
             self.filename = serverfiles.localpath_download(
                 self.DOMAIN, self.FILENAME.format(taxid=taxid)
@@ -586,8 +838,16 @@ class STRING(PPIDatabase):
         else:
             assert False, "Not reachable"
 
-        if self.db is None:
-            self.db = sqlite3.connect(self.filename)
+    @property
+    def db(self):
+        """
+        The connection passed as `database` or a (per thread) read-only
+        connection to the database file.
+        """
+        if self._db is not None:
+            return self._db
+        return connections.connection(self.filename,
+                                      immutable=self._immutable)
 
     @classmethod
     def default_db_filename(cls, taxid):
@@ -687,12 +947,68 @@ class STRING(PPIDatabase):
             """, (id,))
         return cur.fetchall()
 
-    def all_edges_annotated(self, taxid=None):
-        res = []
-        for id in self.ids(taxid):
-            res.extend(self.edges_annotated(id))
+    def edges_many(self, ids, min_score=None, internal=False):
+        """
+        Return a list of all edges (3-tuples (id1, id2, score)) of any of
+        the `ids` (in a single query). If `internal` is True return only
+        edges between the `ids`.
+
+        """
+        _query_ids(self.db, ids)
+        query = """\
+            select links.protein_id1, links.protein_id2, links.score
+            from temp.query_ids join links
+                on links.protein_id1=query_ids.id
+            """
+        conditions, params = [], ()
+        if internal:
+            conditions.append("links.protein_id2 in temp.query_ids")
+        if min_score is not None:
+            conditions.append("links.score >= ?")
+            params = (min_score,)
+        if conditions:
+            query += "where " + " and ".join(conditions)
+        return list(self.db.execute(query, params))
+
+    def synonyms_many(self, ids):
+        """
+        Return a dictionary of synonyms of all `ids` (in a single query).
+        """
+        ids = list(ids)
+        res = dict((id, []) for id in ids)
+        _query_ids(self.db, ids)
+        cur = self.db.execute("""\
+            select aliases.protein_id, aliases.alias
+            from temp.query_ids join aliases
+                on aliases.protein_id=query_ids.id
+            """)
+        for id, alias in cur:
+            res[id].append(alias)
         return res
 
+    def all_edges_annotated(self, taxid=None):
+        """
+        Return a list of all edges annotated (in a single query). If taxid
+        is not None return the edges for this organism only.
+
+        """
+        query = """\
+            select links.protein_id1, links.protein_id2, links.score,
+                   actions.action, actions.mode, actions.score
+            from links left join actions on
+                   links.protein_id1=actions.protein_id1 and
+                   links.protein_id2=actions.protein_id2
+            """
+        if taxid is not None:
+            query += """\
+            where links.protein_id1 in
+                (select protein_id from proteins where taxid=?)
+            """
+            cur = self.db.execute(query, (taxid,))
+        else:
+            cur = self.db.execute(query)
+        return [STRINGInteraction._make(row) for row in cur]
+
     def edges_annotated(self, id):
         cur = self.db.execute("""\
             select links.protein_id1, links.protein_id2, links.score,
@@ -993,6 +1309,9 @@ class STRINGDetailed(STRING):
         self.db_detailed = sqlite3.connect(detailed_database)
         self.db_detailed.execute("ATTACH DATABASE ? as string", (db_file,))
 
+    def all_edges_annotated(self, taxid=None):
+        return PPIDatabase.all_edges_annotated(self, taxid)
+
     def edges_annotated(self, id):
         edges = STRING.edges_annotated(self, id)
         edges_nc = []
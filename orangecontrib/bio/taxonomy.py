@@ -2,8 +2,14 @@ from __future__ import absolute_import, division
 
 import os
 import sys
+import time
+import sqlite3
+import threading
+import functools
 import warnings
 
+from collections import OrderedDict
+
 try:
     import cPickle as pickle
 except ImportError:
@@ -115,10 +121,80 @@ class UnknownSpeciesIdentifier(Exception):
     pass
 
 
+class _KeyedStore(object):
+    """
+    A persistent (SQLite) store of pickled values keyed by pickled
+    argument tuples, with one row per key. Rows of other versions are
+    ignored (and removed when the version changes). Errors are ignored;
+    the store only caches values.
+    """
+    def __init__(self, filename, maxSize=10000,
+                 pickleprotocol=pickle.HIGHEST_PROTOCOL):
+        self.filename = filename
+        self.maxSize = maxSize
+        self.pickleprotocol = pickleprotocol
+        self._con = None
+        self._version = None
+
+    def _connection(self):
+        if self._con is None:
+            con = sqlite3.connect(self.filename, timeout=30,
+                                  check_same_thread=False,
+                                  isolation_level=None)
+            con.execute("CREATE TABLE IF NOT EXISTS cache "
+                        "(key BLOB PRIMARY KEY, version TEXT, value BLOB)")
+            self._con = con
+        return self._con
+
+    def set_version(self, version):
+        if version != self._version:
+            self._version = version
+            try:
+                self._connection().execute(
+                    "DELETE FROM cache WHERE version != ?", (version,))
+            except sqlite3.Error:
+                pass
+
+    def get(self, key):
+        """Return a tuple (True, value) or (False, None) if missing."""
+        try:
+            row = self._connection().execute(
+                "SELECT value FROM cache WHERE key = ? AND version = ?",
+                (sqlite3.Binary(key), self._version)).fetchone()
+        except sqlite3.Error:
+            return False, None
+        if row is None:
+            return False, None
+        try:
+            return True, pickle.loads(bytes(row[0]))
+        except Exception:
+            return False, None
+
+    def set(self, key, value):
+        try:
+            con = self._connection()
+            con.execute(
+                "INSERT OR REPLACE INTO cache (key, version, value) "
+                "VALUES (?, ?, ?)",
+                (sqlite3.Binary(key), self._version,
+                 sqlite3.Binary(pickle.dumps(value, self.pickleprotocol))))
+            con.execute(
+                "DELETE FROM cache WHERE rowid <= "
+                "(SELECT max(rowid) FROM cache) - ?", (self.maxSize,))
+        except (sqlite3.Error, pickle.PicklingError, TypeError):
+            pass
+
+
 def pickled_cache(filename=None, dependencies=[], version=1, maxSize=30,
-                  pickleprotocol=pickle.HIGHEST_PROTOCOL):
+                  pickleprotocol=pickle.HIGHEST_PROTOCOL, maxDiskSize=10000):
     """
     Return a persistent cache function decorator.
+
+    Results are kept in an in-memory LRU cache (of `maxSize` entries)
+    over an SQLite store (of `maxDiskSize` entries) with one row per
+    argument tuple. The cache is invalidated when the `version` or the
+    datetime of any of the `dependencies` (a list of (domain, filename)
+    server files) changes; these are checked at most once a second.
     """
     def datetime_info(domain, filename):
         try:
@@ -131,49 +207,71 @@ def pickled_cache(filename=None, dependencies=[], version=1, maxSize=30,
         if filename is None:
             cache_filename = os.path.join(
                 environ.buffer_dir, func.__module__ + "_" + func.__name__ +
-                "_" + pytag + "_cache.pickle")
+                "_" + pytag + "_cache.sqlite")
         else:
             cache_filename = filename
 
-        def f(*args, **kwargs):
-            currentVersion = tuple([datetime_info(domain, file)
-                                    for domain, file in dependencies] +
-                                    [version, pytag])
-            try:
-                with open(cache_filename, "rb") as f:
-                    cachedVersion, cache = pickle.load(f)
-            except (OSError, IOError) as er:
-                cachedVersion, cache = "no version", {}
-            except ValueError as er:
-                # unknown pickle format
-                cachedVersion, cache = "no version", {}
-            except Exception as er:
-                warnings.warn(
-                    "An error occurred while reading cache, using empty cache",
-                    UserWarning)
-                cachedVersion, cache = "no version", {}
-            else:
-                if cachedVersion != currentVersion:
-                    cachedVersion, cache = "no version", {}
+        store = _KeyedStore(cache_filename, maxDiskSize, pickleprotocol)
+        memory = OrderedDict()
+        lock = threading.RLock()
+        state = {"version": None, "checked": 0.0}
+
+        def check_version():
+            now = time.time()
+            if now - state["checked"] < 1.0:
+                return
+            currentVersion = repr(tuple([datetime_info(domain, file)
+                                         for domain, file in dependencies] +
+                                        [version, pytag]))
+            if currentVersion != state["version"]:
+                memory.clear()
+                store.set_version(currentVersion)
+                state["version"] = currentVersion
+            state["checked"] = now
 
+        def f(*args, **kwargs):
             allArgs = args + tuple([(key, tuple(value) if type(value) in [set, list] else value)\
-                                     for key, value in kwargs.items()])
-            if allArgs in cache:
-                return cache[allArgs]
-            else:
-                res = func(*args, **kwargs)
-                if len(cache) > maxSize:
-                    del cache[next(iter(cache))]
-                cache[allArgs] = res
+                                     for key, value in sorted(kwargs.items())])
+            with lock:
+                check_version()
                 try:
-                    with open(cache_filename, "wb") as f:
-                        pickle.dump((currentVersion, cache), f,
-                                    protocol=pickleprotocol)
-                except (OSError, IOError) as err:
+                    res = memory.pop(allArgs)
+                except KeyError:
                     pass
+                except TypeError:  # unhashable arguments
+                    return func(*args, **kwargs)
+                else:
+                    memory[allArgs] = res
+                    return res
+
+                key = pickle.dumps(allArgs, 2)
+                found, res = store.get(key)
+                cacheVersion = state["version"]
+
+            # compute without the lock so other calls are not blocked
+            if not found:
+                res = func(*args, **kwargs)
 
-                return res
-        return f
+            with lock:
+                if state["version"] != cacheVersion:
+                    # invalidated in the meantime
+                    return res
+                if not found:
+                    store.set(key, res)
+                memory[allArgs] = res
+                if len(memory) > maxSize:
+                    memory.popitem(last=False)
+            return res
+
+        def cache_clear():
+            """Clear the in-memory cache."""
+            with lock:
+                memory.clear()
+                state["checked"] = 0.0
+
+        f.cache_clear = cache_clear
+        f.__wrapped__ = func
+        return functools.wraps(func)(f)
 
     return cached
 
@@ -0,0 +1,52 @@
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from orangecontrib.bio import biomart
+
+
+class TestResponseCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.cache = biomart.ResponseCache(
+            os.path.join(self.tmpdir, "cache.sqlite"), max_size=3500)
+
+    def tearDown(self):
+        self.cache.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_get_set(self):
+        self.assertIsNone(self.cache.get("url"))
+        data = b"ensembl\tEnsembl genes\n" * 100
+        self.cache.set("url", "meta", data, {"a": "b"}, "url", 200)
+        self.assertEqual(self.cache.get("url"), (data, {"a": "b"}, "url", 200))
+
+        # shared by other connections (processes)
+        other = biomart.ResponseCache(self.cache.filename)
+        self.assertEqual(other.get("url")[0], data)
+        other.close()
+
+        self.cache.clear()
+        self.assertIsNone(self.cache.get("url"))
+
+    def test_expire(self):
+        self.cache.TTL = {"data": -1}
+        self.cache.set("url", "data", b"data", {}, "url", 200)
+        self.assertIsNone(self.cache.get("url"))
+
+    def test_evict(self):
+        data = os.urandom(1000)  # incompressible
+        for i in range(3):
+            self.cache.set("url%i" % i, "data", data, {}, "url", 200)
+            time.sleep(0.01)
+        self.cache.get("url0")  # url1 is now the least recently used
+        self.cache.set("url3", "data", data, {}, "url", 200)
+        self.assertIsNone(self.cache.get("url1"))
+        for key in ["url0", "url2", "url3"]:
+            self.assertEqual(self.cache.get(key)[0], data)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from orangecontrib.bio import gene
+
+
+GROUPS = [set(["ABC1", "abc-1", "P001"]),
+          set(["XYZ", "xyz2", "P002"]),
+          set(["Abc1", "Q003"]),
+          set(["dup", "P004"]),
+          set(["DUP", "P005"])]
+
+
+class TestAliasIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def assertSameMapping(self, index, lower):
+        mapping = gene.create_mapping(GROUPS, lower=lower)
+        self.assertEqual(len(index), len(mapping))
+        for alias, ids in list(mapping.items()):
+            self.assertEqual(index[alias], ids)
+        self.assertEqual(index["missing"], set())
+        self.assertNotIn("missing", index)
+
+    def test_index(self):
+        for lower in [False, True]:
+            index = gene.AliasIndex.build(GROUPS, lower=lower)
+            self.assertSameMapping(index, lower)
+            path = os.path.join(self.tmpdir, "index%i" % lower)
+            index.save(path, "v1")
+            self.assertSameMapping(gene.AliasIndex.load(path), lower)
+
+    def test_pickled_matcher(self):
+        class Matcher(gene.MatcherAliasesPickled):
+            def filename(self):
+                return (os.path.join(tmpdir, "aliases"),)
+
+            def create_aliases_version(self):
+                return "1"
+
+            def create_aliases(self):
+                return GROUPS
+
+        tmpdir = self.tmpdir
+        targets = ["abc1", "P002", "dup"]
+        expected = gene.MatcherAliases(GROUPS).set_targets(targets)
+        for _ in range(2):
+            matcher = Matcher()
+            match = matcher.set_targets(targets)
+            self.assertIsInstance(matcher.mdict, gene.AliasIndex)
+            for g in ["ABC-1", "xyz", "Q003", "P004", "DUP", "none"]:
+                self.assertEqual(sorted(match.match(g)),
+                                 sorted(expected.match(g)))
+
+
+class TestMatchMany(unittest.TestCase):
+    def test_match_many(self):
+        targets = ["abc1", "P002", "dup", "P004", "other"]
+        genes = ["ABC-1", "xyz", "Q003", "DUP", "P004", "none", "OTHER",
+                 "xyz"]
+        for matcher in [gene.MatcherAliases(GROUPS),
+                        gene.matcher([gene.MatcherAliases(GROUPS)]),
+                        gene.MatcherDirect()]:
+            matcher.set_targets(targets)
+            expected = [matcher.umatch(g) for g in genes]
+            indices = matcher.match_many(genes)
+            self.assertEqual([targets[i] if i is not None else None
+                              for i in indices], expected)
+            self.assertEqual(matcher.match_many(genes), indices)
+
+
+GENE_INFO = [
+    "#Format: tax_id GeneID Symbol LocusTag Synonyms ...",
+    "9606\t1\tA1BG\t-\tA1B|ABG\t-\t19\t19q13.4\talpha-1-B glycoprotein",
+    "9606\t2\tA2M\t-\tA2MD|CPAMD5\t-\t12\t12p13.31\talpha-2-macroglobulin",
+    "9606\t3\tA2MP1\t-\tA2MD\t-\t12\t12p13.31\tpseudogene",
+    "9606\t4\tFOO\tLT4\t1|Foo-1\t-\t1\t1p1\tsynonym equal to a gene id",
+]
+
+
+class TestGeneInfoTable(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "gene_info.9606.db")
+        with open(self.filename, "wt") as f:
+            f.write("\n".join(GENE_INFO) + "\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_table(self):
+        table = gene.GeneInfoTable.open(self.filename, aliases=True)
+        self.assertTrue(gene.GeneInfoTable.is_fresh(table.path,
+                                                    self.filename))
+        self.assertEqual(table.keys(), ["1", "2", "3", "4"])
+        self.assertEqual(len(table), 4)
+        self.assertEqual(table.line("2"), GENE_INFO[2])
+        self.assertRaises(KeyError, table.line, "5")
+
+        info = gene.GeneInfoTableMapping(table, gene.GeneInfo)
+        self.assertEqual(info["1"].symbol, "A1BG")
+        self.assertEqual(info["1"].synonyms, ["A1B", "ABG"])
+        self.assertIs(info["1"], info["1"])
+        self.assertIn("3", info)
+        self.assertNotIn("5", info)
+
+        match = gene.MatchGeneInfoTable(table)
+        self.assertEqual(match.umatch("a1bg"), "1")
+        self.assertEqual(match.umatch("ABG"), "1")
+        self.assertEqual(match.umatch("2"), "2")
+        self.assertEqual(sorted(match.match("A2MD")), ["2", "3"])
+        self.assertIsNone(match.umatch("A2MD"))
+        self.assertEqual(match.match_many(["A2M", "A2MD", "x"]),
+                         [1, None, None])
+
+    def test_matcher(self):
+        # the default NCBIGeneInfo matcher, matcher([GMNCBI(taxid)])
+        infos = [gene.GeneInfo(line) for line in GENE_INFO[1:]]
+        aliases = [set(filter(None, [i.gene_id, i.symbol, i.locus_tag] +
+                                    i.synonyms)) for i in infos]
+        default = gene.matcher([gene.MatcherAliases(aliases)])
+        table = gene.GeneInfoTable.open(self.filename, aliases=True)
+        indexed = gene.MatcherGeneInfoTable(table)
+
+        genes = ["1", "a1bg", "ABG", "A2MD", "a2md", "FOO", "lt4", "foo-1",
+                 "4", "missing"]
+        for targets in [table.keys(), ["2", "4"], ["1", "3", "a1bg"]]:
+            default.set_targets(targets)
+            match = indexed.set_targets(targets)
+            for g in genes:
+                self.assertEqual(indexed.umatch(g), default.umatch(g))
+                self.assertEqual(sorted(indexed.match(g)),
+                                 sorted(default.match(g)))
+                self.assertEqual(
+                    sorted((sorted(t), sorted(a))
+                           for t, a in indexed.explain(g)),
+                    sorted((sorted(t), sorted(a))
+                           for t, a in default.explain(g)))
+            self.assertEqual(match.match_many(genes),
+                             default.match_many(genes))
+
+        indexed.set_targets(table.keys())
+        # a gene id is matched directly, before the synonym of gene 4
+        self.assertEqual(indexed.umatch("1"), "1")
+        # ambiguous symbols
+        self.assertIsNone(indexed.umatch("A2MD"))
+        self.assertIsNone(indexed.umatch("FOO"))
+
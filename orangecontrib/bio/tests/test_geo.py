@@ -0,0 +1,124 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+import warnings
+
+import numpy
+
+from orangecontrib.bio import geo
+
+
+SOFT = """^DATABASE = Geo
+!Database_name = Gene Expression Omnibus (GEO)
+^DATASET = GDS1
+!dataset_title = A test data set
+!dataset_sample_organism = Homo sapiens
+!dataset_sample_count = 4
+!dataset_feature_count = 5
+^SUBSET = GDS1_1
+!subset_dataset_id = GDS1
+!subset_description = control
+!subset_sample_id = GSM1,GSM2
+!subset_type = agent
+^SUBSET = GDS1_2
+!subset_dataset_id = GDS1
+!subset_description = treated
+!subset_sample_id = GSM3,GSM4
+!subset_type = agent
+^DATASET = GDS1
+#ID_REF = Platform reference identifier
+!dataset_table_begin
+ID_REF\tIDENTIFIER\tGSM1\tGSM2\tGSM3\tGSM4
+S1\tA\t1\t2\t3\t4
+S2\tA\t3\tnull\t5\t6
+S3\tB\t7\t8\t9\t10
+S4\tC\tnull\tnull\tnull\t1
+S5\tB\t1\t2\tnull\t4
+!dataset_table_end
+"""
+
+
+class TestGDS(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        filename = os.path.join(self.tmpdir, "GDS1.soft.gz")
+        with gzip.open(filename, "wb") as f:
+            f.write(SOFT.encode("utf-8"))
+        # GDS.__init__ would download the file and look up the taxonomy
+        self.gds = geo.GDS.__new__(geo.GDS)
+        self.gds.filename = filename
+        self.gds.verbose = False
+        self.gds._read_soft()
+        self.gds._set_spots()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_info(self):
+        info = self.gds.info
+        self.assertEqual(info["dataset_id"], "GDS1")
+        self.assertEqual(info["sample_organism"], "Homo sapiens")
+        self.assertEqual(info["sample_count"], 4)
+        self.assertEqual(info["samples"], ["GSM1", "GSM2", "GSM3", "GSM4"])
+        self.assertEqual([s["description"] for s in info["subsets"]],
+                         ["control", "treated"])
+        self.assertEqual(self.gds.genes, ["A", "B", "C"])
+        self.assertEqual(self.gds.gene2spots["B"], ["S3", "S5"])
+
+    def test_genes(self):
+        data = self.gds.getdata()
+        self.assertEqual([str(row[0]) for row in data.metas],
+                         ["A", "B", "C"])
+        numpy.testing.assert_array_equal(
+            data.X, [[2, 2, 4, 5], [4, 5, 9, 7],
+                     [numpy.nan, numpy.nan, numpy.nan, 1]])
+        self.assertEqual(data.domain.attributes[2].attributes,
+                         {"agent": "treated"})
+
+        data = self.gds.getdata(merge_function=geo.spots_max)
+        numpy.testing.assert_array_equal(data.X[:2],
+                                         [[3, 2, 5, 6], [7, 8, 9, 10]])
+        data = self.gds.getdata(merge_function=geo.spots_median)
+        numpy.testing.assert_array_equal(data.X[1], [4, 5, 9, 7])
+
+    def test_spots(self):
+        data = self.gds.getdata(report_genes=False)
+        self.assertEqual([str(row[0]) for row in data.metas],
+                         ["S1", "S2", "S3", "S4", "S5"])
+        numpy.testing.assert_array_equal(data.X[1], [3, numpy.nan, 5, 6])
+
+    def test_transpose(self):
+        data = self.gds.getdata(transpose=True)
+        self.assertEqual([a.name for a in data.domain.attributes],
+                         ["A", "B", "C"])
+        self.assertEqual(data.domain.class_var.name, "agent")
+        self.assertEqual([data.domain.class_var.values[int(y)]
+                          for y in data.Y],
+                         ["control", "control", "treated", "treated"])
+        numpy.testing.assert_array_equal(data.X[:, 0], [2, 2, 4, 5])
+
+    def test_remove_unknown(self):
+        data = self.gds.getdata(remove_unknown=0.5)
+        self.assertEqual([str(row[0]) for row in data.metas], ["A", "B"])
+        self.assertEqual(self.gds.spots, ["S1", "S2", "S3", "S5"])
+
+        data = self.gds.getdata(report_genes=False, remove_unknown=0.2)
+        self.assertEqual([str(row[0]) for row in data.metas], ["S1", "S3"])
+
+        data = self.gds.getdata()
+        self.assertEqual(len(data), 3)
+
+    def test_deprecated(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore", DeprecationWarning)
+            self.gds._parse_soft(remove_unknown=0.5)
+            self.gds._getspotmap(include_spots=set(self.gds.gdsdata))
+        self.assertEqual(sorted(self.gds.gdsdata), ["S1", "S2", "S3", "S5"])
+        self.assertEqual(self.gds.gdsdata["S1"].data, [1, 2, 3, 4])
+        self.assertEqual(self.gds.genes, ["A", "B"])
+
+
+if __name__ == "__main__":
+    unittest.main()
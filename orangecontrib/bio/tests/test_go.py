@@ -0,0 +1,205 @@
+import os
+import shutil
+import tempfile
+import unittest
+import random
+import warnings
+
+from six import StringIO
+
+from orangecontrib.bio import go
+
+
+def random_ontology(nterms, rand):
+    stanzas = ["format-version: 1.2\n"]
+    for i in range(nterms):
+        stanza = "[Term]\nid: GO:%07i\nname: term %i\n" % (i, i)
+        if i > 0:
+            for parent in set(rand.sample(range(i), min(i, 2))):
+                stanza += "is_a: GO:%07i\n" % parent
+        stanzas.append(stanza)
+    return go.Ontology(StringIO("\n".join(stanzas) + "\n"))
+
+
+def random_annotations(ontology, ngenes, nannotations, rand,
+                       columnar=False, missing_terms=()):
+    terms = sorted(ontology.terms)
+    # annotations of genes G0, G1, ... to terms not in the ontology
+    lines = ["\t".join(["DB", "G%i" % i, "G%i" % i, "", term, "ref", "IDA",
+                        "", "P", "", "", "gene", "taxon:1", "", "", "", ""])
+             for i, term in enumerate(missing_terms)]
+    for _ in range(nannotations):
+        gene = "G%i" % rand.randrange(ngenes)
+        fields = ["DB", gene, gene, "", rand.choice(terms), "ref",
+                  rand.choice(["IDA", "IEA", "TAS"]), "",
+                  rand.choice(["P", "F", "C"]), "", "", "gene",
+                  "taxon:1", "", "", "", ""]
+        lines.append("\t".join(fields))
+    return go.Annotations(StringIO("\n".join(lines) + "\n"),
+                          ontology=ontology,
+                          genematcher=go.obiGene.GMDirect(),
+                          columnar=columnar)
+
+
+class TestEnrichment(unittest.TestCase):
+    def setUp(self):
+        rand = random.Random(42)
+        self.ontology = random_ontology(60, rand)
+        self.annotations = random_annotations(self.ontology, 80, 400, rand)
+        genes = sorted(self.annotations.gene_names)
+        self.genes = rand.sample(genes, 15)
+        self.reference = rand.sample(genes, 60)
+
+    def assertSameEnrichment(self, **kwargs):
+        indexed = self.annotations.get_enriched_terms(
+            self.genes, use_index=True, **kwargs)
+        reference = self.annotations.get_enriched_terms(
+            self.genes, use_index=False, **kwargs)
+        self.assertEqual(set(indexed), set(reference))
+        for term in reference:
+            genes, p, ref = indexed[term]
+            genes_r, p_r, ref_r = reference[term]
+            self.assertEqual(sorted(genes), sorted(genes_r))
+            self.assertAlmostEqual(p, p_r)
+            self.assertEqual(ref, ref_r)
+
+    def test_index(self):
+        self.assertSameEnrichment()
+        self.assertSameEnrichment(reference=self.reference)
+        self.assertSameEnrichment(evidence_codes=["IDA", "TAS"], aspect="P")
+        self.assertSameEnrichment(reference=self.reference,
+                                  prob=go.stats.Hypergeometric(),
+                                  use_fdr=False)
+
+    def test_missing_terms(self):
+        rand = random.Random(0)
+        annotations = random_annotations(self.ontology, 80, 400, rand,
+                                         missing_terms=["GO:9999999"])
+        genes = ["G0"] + self.genes
+        for use_index in [True, False]:
+            progress = []
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter("always")
+                annotations.get_enriched_terms(
+                    genes, use_index=use_index,
+                    progress_callback=progress.append)
+            self.assertEqual(len(w), 1)
+            self.assertIn("'GO:9999999'", str(w[0].message))
+            self.assertEqual(progress, sorted(progress))
+            if use_index:
+                self.assertEqual(progress, [0.0, 100.0])
+
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            annotations.get_enriched_terms(self.genes[1:])
+        self.assertEqual(len([x for x in w if "GO:9999999" in
+                              str(x.message)]), 0)
+
+    def test_progress(self):
+        progress = []
+        self.annotations.get_enriched_terms(
+            self.genes, progress_callback=progress.append)
+        self.assertEqual(progress, [0.0, 100.0])
+
+    def test_index_cache(self):
+        index = self.annotations.get_term_gene_index(aspect="F")
+        self.assertIs(index, self.annotations.get_term_gene_index(aspect="F"))
+        self.annotations.add_annotation(self.annotations[0])
+        self.assertIsNot(index,
+                         self.annotations.get_term_gene_index(aspect="F"))
+
+
+class TestColumnar(unittest.TestCase):
+    def setUp(self):
+        self.ontology = random_ontology(40, random.Random(1))
+        self.annotations = random_annotations(
+            self.ontology, 30, 200, random.Random(2))
+        self.columnar = random_annotations(
+            self.ontology, 30, 200, random.Random(2), columnar=True)
+
+    def test_records(self):
+        self.assertIsInstance(self.columnar.annotations, go.AnnotationTable)
+        self.assertEqual(len(self.columnar), len(self.annotations))
+        self.assertEqual(list(self.columnar), list(self.annotations))
+        self.assertEqual(self.columnar[-1], self.annotations[-1])
+        self.assertEqual(self.columnar.gene_names,
+                         self.annotations.gene_names)
+
+    def test_indexes(self):
+        for gene in self.annotations.gene_names:
+            self.assertEqual(self.columnar.gene_annotations[gene],
+                             self.annotations.gene_annotations[gene])
+        self.assertEqual(self.columnar.gene_annotations["missing"], [])
+        self.assertEqual(set(self.columnar.term_anotations),
+                         set(self.annotations.term_anotations))
+
+    def test_all_genes(self):
+        for term in self.ontology.terms:
+            self.assertEqual(
+                sorted(self.columnar.get_all_genes(term, ["IDA", "IEA"])),
+                sorted(self.annotations.get_all_genes(term, ["IDA", "IEA"])))
+            self.assertEqual(self.columnar.get_all_annotations(term),
+                             self.annotations.get_all_annotations(term))
+
+    def test_enrichment(self):
+        def enriched(annotations, genes, use_index):
+            # the genes of a term are listed in (arbitrary) set order
+            res = annotations.get_enriched_terms(genes, use_index=use_index)
+            return dict((term, (sorted(genes), p, ref))
+                        for term, (genes, p, ref) in res.items())
+
+        genes = sorted(self.annotations.gene_names)[:10]
+        for use_index in [True, False]:
+            self.assertEqual(enriched(self.columnar, genes, use_index),
+                             enriched(self.annotations, genes, use_index))
+
+
+class TestSnapshot(unittest.TestCase):
+    def setUp(self):
+        rand = random.Random(0)
+        self.ontology = random_ontology(30, rand)
+        self.annotations = random_annotations(self.ontology, 20, 100, rand)
+        self.tmpdir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _write(self, filename, lines):
+        filename = os.path.join(self.tmpdir, filename)
+        with open(filename, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        return filename
+
+    def test_ontology(self):
+        filename = self._write(
+            "go.obo",
+            [self.ontology.header] + [repr(t) for t in
+                                      self.ontology.terms.values()])
+        parsed = go.Ontology(filename)
+        self.assertTrue(os.path.isdir(filename + ".snapshot"))
+        loaded = go.Ontology(filename)
+        self.assertEqual(loaded.header, parsed.header)
+        self.assertEqual(set(loaded.terms), set(parsed.terms))
+        self.assertEqual(set(loaded.typedefs), set(parsed.typedefs))
+        for id, term in parsed.terms.items():
+            self.assertEqual(loaded[id]._lines, term._lines)
+            self.assertEqual(loaded[id].related_to, term.related_to)
+            self.assertEqual(loaded[id].name, term.name)
+
+    def test_annotations(self):
+        filename = self._write(
+            "gene_association",
+            ["!gaf-version: 2.0"] +
+            ["\t".join(a) for a in self.annotations.annotations])
+        parsed = go.Annotations(filename, ontology=self.ontology,
+                                genematcher=go.obiGene.GMDirect())
+        loaded = go.Annotations(filename, ontology=self.ontology,
+                                genematcher=go.obiGene.GMDirect())
+        self.assertEqual(loaded.header, parsed.header)
+        self.assertEqual(loaded.annotations, parsed.annotations)
+        self.assertEqual(loaded.get_all_genes("GO:0000000"),
+                         parsed.get_all_genes("GO:0000000"))
+        columnar = go.Annotations(filename, ontology=self.ontology,
+                                  genematcher=go.obiGene.GMDirect(),
+                                  columnar=True)
+        self.assertEqual(list(columnar), parsed.annotations)
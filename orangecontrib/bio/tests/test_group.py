@@ -0,0 +1,53 @@
+import unittest
+
+import numpy
+
+from orangecontrib.bio.utils import group
+
+
+class TestDistanceMatrix(unittest.TestCase):
+    def setUp(self):
+        rand = numpy.random.RandomState(0)
+        X = rand.randn(40, 24)
+        X[rand.rand(*X.shape) < 0.1] = numpy.nan
+        self.ids = [[i, i + 1, None] if i % 3 else [i, i + 1, i + 2]
+                    for i in range(0, 22)]
+        self.P = group.profile_matrix(X, self.ids)
+        self.lists = [[None if numpy.isnan(v) else v for v in row]
+                      for row in self.P]
+
+    def test_profiles(self):
+        self.assertEqual(self.P.shape, (len(self.ids), 3 * 40))
+        self.assertTrue(numpy.isnan(self.P[1, 80:]).all())
+
+    def test_distances(self):
+        for metric, dist in [("pearson", group.dist_pcorr),
+                             ("spearman", group.dist_spearman),
+                             ("euclidean", group.dist_eucl)]:
+            D = group.distance_matrix(self.P, metric, block_size=5)
+            for i, l1 in enumerate(self.lists):
+                for j, l2 in enumerate(self.lists):
+                    if i != j:
+                        self.assertAlmostEqual(D[i, j], dist(l1, l2))
+            numpy.testing.assert_array_equal(D, D.T)
+        self.assertRaises(ValueError, group.distance_matrix, self.P, "x")
+
+    def test_distances_to(self):
+        rows = [3, 0, 7]
+        for metric in ["pearson", "spearman", "euclidean"]:
+            D = group.distances_to(self.P, rows, metric, block_size=2)
+            numpy.testing.assert_allclose(
+                D, group.distance_matrix(self.P, metric)[rows])
+
+    def test_spearman_ties(self):
+        rand = numpy.random.RandomState(1)
+        P = rand.randint(0, 4, size=(30, 20)).astype(float)
+        P[rand.rand(*P.shape) < 0.2] = numpy.nan
+        P[0, 1:] = numpy.nan  # a single known value
+        lists = [[None if numpy.isnan(v) else v for v in row] for row in P]
+        D = group.distance_matrix(P, "spearman", block_size=7)
+        for i in range(1, len(P)):
+            for j in range(i + 1, len(P)):
+                self.assertAlmostEqual(D[i, j],
+                                       group.dist_spearman(lists[i], lists[j]))
+        self.assertTrue(numpy.isnan(D[0, 1:]).all())
@@ -0,0 +1,145 @@
+import unittest
+import random
+import warnings
+
+import numpy
+import orange
+
+from orangecontrib.bio import gsea
+
+
+def random_problem(seed, ngenes=60, nsubsets=8):
+    rand = random.Random(seed)
+    ranking = [rand.gauss(0, 1) for _ in range(ngenes)]
+    subsets = [rand.sample(range(ngenes), rand.randint(2, 20))
+               for _ in range(nsubsets)]
+    # a single gene and an empty gene set
+    subsets += [[rand.randrange(ngenes)], []]
+    return ranking, subsets
+
+
+def expression_table(seed, nexamples=20, ngenes=40):
+    """An expression table of two classes with unknown values."""
+    rand = numpy.random.RandomState(seed)
+    X = numpy.ma.masked_array(rand.normal(size=(nexamples, ngenes)),
+                              rand.uniform(size=(nexamples, ngenes)) < 0.05)
+    y = numpy.array([0] * (nexamples // 2) + [1] * (nexamples - nexamples // 2))
+    domain = orange.Domain(
+        [orange.FloatVariable("g%i" % i) for i in range(ngenes)],
+        orange.EnumVariable("class", values=["a", "b"]))
+    return orange.ExampleTable(domain, numpy.ma.column_stack([X, y]))
+
+
+class TestEnrichmentScores(unittest.TestCase):
+    def legacy_scores(self, subsets, ranking, p=1.0):
+        ordered = gsea.orderedPointersCorr(ranking)
+        return [gsea.enrichmentScoreRanked(subset, ranking, ordered, p=p)[0]
+                for subset in subsets]
+
+    def test_batch_scores(self):
+        for seed in range(5):
+            ranking, subsets = random_problem(seed)
+            membership = gsea.subsetsMembership(subsets)
+            for p in [1.0, 0.5, 2.0]:
+                es = gsea.enrichmentScoresBatch(membership, [ranking], p=p)
+                numpy.testing.assert_allclose(
+                    es[:, 0], self.legacy_scores(subsets, ranking, p=p),
+                    atol=1e-12)
+        self.assertEqual(es[-1, 0], 0.0)
+
+    def test_batch_nulls(self):
+        ranking, subsets = random_problem(0)
+        rankings = [gsea.shuffleList(ranking, random.Random(i))
+                    for i in range(10)]
+        membership = gsea.subsetsMembership(subsets)
+        calls = []
+        # a small block to split the permutations
+        nulls = gsea.enrichmentNullsBatch(
+            lambda i: rankings[i], range(10), membership,
+            callback=lambda: calls.append(1), block=50)
+        expected = numpy.array(
+            [self.legacy_scores(subsets, r) for r in rankings]).T
+        numpy.testing.assert_allclose(nulls, expected, atol=1e-12)
+        self.assertEqual(len(calls), 10)
+
+    def test_gsea_engines(self):
+        ranking, subsets = random_problem(1)
+        rankingf = lambda data: ranking
+
+        legacy = list(gsea.gseaE(None, subsets, rankingf=rankingf, n=20,
+                                 permutation="genes"))
+        numpy_engine = list(gsea.gseaE(None, subsets, rankingf=rankingf,
+                                       n=20, permutation="genes",
+                                       engine="numpy"))
+        numpy.testing.assert_allclose(numpy_engine, legacy, atol=1e-12)
+
+        batch = list(gsea.gseaBatch(
+            ranking, subsets, 20,
+            lambda i: gsea.shuffleList(ranking,
+                                       random.Random(gsea.permutationSeed(i)))))
+        numpy.testing.assert_allclose(batch, legacy, atol=1e-12)
+        numpy.testing.assert_allclose(
+            list(gsea.gseaR(ranking, subsets, 20, engine="numpy")),
+            legacy, atol=1e-12)
+
+
+class TestParallelNulls(unittest.TestCase):
+    def test_gene_permutations(self):
+        ranking, subsets = random_problem(2)
+        membership = gsea.subsetsMembership(subsets)
+        nulls1 = gsea.enrichmentNullsParallel(ranking, None, 15, membership,
+                                              n_jobs=1)
+        nulls2 = gsea.enrichmentNullsParallel(ranking, None, 15, membership,
+                                              n_jobs=2)
+        numpy.testing.assert_array_equal(nulls1, nulls2)
+        expected = gsea.enrichmentNullsBatch(
+            lambda i: gsea.shuffleList(ranking,
+                                       random.Random(gsea.permutationSeed(i))),
+            range(15), membership)
+        numpy.testing.assert_array_equal(nulls1, expected)
+
+        es = gsea.enrichmentScoresBatch(membership, [ranking])[:, 0].tolist()
+        self.assertEqual(list(gsea.gseaSignificance(es, nulls1.tolist())),
+                         list(gsea.gseaSignificance(es, nulls2.tolist())))
+
+    def test_class_permutations(self):
+        rand = numpy.random.RandomState(0)
+        X = rand.normal(size=(12, 40))
+        X[rand.uniform(size=X.shape) < 0.05] = numpy.nan
+        labels = numpy.array([0] * 6 + [1] * 6)
+        _, subsets = random_problem(3, ngenes=40)
+        membership = gsea.subsetsMembership(subsets)
+        calls = []
+        nulls1 = gsea.enrichmentNullsParallel(X, labels, 9, membership,
+                                              n_jobs=1)
+        nulls2 = gsea.enrichmentNullsParallel(
+            X, labels, 9, membership, n_jobs=2,
+            callback=lambda: calls.append(1))
+        numpy.testing.assert_array_equal(nulls1, nulls2)
+        self.assertEqual(nulls1.shape, (len(subsets), 9))
+        self.assertEqual(len(calls), 9)
+
+    def test_gsea_class_permutations(self):
+        data = expression_table(4)
+        _, subsets = random_problem(4, ngenes=40)
+        serial = list(gsea.gseaE(data, subsets, n=9, engine="numpy"))
+        parallel = list(gsea.gseaE(data, subsets, n=9, n_jobs=2))
+        self.assertEqual(serial, parallel)
+
+    def test_gsea_custom_ranking(self):
+        data = expression_table(5, ngenes=20)
+        _, subsets = random_problem(5, ngenes=20)
+        rankingf = gsea.rankingFromOrangeMeas(gsea.MA_signalToNoise())
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            serial = list(gsea.gseaE(data, subsets, rankingf=rankingf, n=4,
+                                     engine="numpy"))
+            self.assertEqual(len(w), 0)
+            parallel = list(gsea.gseaE(data, subsets, rankingf=rankingf,
+                                       n=4, n_jobs=2))
+            self.assertEqual(len(w), 1)
+        self.assertEqual(serial, parallel)
+
+
+if __name__ == "__main__":
+    unittest.main()
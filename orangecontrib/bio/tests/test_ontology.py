@@ -61,3 +61,69 @@ name: bar
                                         extraglobs={"term": term},
                                         optionflags=doctest.ELLIPSIS))
     return tests
+
+class TestClosureIndex(unittest.TestCase):
+    def setUp(self):
+        stanzas = ["format-version: 1.2\n"]
+        for i in range(40):
+            stanza = "[Term]\nid: T:%03i\nname: term %i\n" % (i, i)
+            for parent in set([i // 2, i // 3]) - set([i]):
+                stanza += "is_a: T:%03i\n" % parent
+            if i % 5 == 4:
+                stanza += "relationship: part_of T:%03i\n" % (i - 1)
+            stanzas.append(stanza)
+        self.obo = "\n".join(stanzas) + "\n"
+
+    def test_closure(self):
+        plain = ontology.OBOOntology(StringIO(self.obo))
+        indexed = ontology.OBOOntology(StringIO(self.obo), closure_index=True)
+        ids = lambda terms: sorted(t.id for t in terms)
+        for term in plain.terms():
+            self.assertEqual(ids(plain.super_terms(term.id)),
+                             ids(indexed.super_terms(term.id)))
+            self.assertEqual(ids(plain.sub_terms(term.id)),
+                             ids(indexed.sub_terms(term.id)))
+            self.assertEqual(ids(plain.parent_terms(term.id)),
+                             ids(indexed.parent_terms(term.id)))
+
+        # the index is rebuilt after the ontology changes
+        index = indexed.closure_index()
+        indexed.add_object(ontology.OBOObject("Term", id="T:100",
+                                              is_a="T:039"))
+        self.assertIsNot(index, indexed.closure_index())
+        self.assertEqual(ids(indexed.super_terms("T:100")),
+                         ids(plain.super_terms("T:039") |
+                             set([plain.term("T:039")])))
+
+    def test_persist(self):
+        import os
+        import shutil
+        import tempfile
+        tmpdir = tempfile.mkdtemp()
+        try:
+            filename = os.path.join(tmpdir, "test.obo")
+            with open(filename, "w") as f:
+                f.write(self.obo)
+            first = ontology.OBOOntology(filename, closure_index=True)
+            first.closure_index()
+            self.assertTrue(os.path.exists(filename + ".closure.npz"))
+            second = ontology.OBOOntology(filename, closure_index=True)
+            index = ontology.ClosureIndex.from_ontology(second)
+            loaded = second.closure_index()
+            for a, b in [(index.ancestors, loaded.ancestors),
+                         (index.descendants, loaded.descendants)]:
+                self.assertEqual(a[0].tolist(), b[0].tolist())
+                self.assertEqual(a[1].tolist(), b[1].tolist())
+
+            # a mutated ontology does not use the saved index
+            update = "format-version: 1.2\n\n[Term]\nid: T:039\nis_a: T:030\n"
+            plain = ontology.OBOOntology(StringIO(self.obo))
+            plain.update(ontology.OBOOntology(StringIO(update)))
+            third = ontology.OBOOntology(filename, closure_index=True)
+            third.update(ontology.OBOOntology(StringIO(update)))
+            ids = lambda terms: sorted(t.id for t in terms)
+            self.assertEqual(ids(third.super_terms("T:039")),
+                             ids(plain.super_terms("T:039")))
+            self.assertIn("T:030", ids(third.super_terms("T:039")))
+        finally:
+            shutil.rmtree(tmpdir)
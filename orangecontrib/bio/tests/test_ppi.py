@@ -0,0 +1,135 @@
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import unittest
+
+from orangecontrib.bio import ppi
+
+
+def random_string_db(nproteins, nlinks, rand, filename=":memory:"):
+    con = sqlite3.connect(filename)
+    ppi.STRING.clear_db(con)
+    ids = ["9606.P%i" % i for i in range(nproteins)]
+    con.executemany("INSERT INTO proteins VALUES (?, ?)",
+                    [(id, "9606") for id in ids])
+    con.executemany("INSERT INTO aliases VALUES (?, ?, ?)",
+                    [(id, alias, "src") for id in ids
+                     for alias in [id[5:], id[5:].lower()]])
+    links = set()
+    while len(links) < nlinks:
+        id1, id2 = rand.sample(ids, 2)
+        links.add((id1, id2, rand.randrange(150, 1000)))
+    # STRING stores links in both directions
+    con.executemany("INSERT INTO links VALUES (?, ?, ?)",
+                    list(links) + [(b, a, s) for a, b, s in links])
+    ppi.STRING.create_db_index(con)
+    con.commit()
+    if filename != ":memory:":
+        con.close()
+        return ppi.STRING(database=filename)
+    return ppi.STRING(database=con)
+
+
+class TestBulkQueries(unittest.TestCase):
+    def setUp(self):
+        self.rand = random.Random(0)
+        self.db = random_string_db(100, 300, self.rand)
+        self.ids = self.rand.sample(self.db.ids(), 20)
+
+    def test_edges_many(self):
+        for kwargs in [{}, {"min_score": 500}, {"internal": True},
+                       {"min_score": 500, "internal": True}]:
+            self.assertEqual(
+                sorted(self.db.edges_many(self.ids, **kwargs)),
+                sorted(ppi.PPIDatabase.edges_many(self.db, self.ids,
+                                                  **kwargs)))
+
+    def test_synonyms_many(self):
+        synonyms = self.db.synonyms_many(self.ids + ["missing"])
+        for id in self.ids:
+            self.assertEqual(sorted(synonyms[id]),
+                             sorted(self.db.synonyms(id)))
+        self.assertEqual(synonyms["missing"], [])
+
+    def test_subnetwork(self):
+        nodes, adjacency = self.db.subnetwork(self.ids[:3], min_score=300,
+                                              depth=1)
+        self.assertEqual(nodes[:3], self.ids[:3])
+        self.assertEqual(adjacency.shape, (len(nodes), len(nodes)))
+        self.assertEqual((adjacency != adjacency.T).nnz, 0)
+        neighbours = set(nodes[:3])
+        for id in self.ids[:3]:
+            neighbours.update(id2 for _, id2, score in self.db.edges(id)
+                              if score >= 300)
+        self.assertEqual(set(nodes), neighbours)
+        index = dict((id, i) for i, id in enumerate(nodes))
+        for id in nodes:
+            for _, id2, score in self.db.edges(id):
+                if id2 in index and score >= 300:
+                    self.assertEqual(adjacency[index[id], index[id2]], score)
+        self.assertEqual(adjacency.nnz,
+                         len(self.db.edges_many(nodes, 300, internal=True)))
+
+    def test_all_edges_annotated(self):
+        edges = self.db.all_edges_annotated("9606")
+        self.assertEqual(
+            sorted(edges),
+            sorted(ppi.PPIDatabase.all_edges_annotated(self.db, "9606")))
+
+
+class TestConnections(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.tmpdir, "string.sqlite")
+        self.db = random_string_db(50, 100, random.Random(0), self.filename)
+
+    def tearDown(self):
+        ppi.connections.close()
+        shutil.rmtree(self.tmpdir)
+
+    def test_read_only(self):
+        con = self.db.db
+        self.assertIs(self.db.db, con)
+        self.assertRaises(sqlite3.OperationalError, con.execute,
+                          "DELETE FROM links")
+        # bulk queries use a temporary table
+        ids = self.db.ids()[:10]
+        self.assertTrue(self.db.edges_many(ids))
+
+    def test_threads(self):
+        cons = []
+        thread = threading.Thread(target=lambda: cons.append(self.db.db))
+        thread.start()
+        thread.join()
+        self.assertIsNot(cons[0], self.db.db)
+
+    def test_replaced(self):
+        con = ppi.connections.connection(self.filename, immutable=True)
+        self.assertEqual(len(self.db.ids()), 50)
+        self.assertIs(ppi.connections.connection(self.filename,
+                                                 immutable=True), con)
+
+        # a server files update replaces the file
+        filename = os.path.join(self.tmpdir, "string.sqlite.tmp")
+        random_string_db(30, 60, random.Random(1), filename)
+        os.rename(filename, self.filename)
+        con2 = ppi.connections.connection(self.filename, immutable=True)
+        self.assertIsNot(con2, con)
+        self.assertEqual(
+            con2.execute("SELECT COUNT(*) FROM proteins").fetchone()[0], 30)
+        self.assertEqual(len(self.db.ids()), 30)
+
+        os.remove(self.filename)
+        self.assertRaises(ValueError, ppi.connections.connection,
+                          self.filename, immutable=True)
+
+    def test_missing(self):
+        db = ppi.STRING(database=os.path.join(self.tmpdir, "missing"))
+        self.assertRaises(ValueError, db.ids)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,185 @@
+import bz2
+import gzip
+import io
+import os
+import shutil
+import tempfile
+import unittest
+
+from orangecontrib.bio.utils import serverfiles
+
+
+def _gzip(data):
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode="wb") as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+class _Response(io.BytesIO):
+    def __init__(self, content, status=200, headers=None):
+        io.BytesIO.__init__(self, content)
+        self.status = status
+        self.headers = {"content-length": str(len(content))}
+        self.headers.update(headers or {})
+
+
+class _ServerFiles(serverfiles.ServerFiles):
+    """
+    Serve `content` for all files (honouring Range and If-Range if
+    `ranges`).
+    """
+    def __init__(self, content, ranges=True, etag='"1"'):
+        serverfiles.ServerFiles.__init__(self)
+        self.content = content
+        self.ranges = ranges
+        self.etag = etag
+        self.requests = []
+
+    def info(self, domain, filename):
+        return {"size": str(len(self.content)), "datetime": "2016-01-01",
+                "title": filename, "tags": ["test"]}
+
+    def downloadFH(self, domain, filename, headers=None):
+        self.requests.append(headers)
+        etag = {"etag": self.etag} if self.etag else {}
+        if headers and self.ranges and \
+                headers.get("If-Range", self.etag) == self.etag:
+            start = int(headers["Range"][len("bytes="):-1])
+            etag["content-range"] = "bytes %i-%i/%i" % (
+                start, len(self.content) - 1, len(self.content))
+            return _Response(self.content[start:], status=206, headers=etag)
+        return _Response(self.content, headers=etag)
+
+
+class _Interrupted(_ServerFiles):
+    """Stop sending `content` after `length` bytes."""
+    def __init__(self, content, length, **kwargs):
+        _ServerFiles.__init__(self, content, **kwargs)
+        self.length = length
+
+    def downloadFH(self, domain, filename, headers=None):
+        response = _ServerFiles.downloadFH(self, domain, filename, headers)
+        return _Response(response.read(self.length), status=response.status,
+                         headers=response.headers)
+
+
+class TestDownload(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.target = os.path.join(self.tmpdir, "domain", "file")
+        self.data = "".join("line %i\n" % i for i in range(20000)).encode()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def read_target(self):
+        with open(self.target, "rb") as f:
+            return f.read()
+
+    def interrupt(self, content, length, download={}, **kwargs):
+        with self.assertRaises(IOError):
+            _Interrupted(content, length, **kwargs).download(
+                "domain", "file", self.target, **download)
+        self.assertEqual(os.path.getsize(self.target + ".part"), length)
+
+    def test_download(self):
+        sf = _ServerFiles(self.data)
+        sf.download("domain", "file", self.target)
+        self.assertEqual(self.read_target(), self.data)
+        self.assertFalse(os.path.exists(self.target + ".part"))
+        self.assertFalse(os.path.exists(self.target + ".part.info"))
+
+    def test_resume(self):
+        self.interrupt(self.data, 1000)
+        sf = _ServerFiles(self.data)
+        sf.download("domain", "file", self.target)
+        self.assertEqual(sf.requests,
+                         [{"Range": "bytes=1000-", "If-Range": '"1"'}])
+        self.assertEqual(self.read_target(), self.data)
+
+        # the server ignores the Range header
+        self.interrupt(b"garbage" * 100, 7)
+        sf = _ServerFiles(self.data, ranges=False)
+        sf.download("domain", "file", self.target)
+        self.assertEqual(self.read_target(), self.data)
+
+        # a part without the validator is not resumed
+        with open(self.target + ".part", "wb") as f:
+            f.write(b"garbage")
+        sf = _ServerFiles(self.data)
+        sf.download("domain", "file", self.target)
+        self.assertEqual(sf.requests, [None])
+        self.assertEqual(self.read_target(), self.data)
+
+    def test_resume_changed(self):
+        # the file changed on the server (If-Range does not match)
+        self.interrupt(b"old content" * 1000, 1000)
+        sf = _ServerFiles(self.data, etag='"2"')
+        sf.download("domain", "file", self.target)
+        self.assertEqual(len(sf.requests), 1)
+        self.assertEqual(self.read_target(), self.data)
+
+        # no validators, but the size changed
+        self.interrupt(b"old content" * 1000, 1000, etag=None)
+        sf = _ServerFiles(self.data, etag=None)
+        sf.download("domain", "file", self.target)
+        self.assertEqual(sf.requests, [{"Range": "bytes=1000-"}, None])
+        self.assertEqual(self.read_target(), self.data)
+
+    def test_decompress(self):
+        for compression, compress in [("gz", _gzip), ("bz2", bz2.compress)]:
+            # two concatenated members
+            content = compress(self.data[:50000]) + compress(self.data[50000:])
+            sf = _ServerFiles(content)
+            sf.download("domain", "file", self.target, decompress=compression)
+            self.assertEqual(self.read_target(), self.data)
+
+            # resumed download of a compressed file
+            self.interrupt(content, len(content) // 2,
+                           download={"decompress": compression})
+            sf.requests = []
+            sf.download("domain", "file", self.target, decompress=compression)
+            self.assertEqual(sf.requests[0]["Range"],
+                             "bytes=%i-" % (len(content) // 2))
+            self.assertEqual(self.read_target(), self.data)
+            self.assertFalse(os.path.exists(self.target + ".part"))
+
+    def test_incomplete(self):
+        class Short(_ServerFiles):
+            def downloadFH(self, domain, filename, headers=None):
+                response = _Response(self.content[:100])
+                response.headers["content-length"] = str(len(self.content))
+                return response
+
+        with self.assertRaises(IOError):
+            Short(self.data).download("domain", "file", self.target)
+        self.assertFalse(os.path.exists(self.target))
+        self.assertTrue(os.path.exists(self.target + ".part"))
+
+
+class TestPrefetch(unittest.TestCase):
+    def setUp(self):
+        self.buffer_dir = serverfiles.environ.buffer_dir
+        serverfiles.environ.buffer_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(serverfiles.environ.buffer_dir)
+        serverfiles.environ.buffer_dir = self.buffer_dir
+
+    def test_prefetch(self):
+        sf = _ServerFiles(b"content")
+        files = [("A", "f%i" % i) for i in range(5)] + [("B", "g")]
+        progress = []
+        downloaded = serverfiles.prefetch(files, max_workers=3,
+                                          serverfiles=sf,
+                                          progress_callback=progress.append)
+        self.assertEqual(sorted(downloaded), sorted(files))
+        self.assertEqual(progress[-1], 100)
+        for domain, filename in files:
+            with open(serverfiles.localpath(domain, filename), "rb") as f:
+                self.assertEqual(f.read(), b"content")
+            self.assertEqual(serverfiles.info(domain, filename)["datetime"],
+                             "2016-01-01")
+        # all files are current
+        self.assertEqual(serverfiles.prefetch(files, serverfiles=sf), [])
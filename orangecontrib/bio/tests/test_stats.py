@@ -0,0 +1,35 @@
+import unittest
+import random
+
+import numpy
+
+from orangecontrib.bio.utils import stats
+
+
+class TestPValues(unittest.TestCase):
+    def _test_p_values(self, prob):
+        rand = random.Random(0)
+        args = []
+        for _ in range(300):
+            N = rand.choice([10, 300, 5000])
+            m = rand.randint(0, N)
+            n = rand.randint(1, N)
+            k = rand.randint(0, min(n, m))
+            args.append((k, N, m, n))
+
+        expected = [prob.p_value(*a) for a in args]
+        k, N, m, n = map(list, zip(*args))
+        numpy.testing.assert_allclose(prob.p_values(k, N, m, n), expected,
+                                      rtol=1e-9, atol=1e-15)
+
+        # scalars are broadcast
+        numpy.testing.assert_allclose(
+            prob.p_values([0, 2, 5], 100, 20, 10),
+            [prob.p_value(k, 100, 20, 10) for k in [0, 2, 5]])
+        self.assertEqual(prob.p_values([], [], [], []).shape, (0,))
+
+    def test_binomial(self):
+        self._test_p_values(stats.Binomial())
+
+    def test_hypergeometric(self):
+        self._test_p_values(stats.Hypergeometric())
@@ -0,0 +1,67 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from orangecontrib.bio import taxonomy
+
+
+class TestPickledCache(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.calls = []
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def cached(self, version=1, maxSize=30):
+        @taxonomy.pickled_cache(os.path.join(self.tmpdir, "cache.sqlite"),
+                                version=version, maxSize=maxSize)
+        def square(x, offset=0):
+            self.calls.append(x)
+            return x * x + offset
+        return square
+
+    def test_cache(self):
+        square = self.cached(maxSize=2)
+        self.assertEqual([square(i) for i in [1, 2, 3, 1]], [1, 4, 9, 1])
+        self.assertEqual(square(2, offset=1), 5)
+        self.assertEqual(self.calls, [1, 2, 3, 2])
+
+        # a new process (function) reads the stored results
+        square = self.cached()
+        self.assertEqual([square(i) for i in [1, 2, 3]], [1, 4, 9])
+        self.assertEqual(self.calls, [1, 2, 3, 2])
+
+        # a version change invalidates them
+        square = self.cached(version=2)
+        self.assertEqual(square(3), 9)
+        self.assertEqual(self.calls, [1, 2, 3, 2, 3])
+
+    def test_concurrent_calls(self):
+        # a call computing its value does not block calls of other
+        # arguments
+        started = threading.Event()
+        other = threading.Event()
+
+        @taxonomy.pickled_cache(os.path.join(self.tmpdir, "cache.sqlite"))
+        def wait(x):
+            if x == 1:
+                started.set()
+                return other.wait(5)
+            else:
+                other.set()
+                return True
+
+        results = []
+        thread = threading.Thread(target=lambda: results.append(wait(1)))
+        thread.start()
+        started.wait(5)
+        self.assertTrue(wait(2))
+        thread.join()
+        self.assertEqual(results, [True])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -136,3 +136,176 @@ def dist_pcorr(l1, l2):
 
 def dist_eucl(l1, l2):
     return euclidean_lists(l1, l2)
+
+def profile_matrix(X, ids_list):
+    """ Returns a matrix of profiles (rows) of column groups `ids_list`,
+    the NumPy counterpart of linearize: each profile is a concatenation
+    of columns `ids` of `X` (NaN for unknown values and for ids which are
+    None). """
+    X = numpy.asarray(X, dtype=float)
+    length = max([len(ids) for ids in ids_list] + [0])
+    P = numpy.full((len(ids_list), length, X.shape[0]), numpy.nan)
+    for i, ids in enumerate(ids_list):
+        for j, id1 in enumerate(ids):
+            if id1 is not None:
+                P[i, j] = X[:, id1]
+    return P.reshape(len(ids_list), -1)
+
+def _rank_rows(P):
+    """ Rank values in rows of P (average ranks of ties) ignoring NaNs. """
+    import scipy.stats
+    R = numpy.full(P.shape, numpy.nan)
+    for i, row in enumerate(P):
+        known = ~numpy.isnan(row)
+        R[i, known] = scipy.stats.rankdata(row[known])
+    return R
+
+def _tie_groups(P):
+    """ Returns the order of values in rows of P (NaNs last) and, for each
+    position in the order, the positions of the first and the last equal
+    value. """
+    O = numpy.argsort(P, axis=1, kind="mergesort")
+    S = numpy.take_along_axis(P, O, axis=1)
+    positions = numpy.broadcast_to(numpy.arange(P.shape[1]), P.shape)
+    new = numpy.ones(P.shape, dtype=bool)
+    new[:, 1:] = S[:, 1:] != S[:, :-1]
+    first = numpy.maximum.accumulate(numpy.where(new, positions, 0), axis=1)
+    last = numpy.ones(P.shape, dtype=bool)
+    last[:, :-1] = new[:, 1:]
+    last = numpy.minimum.accumulate(
+        numpy.where(last, positions, P.shape[1])[:, ::-1], axis=1)[:, ::-1]
+    return O, first, last
+
+def _masked_ranks(O, first, last, K):
+    """ Rank values (average ranks of ties) of rows with order and tie
+    groups O, first and last (see _tie_groups) among the values in the
+    mask K. """
+    Ks = numpy.take_along_axis(K, O, axis=1)
+    upto = numpy.cumsum(Ks, axis=1)
+    before = numpy.take_along_axis(upto - Ks, first, axis=1)
+    ties = numpy.take_along_axis(upto, last, axis=1) - before
+    R = numpy.empty(K.shape)
+    numpy.put_along_axis(R, O, before + (ties + 1) / 2., axis=1)
+    return R
+
+def _spearman_pairs(P, groups, a, b, chunk_size=2**20):
+    """ Spearman correlations of profiles a[i] and b[i] (arrays of indices
+    of rows of P) ranked on their pairwise known values. `groups` are the
+    tie groups of P (see _tie_groups). """
+    O, first, last = groups
+    known = ~numpy.isnan(P)
+    r = numpy.empty(len(a))
+    step = max(1, chunk_size // max(P.shape[1], 1))
+    for start in range(0, len(a), step):
+        ia, ib = a[start:start + step], b[start:start + step]
+        K = known[ia] & known[ib]
+        n = K.sum(axis=1)
+        d = []
+        for i in (ia, ib):
+            R = _masked_ranks(O[i], first[i], last[i], K)
+            # the mean rank of n values is (n + 1) / 2
+            d.append(numpy.where(K, R - (n[:, None] + 1) / 2., 0))
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            r[start:start + step] = (d[0] * d[1]).sum(axis=1) / numpy.sqrt(
+                (d[0] * d[0]).sum(axis=1) * (d[1] * d[1]).sum(axis=1))
+        r[start:start + step][n < 2] = numpy.nan
+    return r
+
+def _correlations(V, M, rows):
+    """ Pearson correlations of rows `rows` with all rows using pairwise
+    complete values (V are values with zeros for unknowns, M is the mask
+    of known values). """
+    Vb, Mb = V[rows], M[rows]
+    n = Mb.dot(M.T)
+    sx = Vb.dot(M.T)
+    sy = Mb.dot(V.T)
+    sxx = (Vb * Vb).dot(M.T)
+    syy = Mb.dot((V * V).T)
+    sxy = Vb.dot(V.T)
+    with numpy.errstate(divide="ignore", invalid="ignore"):
+        cov = sxy - sx * sy / n
+        var = (sxx - sx * sx / n) * (syy - sy * sy / n)
+        r = cov / numpy.sqrt(var)
+    r[n < 2] = numpy.nan
+    return numpy.clip(r, -1, 1), n
+
+def _prepare_profiles(P, metric):
+    """ Returns the values (with zeros for unknowns) and the mask of known
+    values of profiles P used to compute distances with `metric`. """
+    if metric not in ("pearson", "spearman", "euclidean"):
+        raise ValueError("unknown metric %r" % metric)
+    M = (~numpy.isnan(P)).astype(float)
+    if metric == "spearman":
+        R = _rank_rows(P)
+        V = numpy.where(M > 0, R, 0)
+    elif metric == "pearson":
+        # center the rows (correlation is invariant to shifts) to avoid
+        # loss of precision
+        with numpy.errstate(invalid="ignore"):
+            means = numpy.nansum(P, axis=1) / numpy.maximum(M.sum(axis=1), 1)
+        V = numpy.where(M > 0, P - means[:, None], 0)
+    else:
+        V = numpy.where(M > 0, P, 0)
+    return V, M
+
+def _distance_rows(P, V, M, rows, metric, upper=False, groups=None):
+    """ Returns distances of profiles `rows` to all profiles (if `upper`,
+    only distances to the following profiles are exact). For "spearman",
+    `groups` are the tie groups of P (see _tie_groups). """
+    if metric == "euclidean":
+        Vb, Mb = V[rows], M[rows]
+        ss = (Vb * Vb).dot(M.T) + Mb.dot((V * V).T) - 2 * Vb.dot(V.T)
+        return numpy.sqrt(numpy.maximum(ss, 0))
+    r, n = _correlations(V, M, rows)
+    if metric == "spearman":
+        # ranks of the whole rows are valid only for pairs with the same
+        # known values; rank the others pairwise
+        counts = M.sum(axis=1)
+        differ = (n != counts[rows][:, None]) | (n != counts[None, :])
+        differ[numpy.arange(len(rows)), rows] = False
+        if upper:
+            differ &= numpy.arange(len(P))[None, :] > rows[:, None]
+        bi, j = numpy.nonzero(differ)
+        if len(bi):
+            if groups is None:
+                groups = _tie_groups(P)
+            r[bi, j] = _spearman_pairs(P, groups, rows[bi], j)
+    return (1. - r) / 2
+
+def distances_to(P, rows, metric="pearson", block_size=128, callback=None):
+    """ Returns a matrix of distances from profiles `rows` (indices of rows
+    of `P`) to all profiles, computed like in distance_matrix. """
+    P = numpy.asarray(P, dtype=float)
+    V, M = _prepare_profiles(P, metric)
+    groups = _tie_groups(P) if metric == "spearman" else None
+    rows = numpy.asarray(rows, dtype=int)
+    D = numpy.zeros((len(rows), len(P)))
+    for start in range(0, len(rows), block_size):
+        block = numpy.arange(start, min(start + block_size, len(rows)))
+        D[block] = _distance_rows(P, V, M, rows[block], metric,
+                                  groups=groups)
+        D[block, rows[block]] = 0
+        if callback is not None:
+            callback(100.0 * (block[-1] + 1) / len(rows))
+    return D
+
+def distance_matrix(P, metric="pearson", block_size=128, callback=None):
+    """ Returns a matrix of distances between all rows of `P` (profiles)
+    ignoring unknown (NaN) values of each pair, like the pairwise `dist_*`
+    functions. `metric` is one of "pearson" (dist_pcorr), "spearman"
+    (dist_spearman) or "euclidean" (dist_eucl). Distances are computed in
+    blocks of `block_size` rows; `callback` is called with the percentage
+    of computed rows after each block. """
+    P = numpy.asarray(P, dtype=float)
+    V, M = _prepare_profiles(P, metric)
+    groups = _tie_groups(P) if metric == "spearman" else None
+    k = len(P)
+    D = numpy.zeros((k, k))
+    for start in range(0, k, block_size):
+        rows = numpy.arange(start, min(start + block_size, k))
+        D[rows] = _distance_rows(P, V, M, rows, metric, upper=True,
+                                 groups=groups)
+        if callback is not None:
+            callback(100.0 * (rows[-1] + 1) / k)
+    D = numpy.triu(D, 1)
+    return D + D.T
@@ -54,6 +54,8 @@ contain title, tags, size and date and time of the file.
 
 .. autofunction:: needs_update
 
+.. autofunction:: prefetch
+
 .. autofunction:: remove
 
 .. autofunction:: remove_domain
@@ -134,14 +136,21 @@ import time, threading
 import os
 import shutil
 import tarfile
-import gzip
 import bz2
 import glob
 import datetime
+import re
 import tempfile
+import zlib
 
 import six
 
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
 #defserver = "localhost:9999/"
 defserver = "asterix.fri.uni-lj.si/orngServerFiles/"
 
@@ -195,6 +204,69 @@ def _create_path(target):
     except OSError:
         pass
 
+def _replace(src, dst):
+    """Rename `src` to `dst`, replacing `dst` if it exists."""
+    if hasattr(os, "replace"):
+        os.replace(src, dst)
+    else:
+        if os.path.exists(dst) and sys.platform == "win32":
+            os.remove(dst)
+        os.rename(src, dst)
+
+def _open_part_info(fname):
+    """
+    Return the validator (ETag or Last-Modified, or an empty string) and
+    the size of the file being downloaded to a ".part" file.
+    """
+    with open(fname, "rt") as f:
+        validator, size = f.read().split("\n")
+    return validator, int(size)
+
+def _save_part_info(fname, validator, size):
+    with open(fname, "wt") as f:
+        f.write("%s\n%i" % (validator, size))
+
+def _content_range(response):
+    """
+    Return (first byte, full size) from the Content-Range header of a
+    partial response, or (None, None).
+    """
+    match = re.match(r"bytes\s+(\d+)-\d+/(\d+)",
+                     response.headers.get("content-range") or "")
+    if not match:
+        return None, None
+    return int(match.group(1)), int(match.group(2))
+
+class _StreamDecompressor(object):
+    """
+    Incremental decompression of "gz" or "bz2" compressed data (also
+    with multiple concatenated members).
+    """
+    def __init__(self, compression):
+        if compression not in ["gz", "bz2"]:
+            raise ValueError("Unsupported compression %r" % compression)
+        self.compression = compression
+        self._new()
+
+    def _new(self):
+        if self.compression == "gz":
+            self._decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        else:
+            self._decompressor = bz2.BZ2Decompressor()
+
+    def decompress(self, data):
+        out = []
+        while data:
+            try:
+                out.append(self._decompressor.decompress(data))
+            except EOFError:  # data after the end of a bz2 stream
+                self._new()
+                continue
+            data = self._decompressor.unused_data
+            if data:
+                self._new()
+        return b"".join(out)
+
 def localpath(domain=None, filename=None):
     """Return a path for the domain in the local repository. If 
     filename is given, return a path to corresponding file."""
@@ -218,11 +290,13 @@ class ServerFiles(object):
     public use.
     """
 
-    def __init__(self, username=None, password=None, server=None, access_code=None):
+    def __init__(self, username=None, password=None, server=None, access_code=None,
+                 pool_size=10):
         """
         Creates a ServerFiles instance. Pass your username and password
         to use the repository as an authenticated user. If you want to use
         your access code (as an non-authenticated user), pass it also.
+        Requests share a pool of (at most `pool_size`) connections.
         """
         if not server:
             server = defserver
@@ -233,6 +307,9 @@ class ServerFiles(object):
         self.password = password
         self.access_code = access_code
         self.searchinfo = None
+        self.pool_size = pool_size
+        self._sessions = {}
+        self._sessions_lock = threading.Lock()
 
     def upload(self, domain, filename, file, title="", tags=[]):
         """ Uploads a file "file" to the domain where it is saved with filename
@@ -286,41 +363,99 @@ class ServerFiles(object):
         """List all domains on repository."""
         return _parseList(self._open('listdomains', {}))
 
-    def download(self, domain, filename, target, callback=None):
+    def download(self, domain, filename, target, callback=None,
+                 decompress=None):
         """
         Downloads file from the repository to a given target name. Callback
         can be a function without arguments. It will be called once for each
         downloaded percent of file: 100 times for the whole file.
+
+        The file is downloaded to `target` + ".part" and renamed to
+        `target` when complete. An interrupted download is resumed
+        from the existing ".part" file if the file on the server did not
+        change since (its ETag or Last-Modified validator and size are
+        kept in `target` + ".part.info"). If `decompress` ("gz" or "bz2")
+        is given, the file is decompressed to `target` while it is
+        downloaded.
         """
         _create_path_for_file(target)
+        part = target + ".part"
+        partinfo = part + ".info"
 
-        fdown = self.downloadFH(domain, filename)
-        size = int(fdown.getheader('content-length'))
-
-        f = tempfile.TemporaryFile()
- 
-        chunksize = 1024*8
-        lastchunkreport= 0.0001
-
-        readb = 0
-        # in case size == 0 skip the loop
-        while size > 0:
-            buf = fdown.read(chunksize)
-            readb += len(buf)
-
-            while float(readb) / size > lastchunkreport+0.01:
-                #print float(readb)/size, lastchunkreport + 0.01, float(readb)/size - lastchunkreport 
-                lastchunkreport += 0.01
-                if callback:
-                    callback()
-            if not buf:
-                break
-            f.write(buf)
-
-        fdown.close()
-        f.seek(0)
+        offset, validator, size = 0, "", None
+        if os.path.exists(part) and os.path.exists(partinfo):
+            try:
+                validator, size = _open_part_info(partinfo)
+                offset = os.path.getsize(part)
+            except (IOError, ValueError):
+                pass
 
-        shutil.copyfileobj(f, open(target, "wb"))
+        fdown = None
+        if offset:
+            headers = {"Range": "bytes=%i-" % offset}
+            if validator:
+                headers["If-Range"] = validator
+            fdown = self.downloadFH(domain, filename, headers=headers)
+            if getattr(fdown, "status", None) != 206:
+                # the server does not support resuming or the file changed
+                offset = 0
+            elif _content_range(fdown) != (offset, size):
+                # a different part or a different file
+                fdown.close()
+                fdown, offset = None, 0
+
+        if fdown is None:
+            fdown = self.downloadFH(domain, filename)
+        if not offset:
+            size = int(fdown.headers.get('content-length'))
+            validator = fdown.headers.get("etag") or \
+                fdown.headers.get("last-modified") or ""
+            _save_part_info(partinfo, validator, size)
+
+        decompressor = _StreamDecompressor(decompress) if decompress else None
+        fpart = open(part, "ab" if offset else "wb")
+        fout = open(target + ".tmp", "wb") if decompressor else None
+        try:
+            if decompressor and offset:
+                # decompress the previously downloaded part
+                with open(part, "rb") as f:
+                    for buf in iter(lambda: f.read(1024 * 1024), b""):
+                        fout.write(decompressor.decompress(buf))
+
+            chunksize = 1024*8
+            lastchunkreport= 0.0001
+
+            readb = offset
+            # in case size == 0 skip the loop
+            while size > 0:
+                buf = fdown.read(chunksize)
+                readb += len(buf)
+
+                while float(readb) / size > lastchunkreport+0.01:
+                    lastchunkreport += 0.01
+                    if callback:
+                        callback()
+                if not buf:
+                    break
+                fpart.write(buf)
+                if decompressor:
+                    fout.write(decompressor.decompress(buf))
+        finally:
+            fdown.close()
+            fpart.close()
+            if fout:
+                fout.close()
+
+        if readb < size:
+            raise IOError("Incomplete download of %s (%i of %i bytes)" %
+                          (filename, readb, size))
+
+        if decompressor:
+            _replace(target + ".tmp", target)
+            os.remove(part)
+        else:
+            _replace(part, target)
+        os.remove(partinfo)
 
         if callback:
             callback()
@@ -352,9 +487,10 @@ class ServerFiles(object):
         Keys: title, tags, size, datetime."""
         return _parseFileInfo(self._open('info', { 'domain': domain, 'filename': filename }))
 
-    def downloadFH(self, domain, filename):
+    def downloadFH(self, domain, filename, headers=None):
         """Return a file handle to the file that we would like to download."""
-        return self._handle('download', { 'domain': domain, 'filename': filename }, raw=True)
+        return self._handle('download', { 'domain': domain, 'filename': filename }, raw=True,
+                            headers=headers)
 
     def list(self, domain):
         return _parseList(self._open('list', { 'domain': domain }))
@@ -381,13 +517,20 @@ class ServerFiles(object):
         else:
             return False
 
-    def _server_request(self, root, command, data, files, repeat=2, raw=False):
+    def _server_request(self, root, command, data, files, repeat=2, raw=False,
+                        headers=None):
         import requests
         import requests.exceptions
-        req = requests.Session()
-        a = requests.adapters.HTTPAdapter(max_retries=repeat)
-        req.mount('https://', a)
-        req.mount('http://', a)
+        with self._sessions_lock:
+            if repeat not in self._sessions:
+                req = requests.Session()
+                a = requests.adapters.HTTPAdapter(
+                    max_retries=repeat, pool_connections=self.pool_size,
+                    pool_maxsize=self.pool_size)
+                req.mount('https://', a)
+                req.mount('http://', a)
+                self._sessions[repeat] = req
+            req = self._sessions[repeat]
 
         auth = None
         if self._authen():
@@ -395,20 +538,23 @@ class ServerFiles(object):
 
         try:
             if data:
-                ans = req.post(root+command, data=data, files=files, auth=auth, verify=False, timeout=timeout, stream=True)
+                ans = req.post(root+command, data=data, files=files, auth=auth, verify=False, timeout=timeout, stream=True,
+                               headers=headers)
             else:
-                ans = req.get(root+command, auth=auth, verify=False, timeout=timeout, stream=True)
+                ans = req.get(root+command, auth=auth, verify=False, timeout=timeout, stream=True,
+                              headers=headers)
         except (requests.exceptions.Timeout, requests.exceptions.ConnectionError) as e:
             raise e
 
         return str(ans.text) if not raw else ans.raw
     
-    def _handle(self, command, data, files=None, raw=False):
+    def _handle(self, command, data, files=None, raw=False, headers=None):
         data2 = self._addAccessCode(data)
         addr = self.publicroot
         if self._authen():
             addr = self.secureroot
-        return self._server_request(addr, command, data, files, raw=raw)
+        return self._server_request(addr, command, data, files, raw=raw,
+                                    headers=headers)
 
     def _open(self, command, data, files=None):
         return self._handle(command, data, files)
@@ -472,6 +618,40 @@ class _Lock(object):
 _get_lock = _keyed_lock(_Lock)
 
 
+@contextmanager
+def _os_lock(path, blocking=False):
+    """
+    Hold an exclusive OS level lock of `path` + ".lock" file, shared by
+    all processes using the same local repository.
+    """
+    _create_path_for_file(path)
+    with open(path + ".lock", "a+b") as f:
+        if fcntl is not None:
+            flags = fcntl.LOCK_EX | (0 if blocking else fcntl.LOCK_NB)
+            try:
+                fcntl.flock(f.fileno(), flags)
+            except (IOError, OSError):
+                raise Exception("Could not acquire lock")
+        else:
+            f.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+                    break
+                except (IOError, OSError):
+                    if not blocking:
+                        raise Exception("Could not acquire lock")
+                    time.sleep(0.1)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
 @contextmanager
 def _lock_file(domain, filename, blocking=False):
     path = localpath(domain, filename)
@@ -481,7 +661,9 @@ def _lock_file(domain, filename, blocking=False):
     if lock.acquire(blocking):
 #         log.debug("got lock on: %s", path)
         try:
-            yield
+            # other processes
+            with _os_lock(path, blocking):
+                yield
         finally:
             lock.release()
 #             log.debug("Released lock on: %s",  path)
@@ -513,36 +695,37 @@ def download(domain, filename, serverfiles=None, callback=None,
     info = serverfiles.info(domain, filename)
     specialtags = dict([tag.split(":") for tag in info["tags"] if tag.startswith("#") and ":" in tag])
     extract = extract and ("#uncompressed" in specialtags or "#compression" in specialtags)
+    compression = specialtags.get("#compression") if extract else None
     target = localpath(domain, filename)
     if ConsoleProgressBar:
         callback = DownloadProgress(filename, int(info["size"])) if verbose and not callback else callback    
-    serverfiles.download(domain, filename, target + ".tmp" if extract else target, callback=callback)
-    
-    #file saved, now save info file
 
-    _save_file_info(target + '.info', info)
-    
-    if extract:
-        if specialtags.get("#compression") in ["tar.gz", "tar.bz2"] and \
-                specialtags.get("#files"):
-            f = tarfile.open(target + ".tmp")
+    if compression in ["gz", "bz2"]:
+        # decompressed while downloading
+        serverfiles.download(domain, filename, target, callback=callback,
+                             decompress=compression)
+    elif compression in ["tar.gz", "tar.bz2"] and specialtags.get("#files"):
+        serverfiles.download(domain, filename, target + ".tmp", callback=callback)
+        with tarfile.open(target + ".tmp") as f:
             f.extractall(localpath(domain))
-            shutil.copyfile(target + ".tmp", target)
-        elif filename.endswith(".tar.gz"):
-            f = tarfile.open(target + ".tmp")
-            try:
-                os.mkdir(target)
-            except Exception:
-                pass
-            f.extractall(target)
-        elif specialtags.get("#compression") == "gz":
-            f = gzip.open(target + ".tmp")
-            shutil.copyfileobj(f, open(target, "wb"))
-        elif specialtags.get("#compression") == "bz2":
-            f = bz2.BZ2File(target + ".tmp", "r")
-            shutil.copyfileobj(f, open(target, "wb"))
-        f.close()
+        _replace(target + ".tmp", target)
+    elif extract and filename.endswith(".tar.gz"):
+        serverfiles.download(domain, filename, target + ".tmp", callback=callback)
+        tmpdir = tempfile.mkdtemp(dir=localpath(domain))
+        with tarfile.open(target + ".tmp") as f:
+            f.extractall(tmpdir)
+        if os.path.isdir(target):
+            shutil.rmtree(target)
+        elif os.path.exists(target):
+            os.remove(target)
+        os.rename(tmpdir, target)
         os.remove(target + ".tmp")
+    else:
+        serverfiles.download(domain, filename, target, callback=callback)
+
+    #file saved, now save info file
+    _save_file_info(target + '.info.tmp', info)
+    _replace(target + '.info.tmp', target + '.info')
 
     if ConsoleProgressBar and type(callback) == DownloadProgress:
         callback.finish()
@@ -884,7 +1067,131 @@ def update_by_tags(tags=["essential"], domains=[], verbose=True):
             download(domain, filename, sf)
         if verbose:
             print(filename, "Ok" if uptodate else "Updated")
-            
+
+def _is_current(domain, filename, server_info):
+    """Is the local file present with the same datetime as on the server?"""
+    path = localpath(domain, filename)
+    if not os.path.exists(path) or not os.path.exists(path + ".info"):
+        return False
+    try:
+        return info(domain, filename)["datetime"] == server_info["datetime"]
+    except Exception:
+        return False
+
+def prefetch(files, max_workers=4, serverfiles=None, progress_callback=None,
+             verbose=False):
+    """
+    Download files given as a list of (domain, filename) tuples in
+    parallel (with `max_workers` threads sharing one connection pool).
+    Files whose local datetime matches the repository datetime are
+    skipped. Each file is downloaded while holding its lock, so other
+    threads or processes using the same local repository do not download
+    it again.
+
+    The optional `progress_callback` is called with the aggregate
+    progress (0-100) of all downloads. Return a list of (domain, filename)
+    tuples of downloaded files.
+
+    The same is available from the command line::
+
+        python -m orangecontrib.bio.utils.serverfiles -j 8 GO/taxonomy.pickle
+
+    """
+    import concurrent.futures
+
+    files = list(files)
+    if serverfiles is None:
+        serverfiles = ServerFiles(pool_size=max_workers)
+
+    sizes = {}
+    ticks = dict((f, 0) for f in files)
+    lock = threading.Lock()
+
+    def report():
+        total = sum(sizes.values())
+        if total and progress_callback:
+            progress_callback(100.0 * sum(ticks[f] * sizes[f] / 100.0
+                                          for f in sizes) / total)
+
+    def fetch(domain, filename):
+        key = (domain, filename)
+        server_info = serverfiles.info(domain, filename)
+        with lock:
+            sizes[key] = int(server_info["size"])
+
+        def tick():
+            with lock:
+                ticks[key] = min(ticks[key] + 1, 100)
+                report()
+
+        with _lock_file(domain, filename, blocking=True):
+            if _is_current(domain, filename, server_info):
+                if verbose:
+                    print(filename, "Ok")
+                downloaded = False
+            else:
+                download.unwraped(domain, filename, serverfiles=serverfiles,
+                                  callback=tick, verbose=False)
+                if verbose:
+                    print(filename, "Downloaded")
+                downloaded = True
+        with lock:
+            ticks[key] = 100
+            report()
+        return downloaded
+
+    downloaded = []
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = dict((executor.submit(fetch, domain, filename),
+                        (domain, filename))
+                       for domain, filename in files)
+        for future in concurrent.futures.as_completed(futures):
+            if future.result():
+                downloaded.append(futures[future])
+    return downloaded
+
+def main(argv=None):
+    """Command line interface to :obj:`prefetch`."""
+    import argparse
+    parser = argparse.ArgumentParser(
+        description="Download files from the repository to the local "
+                    "repository in parallel.")
+    parser.add_argument("files", nargs="*", metavar="DOMAIN/FILENAME",
+                        help="files to download")
+    parser.add_argument("-t", "--tags", nargs="*", default=[],
+                        help="also download files with all these tags")
+    parser.add_argument("-d", "--domain", action="append", default=[],
+                        help="also download all files from a domain")
+    parser.add_argument("-j", "--jobs", type=int, default=4,
+                        help="number of parallel downloads (default: 4)")
+    parser.add_argument("-q", "--quiet", action="store_true")
+    args = parser.parse_args(argv)
+
+    sf = ServerFiles(pool_size=args.jobs)
+    files = []
+    for name in args.files:
+        if "/" not in name:
+            parser.error("expected DOMAIN/FILENAME, got %r" % name)
+        files.append(tuple(name.split("/", 1)))
+    if args.tags:
+        files.extend(sf.search(args.tags, inTitle=False, inName=False))
+    for domain in args.domain:
+        files.extend((domain, filename) for filename in sf.listfiles(domain)
+                     if filename)
+    files = sorted(set(files))
+
+    def progress(value):
+        sys.stderr.write("\rprogress: %5.1f%%" % value)
+        sys.stderr.flush()
+
+    downloaded = prefetch(files, max_workers=args.jobs, serverfiles=sf,
+                          progress_callback=None if args.quiet else progress,
+                          verbose=not args.quiet)
+    if not args.quiet:
+        sys.stderr.write("\n")
+        print("%i of %i files downloaded" % (len(downloaded), len(files)))
+    return 0
+
 def _example(myusername, mypassword):
 
     locallist = listfiles('test')
@@ -962,4 +1269,4 @@ def _example(myusername, mypassword):
 
 if __name__ == '__main__':
     #_example(sys.argv[1], sys.argv[2])
-    _example("osf", "edit123p")
+    sys.exit(main())
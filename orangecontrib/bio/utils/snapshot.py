@@ -0,0 +1,143 @@
+"""
+Columnar on-disk snapshots of parsed data files.
+
+A snapshot is a directory of numpy ``.npy`` files (one per column) that
+can be memory mapped, so that multiple processes reading the same
+snapshot share its pages. Snapshots are stored next to the source file
+and are used only when they are newer than it.
+
+Strings are stored either as a :func:`string_column` (a single UTF-8
+encoded blob with character offsets) or as a :func:`categorical_column`
+(integer codes into a string column of unique values).
+
+"""
+from __future__ import absolute_import
+
+import os
+import shutil
+import tempfile
+
+import six
+import numpy
+
+#: Name of the file marking a complete snapshot and storing its version.
+VERSION_FILE = "version.npy"
+
+
+def snapshot_path(source):
+    """
+    Return the path of a snapshot for `source` file.
+    """
+    return source + ".snapshot"
+
+
+def string_column(name, strings):
+    """
+    Return a dictionary of arrays storing a column of `strings` under
+    `name`: a UTF-8 encoded blob (``<name>_blob``) and character offsets
+    (``<name>_offsets``) of the strings in the decoded blob.
+    """
+    strings = [s if isinstance(s, six.text_type) else s.decode("utf-8")
+               for s in strings]
+    offsets = numpy.zeros(len(strings) + 1, dtype=numpy.int64)
+    offsets[1:] = numpy.cumsum([len(s) for s in strings])
+    blob = numpy.frombuffer(u"".join(strings).encode("utf-8"),
+                            dtype=numpy.uint8)
+    return {name + "_offsets": offsets, name + "_blob": blob}
+
+
+def strings(columns, name):
+    """
+    Return the list of strings stored with :func:`string_column`.
+    """
+    text = columns[name + "_blob"].tobytes().decode("utf-8")
+    offsets = columns[name + "_offsets"].tolist()
+    strings = [text[start:end] for start, end in zip(offsets, offsets[1:])]
+    if six.PY2:
+        # return byte strings (as read by the parsers)
+        strings = [s.encode("utf-8") for s in strings]
+    return strings
+
+
+def categorical_column(name, values):
+    """
+    Return a dictionary of arrays storing a column of (string) `values`
+    under `name`: int32 codes (``<name>_codes``) into a string column of
+    sorted unique values (``<name>_categories``).
+    """
+    categories = sorted(set(values))
+    index = dict((c, i) for i, c in enumerate(categories))
+    codes = numpy.fromiter((index[v] for v in values), dtype=numpy.int32,
+                           count=len(values))
+    columns = string_column(name + "_categories", categories)
+    columns[name + "_codes"] = codes
+    return columns
+
+
+def categories(columns, name):
+    """
+    Return a pair (codes, categories) of a column stored with
+    :func:`categorical_column`.
+    """
+    return columns[name + "_codes"], strings(columns, name + "_categories")
+
+
+def categorical(columns, name):
+    """
+    Return the list of values stored with :func:`categorical_column`.
+    """
+    codes, cats = categories(columns, name)
+    return [cats[c] for c in codes.tolist()]
+
+
+def is_fresh(path, source, version):
+    """
+    Is the snapshot at `path` complete, of `version` (an int or a
+    string) and newer than the `source` file (if not None)?
+    """
+    marker = os.path.join(path, VERSION_FILE)
+    if not os.path.exists(marker):
+        return False
+    if source is not None and os.path.exists(source) and \
+            os.path.getmtime(source) > os.path.getmtime(marker):
+        return False
+    try:
+        return numpy.load(marker).item() == version
+    except (IOError, OSError, ValueError):
+        return False
+
+
+def write(path, columns, version):
+    """
+    Write a snapshot of `columns` (a dictionary of arrays) to directory
+    `path`. The snapshot is written to a temporary directory first and
+    then renamed, so readers never see an incomplete one.
+    """
+    parent = os.path.dirname(os.path.abspath(path))
+    tmpdir = tempfile.mkdtemp(prefix=".snapshot", dir=parent)
+    try:
+        for name, array in six.iteritems(columns):
+            numpy.save(os.path.join(tmpdir, name + ".npy"),
+                       numpy.asarray(array))
+        # the version file is written last and marks a complete snapshot
+        numpy.save(os.path.join(tmpdir, VERSION_FILE), numpy.array(version))
+        if os.path.isdir(path):
+            shutil.rmtree(path, ignore_errors=True)
+        os.rename(tmpdir, path)
+    except Exception:
+        shutil.rmtree(tmpdir, ignore_errors=True)
+        raise
+
+
+def read(path, mmap=True):
+    """
+    Read a snapshot written with :func:`write`. Return a dictionary of
+    arrays, memory mapped (read only) if `mmap` is True.
+    """
+    columns = {}
+    for filename in os.listdir(path):
+        if filename.endswith(".npy") and filename != VERSION_FILE:
+            columns[filename[:-len(".npy")]] = numpy.load(
+                os.path.join(path, filename),
+                mmap_mode="r" if mmap else None)
+    return columns
@@ -2,6 +2,8 @@ import math
 import threading
 import six
 
+import numpy
+
 
 def _lngamma(z):
     x = 0
@@ -16,11 +18,37 @@ def _lngamma(z):
     x += 0.9999999999995183
     
     return math.log(x) - 5.58106146679532777 - z + (z - 0.5) * math.log(z + 6.5)
-        
+
+
+def _lngamma_array(z):
+    """ :func:`_lngamma` for an array of values. """
+    z = numpy.asarray(z, dtype=float)
+    x = 0.9999999999995183 + \
+        0.1659470187408462e-06 / (z + 7) + \
+        0.9934937113930748e-05 / (z + 6) - \
+        0.1385710331296526 / (z + 5) + \
+        12.50734324009056 / (z + 4) - \
+        176.6150291498386 / (z + 3) + \
+        771.3234287757674 / (z + 2) - \
+        1259.139216722289 / (z + 1) + \
+        676.5203681218835 / (z)
+    return numpy.log(x) - 5.58106146679532777 - z + (z - 0.5) * numpy.log(z + 6.5)
+
+
+def _ragged_range(start, stop):
+    """ Enumerate range(start[j], stop[j]) for all j. Return a pair of
+    arrays (j, i) with an element for each value i in the j-th range.
+    """
+    lengths = numpy.maximum(stop - start, 0)
+    j = numpy.repeat(numpy.arange(len(start)), lengths)
+    offsets = numpy.cumsum(lengths) - lengths
+    i = start[j] + numpy.arange(lengths.sum()) - offsets[j]
+    return j, i
+
 
 class LogBin(object):
     _max = 2
-    _lookup = [0.0, 0.0]
+    _lookup = numpy.array([0.0, 0.0])
     _max_factorial = 1
     _lock = threading.Lock()
 
@@ -32,12 +60,16 @@ class LogBin(object):
         with LogBin._lock:
             if max <= LogBin._max:
                 return
-            for i in range(LogBin._max, max):
-                if i > 1000: ## an arbitrary cuttof
-                    LogBin._lookup.append(LogBin._logfactorial(i))
-                else:
-                    LogBin._max_factorial *= i
-                    LogBin._lookup.append(math.log(LogBin._max_factorial))
+            cutoff = 1001 ## an arbitrary cuttof
+            exact = []
+            for i in range(LogBin._max, min(max, cutoff)):
+                LogBin._max_factorial *= i
+                exact.append(math.log(LogBin._max_factorial))
+            start = LogBin._max if LogBin._max > cutoff else cutoff
+            approx = _lngamma_array(numpy.arange(start, max) + 1)
+            # replace (not modify) the table, so that readers without
+            # the lock always see a consistent one
+            LogBin._lookup = numpy.concatenate((LogBin._lookup, exact, approx))
             LogBin._max = max
 
     def _logbin(self, n, k):
@@ -55,6 +87,51 @@ class LogBin(object):
         else:
             return _lngamma(n + 1)
 
+    def _logbins(self, n, k):
+        """ :func:`_logbin` for arrays; k must be in [0, n]. """
+        lookup = self._lookup
+        return lookup[n] - lookup[n - k] - lookup[k]
+
+    def _p_values(self, k, N, m, n, top):
+        """ Vectorized p_value given the arrays of arguments and the
+        largest possible number of positive tests (top).
+        """
+        self._extend((int(N.max()) if len(N) else 0) + 100)
+        res = numpy.zeros(len(k))
+        upper = top - k + 1 <= k
+        #starting from k gives the shorter list of values
+        lower = numpy.flatnonzero(~upper)
+        sums = self._pmf_sums(numpy.zeros(len(lower), dtype=int), k[lower],
+                              N[lower], m[lower], n[lower])
+        res[lower] = 1.0 - sums
+        #if the value is small it is probably inexact due to the limited
+        #precision of floats, as for example  (1-(1-1e-20)) -> 0
+        #if so, compute the result without substraction
+        upper[lower[res[lower] < 1e-3]] = True
+        upper = numpy.flatnonzero(upper)
+        res[upper] = self._pmf_sums(k[upper], top[upper] + 1,
+                                    N[upper], m[upper], n[upper])
+        return res
+
+    def _pmf_sums(self, start, stop, N, m, n):
+        """ Return sums of probabilities of start[j] ... stop[j] - 1 positive
+        tests for all j.
+        """
+        j, i = _ragged_range(start, stop)
+        pmf = self._pmfs(i, N[j], m[j], n[j])
+        return numpy.bincount(j, weights=pmf, minlength=len(start))
+
+    def p_values(self, k, N, m, n):
+        """ Vectorized p_value: arguments are arrays (or scalars) that
+        are broadcast against each other. Return an array of the
+        probabilities that k or more tests are positive.
+        """
+        k, N, m, n = numpy.broadcast_arrays(
+            *[numpy.asarray(a, dtype=int) for a in (k, N, m, n)])
+        shape = k.shape
+        k, N, m, n = [a.ravel() for a in (k, N, m, n)]
+        return self._p_values(k, N, m, n, self._top(m, n)).reshape(shape)
+
 class Binomial(LogBin):
     """ `Binomial distribution 
     <http://en.wikipedia.org/wiki/Binomial_distribution>`_ is a discrete
@@ -86,6 +163,23 @@ class Binomial(LogBin):
             raise
 ##        return math.exp(self._logbin(n, k) + math.log((p**k) * (1.0 - p)**(n - k)))
 
+    def _pmfs(self, k, N, m, n):
+        """ Vectorized __call__ """
+        valid = (k >= 0) & (k <= n)
+        k = numpy.where(valid, k, 0)
+        p = 1.0 * m / N
+        with numpy.errstate(divide="ignore", invalid="ignore"):
+            prob = numpy.exp(self._logbins(n, k) + k * numpy.log(p) +
+                             (n - k) * numpy.log(1.0 - p))
+        prob = numpy.minimum(prob, 1.0)
+        prob = numpy.where(p == 0.0, k == 0, prob)
+        prob = numpy.where(p == 1.0, k == n, prob)
+        return numpy.where(valid, prob, 0.0)
+
+    @staticmethod
+    def _top(m, n):
+        return n
+
     def p_value(self, k, N, m, n):
         """ The probability that k or more tests are positive. """
         if n - k + 1 <= k:
@@ -125,6 +219,22 @@ class Hypergeometric(LogBin):
             print(k, N, m, n)
             raise
 
+    def _pmfs(self, k, N, m, n):
+        """ Vectorized __call__ """
+        valid = (k >= numpy.maximum(0, n + m - N)) & (k <= numpy.minimum(n, m))
+        k = numpy.where(valid, k, 0)
+        # any arguments valid for _logbins where k is out of range
+        m = numpy.where(valid, m, 0)
+        n = numpy.where(valid, n, 0)
+        N = numpy.where(valid, N, 0)
+        prob = numpy.exp(self._logbins(m, k) + self._logbins(N - m, n - k) -
+                         self._logbins(N, n))
+        return numpy.where(valid, numpy.minimum(prob, 1.0), 0.0)
+
+    @staticmethod
+    def _top(m, n):
+        return numpy.minimum(n, m)
+
     def p_value(self, k, N, m, n):
         """ 
         The probability that k or more tests are positive.
@@ -300,7 +300,7 @@ def multimap_inverse(multimap):
 
 def ppidb_synonym_mapping(ppidb, taxid):
     keys = ppidb.ids(taxid)
-    mapping = {key: ppidb.synonyms(key) for key in keys}
+    mapping = ppidb.synonyms_many(keys)
     return multimap_inverse(mapping)
 
 
@@ -425,9 +425,10 @@ def extract_network(ppidb, query, geneinfo, include_neighborhood=True,
             return entries[0][1]
 
     # Add query nodes.
+    query_synonyms = ppidb.synonyms_many(list(query))
     for key, query_name in query.items():
         nodeid = nodeids[key]
-        synonyms = ppidb.synonyms(key)
+        synonyms = query_synonyms[key]
         entry = gi_info(synonyms)
         graph.add_node(
             nodeid,
@@ -439,43 +440,35 @@ def extract_network(ppidb, query, geneinfo, include_neighborhood=True,
 
     if include_neighborhood:
         # extend the set of nodes in the network with immediate neighborers
-        edges_iter = (edge for key in query for edge in ppidb.edges(key))
-        for id1, id2, score in edges_iter:
-            if min_score is None or score >= min_score:
-                nodeid1 = nodeids[id1]
-                nodeid2 = nodeids[id2]
-                if nodeid1 not in graph:
-                    synonyms1 = ppidb.synonyms(id1)
-                    entry1 = gi_info(synonyms1)
-                    symbol1 = entry1.symbol if entry1 is not None else ""
-                    graph.add_node(
-                        nodeid1, key=id1, synonyms=synonyms1,
-                        symbol=symbol1
-                    )
-
-                if nodeid2 not in graph:
-                    synonyms2 = ppidb.synonyms(id2)
-                    entry2 = gi_info(synonyms2)
-                    symbol2 = entry2.symbol if entry2 is not None else ""
-                    graph.add_node(
-                        nodeid2, key=id2, synonyms=synonyms2,
-                        symbol=symbol2
-                    )
+        neighbours = []
+        for id1, id2, _ in ppidb.edges_many(list(query), min_score):
+            for id in (id1, id2):
+                if id not in nodeids:
+                    nodeids[id]  # assign the next node id
+                    neighbours.append(id)
+
+        neighbour_synonyms = ppidb.synonyms_many(neighbours)
+        for id in neighbours:
+            synonyms = neighbour_synonyms[id]
+            entry = gi_info(synonyms)
+            graph.add_node(
+                nodeids[id], key=id, synonyms=synonyms,
+                symbol=entry.symbol if entry is not None else ""
+            )
 
     # add edges between nodes
-    for i, id1 in enumerate(nodeids.keys()):
-        if progress is not None:
-            progress(100.0 * i / len(nodeids))
-
-        for _, id2, score in ppidb.edges(id1):
-            if id2 in nodeids and (min_score is None or score >= min_score):
-                nodeid1 = nodeids[id1]
-                nodeid2 = nodeids[id2]
-                assert nodeid1 in graph and nodeid2 in graph
-                if score is not None and report_weights:
-                    graph.add_edge(nodeid1, nodeid2, weight=score)
-                else:
-                    graph.add_edge(nodeid1, nodeid2)
+    edges = ppidb.edges_many(list(nodeids), min_score, internal=True)
+    for i, (id1, id2, score) in enumerate(edges):
+        if progress is not None and i % 1000 == 0:
+            progress(100.0 * i / len(edges))
+
+        nodeid1 = nodeids[id1]
+        nodeid2 = nodeids[id2]
+        assert nodeid1 in graph and nodeid2 in graph
+        if score is not None and report_weights:
+            graph.add_edge(nodeid1, nodeid2, weight=score)
+        else:
+            graph.add_edge(nodeid1, nodeid2)
 
     nodedomain = Orange.data.Domain(
         [Orange.feature.String("Query name"),  # if applicable
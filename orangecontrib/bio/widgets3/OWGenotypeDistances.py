@@ -5,8 +5,6 @@ from functools import reduce
 
 from collections import defaultdict
 
-import numpy
-
 from PyQt4.QtGui import (
     QWidget, QVBoxLayout, QLabel, QHeaderView, QListView, QScrollArea,
     QSizePolicy, QColor, QPalette, QStandardItemModel, QStandardItem,
@@ -22,7 +20,7 @@ from Orange.widgets import widget, gui, settings
 from Orange.widgets.utils import itemmodels
 
 from ..utils.group import \
-    separate_by, data_type, linearize, dist_pcorr, dist_eucl, dist_spearman
+    separate_by, data_type, profile_matrix, distance_matrix
 
 from .utils.settings import SetContextHandler
 
@@ -71,9 +69,9 @@ class OWGenotypeDistances(widget.OWWidget):
     auto_commit = settings.Setting(False)
 
     DISTANCE_FUNCTIONS = [
-        ("Distance from Pearson correlation", dist_pcorr),
-        ("Euclidean distance", dist_eucl),
-        ("Distance from Spearman correlation", dist_spearman)
+        ("Distance from Pearson correlation", "pearson"),
+        ("Euclidean distance", "euclidean"),
+        ("Distance from Spearman correlation", "spearman")
     ]
 
     def __init__(self, parent=None):
@@ -422,22 +420,11 @@ class OWGenotypeDistances(widget.OWWidget):
         """
         if separate_keys and partitions:
             self.progressBarInit()
-#             matrix = Orange.misc.DistMatrix(len(partitions))
-            matrix = numpy.zeros((len(partitions), len(partitions)))
-
-            profiles = [linearize(data, indices) for _, indices in partitions]
-            dist_func = self.DISTANCE_FUNCTIONS[self.distance_measure][1]
-#             from Orange.utils import progress_bar_milestones
-            count = (len(profiles) * len(profiles) - 1) / 2
-#             milestones = progress_bar_milestones(count)
-            iter_count = 0
-            for i in range(len(profiles)):
-                for j in range(i + 1, len(profiles)):
-                    matrix[i, j] = dist_func(profiles[i], profiles[j])
-                    matrix[j, i] = matrix[i, j]
-                    iter_count += 1
-#                     if iter_count in milestones:
-                    self.progressBarSet(100.0 * iter_count / count)
+            profiles = profile_matrix(
+                data.X, [indices for _, indices in partitions])
+            metric = self.DISTANCE_FUNCTIONS[self.distance_measure][1]
+            matrix = distance_matrix(profiles, metric,
+                                     callback=self.progressBarSet)
             self.progressBarFinished()
 
             items = [["{0}={1}".format(key, value)
@@ -1,12 +1,13 @@
 import sys
 import operator
 from collections import defaultdict
+from concurrent.futures import CancelledError
 from contextlib import contextmanager
 from functools import reduce
+from types import SimpleNamespace as namespace
 from xml.sax.saxutils import escape
 
 import numpy
-import scipy.stats
 
 from PyQt4 import QtGui
 from PyQt4.QtGui import (
@@ -15,67 +16,16 @@ from PyQt4.QtGui import (
     QGraphicsWidget
 )
 
-from PyQt4.QtCore import Qt, QEvent, QSizeF
+from PyQt4.QtCore import Qt, QEvent, QSizeF, pyqtSlot as Slot
 import Orange
 from Orange.widgets import widget, gui, settings
-from Orange.widgets.utils import itemmodels
+from Orange.widgets.utils import itemmodels, concurrent
 
 from ..utils import group as exp
 
 from .utils.settings import SetContextHandler
 
 
-def take_columns(data, indices):
-    """
-    Return an array from the data's columns indexed by indices.
-
-    None values in `indices` are interpreted as indexing a missing
-    `column`, i.e. all the values are NaN.
-
-    The resulting array is of shape (N * k,) where the data from
-    column 0 is located in `res[:N]`, column2 in `res[N: 2 * N]`, ...
-    """
-    columns = []
-    for index in indices:
-        if index is not None:
-            col_data, _ = data.get_column_view(index)
-        else:
-            col_data = numpy.full(len(data), numpy.nan)
-        columns.append(col_data)
-    return numpy.hstack(columns)
-
-
-def dist_eucl(a1, a2):
-    mask = ~(numpy.isnan(a1) | numpy.isnan(a2))
-    a1, a2 = a1[mask], a2[mask]
-    return numpy.sqrt(numpy.sum((a1 - a2) ** 2))
-
-
-def dist_pcorr(a1, a2):
-    mask = ~(numpy.isnan(a1) | numpy.isnan(a2))
-    a1, a2 = a1[mask], a2[mask]
-    P = numpy.corrcoef(a1, a2)[0, 1]
-    return (1.0 - P) / 2.0
-
-
-def dist_spearman(a1, a2):
-    mask = ~(numpy.isnan(a1) | numpy.isnan(a2))
-    a1, a2 = a1[mask], a2[mask]
-    R, _ = scipy.stats.spearmanr(a1, a2)
-    return (1.0 - R) / 2.0
-
-
-@contextmanager
-def widget_disable(widget):
-    """A context to disable the widget (enabled property)
-    """
-    widget.setEnabled(False)
-    try:
-        yield
-    finally:
-        widget.setEnabled(True)
-
-
 @contextmanager
 def disable_updates(widget):
     """
@@ -138,12 +88,13 @@ class OWQualityControl(widget.OWWidget):
     inputs = [("Experiment Data", Orange.data.Table, "set_data")]
     outputs = []
 
+    #: Distance measures (names and `utils.group.distances_to` metrics)
     DISTANCE_FUNCTIONS = [("Distance from Pearson correlation",
-                           dist_pcorr),
+                           "pearson"),
                           ("Euclidean distance",
-                           dist_eucl),
+                           "euclidean"),
                           ("Distance from Spearman correlation",
-                           dist_spearman)]
+                           "spearman")]
 
     settingsHandler = SetContextHandler()
 
@@ -207,10 +158,14 @@ class OWQualityControl(widget.OWWidget):
         self._base_index_hints = {}
         self.main_widget = None
 
+        self._executor = concurrent.ThreadExecutor()
+        self._distances_future = self._distances_state = None
+
         self.resize(800, 600)
 
     def clear(self):
         """Clear the widget state."""
+        self._cancel_pending()
         self.data = None
         self.distances = None
         self.groups = None
@@ -346,34 +301,29 @@ class OWQualityControl(widget.OWWidget):
                    self.sort_by_view.selectionModel(),
                    sort_by_labels)
 
-        with widget_disable(self):
-            self.split_and_update()
+        self.split_and_update()
 
     def on_split_key_changed(self, *args):
         """Split key has changed
         """
-        with widget_disable(self):
-            if not self._disable_updates:
-                self.base_group_index = 0
-                self.split_by_labels = self.selected_split_by_labels()
-                self.split_and_update()
+        if not self._disable_updates:
+            self.base_group_index = 0
+            self.split_by_labels = self.selected_split_by_labels()
+            self.split_and_update()
 
     def on_sort_key_changed(self, *args):
         """Sort key has changed
         """
-        with widget_disable(self):
-            if not self._disable_updates:
-                self.base_group_index = 0
-                self.sort_by_labels = self.selected_sort_by_labels()
-                self.split_and_update()
+        if not self._disable_updates:
+            self.base_group_index = 0
+            self.sort_by_labels = self.selected_sort_by_labels()
+            self.split_and_update()
 
     def on_distance_measure_changed(self):
         """Distance measure has changed
         """
-        if self.data is not None:
-            with widget_disable(self):
-                self.update_distances()
-                self.replot_experiments()
+        if self.data is not None and self.groups:
+            self.update_distances()
 
     def on_view_resize(self, size):
         """The view with the quality plot has changed
@@ -413,8 +363,7 @@ class OWQualityControl(widget.OWWidget):
                 update = True
 
         if update:
-            with widget_disable(self):
-                self.split_and_update()
+            self.split_and_update()
 
     def eventFilter(self, obj, event):
         if obj is self.scene_view and event.type() == QEvent.Resize:
@@ -451,85 +400,112 @@ class OWQualityControl(widget.OWWidget):
             else:
                 base_indices = self.selected_base_indices()
             self.update_distances(base_indices)
-            self.replot_experiments()
 
     def get_cached_distances(self, measure):
+        """Return the cached distance matrix and the mask of computed
+        distances for the distance `measure`.
+        """
         if measure not in self._cached_distances:
-            attrs = self.data.domain.attributes
-            mat = numpy.zeros((len(attrs), len(attrs)))
-
+            n = len(self.data.domain.attributes)
             self._cached_distances[measure] = \
-                (mat, set(zip(range(len(attrs)), range(len(attrs)))))
+                (numpy.zeros((n, n)), numpy.eye(n, dtype=bool))
 
         return self._cached_distances[measure]
 
-    def get_cached_distance(self, measure, i, j):
-        matrix, computed = self.get_cached_distances(measure)
-        key = (i, j) if i < j else (j, i)
-        if key in computed:
-            return matrix[i, j]
-        else:
-            return None
-
-    def get_distance(self, measure, i, j):
-        d = self.get_cached_distance(measure, i, j)
-        if d is None:
-            vec_i = take_columns(self.data, [i])
-            vec_j = take_columns(self.data, [j])
-            d = measure(vec_i, vec_j)
-
-            mat, computed = self.get_cached_distances(measure)
-            mat[i, j] = d
-            key = key = (i, j) if i < j else (j, i)
-            computed.add(key)
-        return d
-
-    def store_distance(self, measure, i, j, dist):
+    def store_distances(self, measure, indices, distances):
+        """Store the `distances` from columns `indices` to all columns.
+        """
         matrix, computed = self.get_cached_distances(measure)
-        key = (i, j) if i < j else (j, i)
-        matrix[j, i] = matrix[i, j] = dist
-        computed.add(key)
+        matrix[indices, :] = distances
+        matrix[:, indices] = distances.T
+        computed[indices, :] = True
+        computed[:, indices] = True
 
     def update_distances(self, base_indices=()):
-        """Recompute the experiment distances.
+        """Recompute the experiment distances and update the plot.
+
+        Distances from the base columns which are not yet cached are
+        computed in a background thread.
+
         """
-        distance = self.selected_distance()
+        self._cancel_pending()
+        measure = self.selected_distance()
         if base_indices == ():
             base_group_index = self.selected_base_group_index()
             base_indices = [ind[base_group_index] \
                             for _, ind in self.groups]
 
         assert(len(base_indices) == len(self.groups))
-
-        base_distances = []
-        attributes = self.data.domain.attributes
-        pb = gui.ProgressBar(self, len(self.groups) * len(attributes))
-
-        for (group, indices), base_index in zip(self.groups, base_indices):
-            # Base column of the group
-            if base_index is not None:
-                base_vec = take_columns(self.data, [base_index])
-                distances = []
-                # Compute the distances between base column
-                # and all the rest data columns.
-                for i in range(len(attributes)):
-                    if i == base_index:
-                        distances.append(0.0)
-                    elif self.get_cached_distance(distance, i, base_index) is not None:
-                        distances.append(self.get_cached_distance(distance, i, base_index))
-                    else:
-                        vec_i = take_columns(self.data, [i])
-                        dist = distance(base_vec, vec_i)
-                        self.store_distance(distance, i, base_index, dist)
-                        distances.append(dist)
-                    pb.advance()
-
-                base_distances.append(distances)
-            else:
-                base_distances.append(None)
-
-        pb.finish()
-        self.distances = base_distances
+        base_indices = list(base_indices)
+
+        _, computed = self.get_cached_distances(measure)
+        missing = sorted(set(i for i in base_indices
+                             if i is not None and not computed[i].all()))
+        if not missing:
+            self._set_distances(measure, base_indices)
+            return
+
+        advance = concurrent.methodinvoke(self, "_set_progress", (float,))
+        state = namespace(cancelled=False, measure=measure,
+                          indices=missing, base_indices=base_indices)
+
+        def progress(value):
+            if state.cancelled:
+                raise CancelledError
+            advance(value)
+
+        # columns (experiments) are the profiles; compute the distances
+        # from one base column at a time to report progress and to stop
+        # at the next column when cancelled
+        X = self.data.X.T
+        self.progressBarInit()
+        self._distances_state = state
+        self._distances_future = self._executor.submit(
+            exp.distances_to, X, missing, measure, block_size=1,
+            callback=progress)
+        self._distances_future.add_done_callback(
+            concurrent.methodinvoke(self, "_on_distances_finished",
+                                    (concurrent.Future,)))
+
+    @Slot(float)
+    def _set_progress(self, value):
+        if self._distances_future is not None:
+            self.progressBarSet(value)
+
+    @Slot(concurrent.Future)
+    def _on_distances_finished(self, future):
+        if future is not self._distances_future:
+            return
+        self.progressBarFinished()
+        self.error(1)
+        state = self._distances_state
+        self._distances_future = self._distances_state = None
+        try:
+            distances = future.result()
+        except Exception as ex:
+            sys.excepthook(*sys.exc_info())
+            self.error(1, "Error: {!s}".format(ex))
+            return
+        self.store_distances(state.measure, state.indices, distances)
+        self._set_distances(state.measure, state.base_indices)
+
+    def _set_distances(self, measure, base_indices):
+        matrix, _ = self.get_cached_distances(measure)
+        self.distances = [list(matrix[i]) if i is not None else None
+                          for i in base_indices]
+        self.replot_experiments()
+
+    def _cancel_pending(self):
+        if self._distances_future is not None:
+            self._distances_future.cancel()
+            self._distances_state.cancelled = True
+            self._distances_future = self._distances_state = None
+            self.progressBarFinished()
+
+    def onDeleteWidget(self):
+        self._cancel_pending()
+        self._executor.shutdown(wait=True)
+        super().onDeleteWidget()
 
     def replot_experiments(self):
         """Replot the whole quality plot.
@@ -667,13 +667,12 @@ class OWSetEnrichment(widget.OWWidget):
             query, reference = map_unames()
             gscollections = collections.result()
 
-            results = []
+            targets = []
             info("Running enrichment")
             p = 0
             for i, gset in enumerate(gscollections):
                 genes = set(filter(None, map(match.umatch, gset.genes)))
-                enr = set_enrichment(genes, reference, query)
-                results.append((gset, enr))
+                targets.append(genes)
 
                 if state.cancelled:
                     raise UserInteruptException
@@ -682,6 +681,8 @@ class OWSetEnrichment(widget.OWWidget):
                 if pnew != p:
                     progress(pnew)
                     p = pnew
+            results = list(zip(gscollections,
+                               set_enrichments(targets, reference, query)))
             progress(100)
             info("")
             return query, reference, results
@@ -991,6 +992,33 @@ def set_enrichment(target, reference, query,
     )
 
 
+def set_enrichments(targets, reference, query,
+                    prob=utils.stats.Hypergeometric()):
+    """
+    Return :func:`set_enrichment` results for a list of target sets.
+    All p-values are computed with a single call to `prob.p_values`.
+
+    """
+    assert len(reference) > 0
+    query_mapped = [target.intersection(query) for target in targets]
+    reference_mapped = [target.intersection(reference) for target in targets]
+
+    p_values = prob.p_values([len(qm) for qm in query_mapped],
+                             len(reference),
+                             [len(rm) for rm in reference_mapped],
+                             len(query))
+
+    ref_p = np.array([len(rm) for rm in reference_mapped]) / len(reference)
+    query_p = (np.array([len(qm) for qm in query_mapped]) / len(query)
+               if query else np.full(len(targets), np.nan))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        enrichment = np.where(ref_p > 0, query_p / ref_p, np.nan)
+
+    return [enrichment_res(list(qm), list(rm), float(p), float(e))
+            for qm, rm, p, e in zip(query_mapped, reference_mapped,
+                                    p_values, enrichment)]
+
+
 if __name__ == "__main__":
     app = QtGui.QApplication(sys.argv)
     w = OWSetEnrichment()
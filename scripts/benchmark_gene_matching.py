@@ -0,0 +1,116 @@
+"""
+Compare per gene matching (`umatch`) with batch matching (`match_many`).
+
+By default a synthetic alias set resembling NCBI gene info (ids, symbols,
+locus tags, synonyms) is matched both with an in memory alias mapping and
+with a saved alias index (as used by pickled matchers). With --taxid the
+NCBI gene matcher for that organism is used (the gene info is downloaded
+if needed).
+
+    python benchmark_gene_matching.py [--genes 20000] [--taxid 9606]
+
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from orangecontrib.bio import gene
+
+
+def synthetic_aliases(ngroups, rand):
+    groups = []
+    for i in range(ngroups):
+        symbol = "GENE%i" % i
+        aliases = set([str(100000 + i), symbol, "LOC%i" % (500000 + i)])
+        for j in range(rand.randrange(4)):
+            aliases.add("%s%s%i" % (rand.choice("ABCDEFGHKLMNPRST"),
+                                    rand.choice("ABCDEFGHKLMNPRST"),
+                                    rand.randrange(ngroups)))
+        groups.append(aliases)
+    return groups
+
+
+class SyntheticMatcher(gene.MatcherAliasesPickled):
+    def __init__(self, aliases, path):
+        self.synthetic = aliases
+        self.path = path
+        gene.MatcherAliasesPickled.__init__(self)
+
+    def filename(self):
+        return (self.path,)
+
+    def create_aliases_version(self):
+        return "1"
+
+    def create_aliases(self):
+        return self.synthetic
+
+
+def timed(func, *args):
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--genes", type=int, default=20000,
+                        help="number of genes to match")
+    parser.add_argument("--taxid", help="use NCBI gene aliases of organism")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rand = random.Random(args.seed)
+
+    if args.taxid:
+        base = gene.GMNCBI(args.taxid)
+        aliases = base.aliases
+        matchers = [("NCBI", base)]
+    else:
+        aliases = synthetic_aliases(max(args.genes * 2, 1000), rand)
+        tmpdir = tempfile.mkdtemp()
+        indexed = SyntheticMatcher(aliases, os.path.join(tmpdir, "aliases"))
+        indexed.set_targets([])  # build and save the index
+        matchers = [("in memory", gene.MatcherAliases(aliases)),
+                    ("saved index", SyntheticMatcher(
+                        aliases, os.path.join(tmpdir, "aliases")))]
+
+    alias_list = [sorted(group) for group in aliases]
+    targets = [rand.choice(group) for group in
+               rand.sample(alias_list, min(len(alias_list), args.genes))]
+    genes = [rand.choice(group).lower() for group in
+             rand.sample(alias_list, min(len(alias_list), args.genes))]
+
+    for name, base in matchers:
+        print("%s aliases:" % name)
+        benchmark(gene.matcher([base]), targets, genes)
+
+    if not args.taxid:
+        shutil.rmtree(tmpdir)
+
+
+def benchmark(matcher, targets, genes):
+    t_targets, _ = timed(matcher.set_targets, targets)
+    print("set_targets (%i targets): %.3f s" % (len(targets), t_targets))
+
+    t_single, single = timed(lambda: [matcher.umatch(g) for g in genes])
+    print("umatch per gene (%i genes): %.3f s" % (len(genes), t_single))
+
+    matcher.set_targets(targets)
+    t_batch, batch = timed(matcher.match_many, genes)
+    print("match_many (%i genes): %.3f s" % (len(genes), t_batch))
+    t_cached, _ = timed(matcher.match_many, genes)
+    print("match_many, cached: %.3f s" % t_cached)
+
+    same = all((targets[i] if i is not None else None) == t
+               for i, t in zip(batch, single))
+    print("speedup: %.1fx, results %s" %
+          (t_single / max(t_batch, 1e-9), "equal" if same else "DIFFER"))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Measure per call latency of PPI database queries (`edges`, `synonyms`
+and `search_id`) with different ways of connecting to the database.
+
+A synthetic STRING database (with the STRING schema and indices) is
+queried with:
+
+  * a new connection per call (as formerly used by GeneMania),
+  * a single default connection (as formerly held by STRING/BioGRID),
+  * the shared read-only connections of `ppi.connections`.
+
+    python benchmark_ppi_queries.py [--proteins 20000] [--links 500000]
+
+"""
+from __future__ import print_function
+
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+
+from orangecontrib.bio import ppi
+
+
+def synthetic_string(filename, nproteins, nlinks, rand):
+    con = sqlite3.connect(filename)
+    ppi.STRING.clear_db(con)
+    ids = ["9606.ENSP%011i" % i for i in range(nproteins)]
+    con.executemany("INSERT INTO proteins VALUES (?, '9606')",
+                    ((id,) for id in ids))
+    con.executemany("INSERT INTO aliases VALUES (?, ?, 'Ensembl')",
+                    ((id, alias) for i, id in enumerate(ids)
+                     for alias in [id[5:], "GENE%i" % i, "G%i" % i]))
+
+    def links():
+        for _ in range(nlinks):
+            id1, id2 = rand.sample(ids, 2)
+            score = rand.randrange(150, 1000)
+            yield id1, id2, score
+            yield id2, id1, score
+    con.executemany("INSERT INTO links VALUES (?, ?, ?)", links())
+    ppi.STRING.create_db_index(con)
+    con.commit()
+    con.close()
+    return ids
+
+
+class ConnectPerCall(ppi.STRING):
+    @property
+    def db(self):
+        return sqlite3.connect(self.filename)
+
+
+def latency(func, args):
+    start = time.time()
+    for arg in args:
+        func(arg)
+    return (time.time() - start) / len(args) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--proteins", type=int, default=20000)
+    parser.add_argument("--links", type=int, default=500000)
+    parser.add_argument("--calls", type=int, default=5000)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    rand = random.Random(args.seed)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        filename = os.path.join(tmpdir, "string.sqlite")
+        ids = synthetic_string(filename, args.proteins, args.links, rand)
+        query = [rand.choice(ids) for _ in range(args.calls)]
+        names = ["GENE%i" % ids.index(id) for id in query[:1000]]
+
+        databases = [
+            ("connection per call", ConnectPerCall(database=filename)),
+            ("single connection",
+             ppi.STRING(database=sqlite3.connect(filename))),
+            ("shared read-only", ppi.STRING(database=filename)),
+        ]
+        print("%-20s %10s %10s %10s   (us per call)" %
+              ("", "edges", "synonyms", "search_id"))
+        for name, db in databases:
+            db.edges(query[0])  # open the connection, warm the cache
+            print("%-20s %10.1f %10.1f %10.1f" % (
+                name,
+                latency(db.edges, query),
+                latency(db.synonyms, query),
+                latency(lambda name: list(db.search_id(name)), names)))
+        ppi.connections.close()
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
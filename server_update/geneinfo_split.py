@@ -0,0 +1,181 @@
+"""
+Split NCBI gene_info and gene_history files by organism in a single
+streaming pass.
+
+Each line is assigned to an organism by its first (tax_id) column and
+written to the organism's output file (optionally gzip compressed) and,
+if requested, added to its indexed gene info table (see
+`orangecontrib.bio.gene.GeneInfoTable`). Nothing is buffered in memory
+besides the open outputs.
+
+Run as a script to benchmark the splitter against the former
+implementation on a synthetic gene_info file:
+
+    python geneinfo_split.py [--lines 5000000] [--taxids 20]
+
+"""
+from __future__ import print_function
+
+import os
+import gzip
+import time
+import random
+import tempfile
+import shutil
+
+from orangecontrib.bio.gene import GeneInfoTableWriter
+
+
+class OrganismOutput(object):
+    """
+    The output file (and optional table) of lines of one organism.
+    """
+    def __init__(self, filename, compress=False, table=None, key_column=1,
+                 aliases=False):
+        self.filename = filename
+        if compress:
+            self.file = gzip.open(filename, "wb", compresslevel=6)
+        else:
+            self.file = open(filename, "wb")
+        self.table = None
+        if table is not None:
+            self.table = GeneInfoTableWriter(table, key_column, aliases)
+
+    def write(self, line):
+        self.file.write(line)
+        if self.table is not None:
+            if not isinstance(line, str):
+                line = line.decode("utf-8")
+            self.table.add(line)
+
+    def close(self):
+        self.file.close()
+        if self.table is not None:
+            self.table.close()
+
+    def abort(self):
+        self.file.close()
+        if self.table is not None:
+            self.table.abort()
+
+
+def split(lines, taxids, output):
+    """
+    Write `lines` (bytes) of a NCBI gene file whose tax id is in `taxids`
+    to outputs created with `output(taxid)` (on first use). Return a
+    dictionary of the closed outputs by tax id; organisms without lines
+    get empty outputs.
+    """
+    taxids = set(taxids)
+    outputs = {}
+    try:
+        for line in lines:
+            taxid = line[:line.find(b"\t")].decode("ascii")
+            if taxid not in taxids:
+                continue
+            out = outputs.get(taxid)
+            if out is None:
+                out = outputs[taxid] = output(taxid)
+            out.write(line)
+        for taxid in taxids - set(outputs):
+            outputs[taxid] = output(taxid)
+    except Exception:
+        for out in outputs.values():
+            out.abort()
+        raise
+    for out in outputs.values():
+        out.close()
+    return outputs
+
+
+def split_file(filename, taxids, outdir, prefix, compress=False,
+               tables=False, key_column=1, aliases=False):
+    """
+    Split the NCBI gene file `filename` into `<prefix>.<taxid>.db` files
+    (and `<prefix>.<taxid>.db.sqlite` tables if `tables`) in `outdir`.
+    Return a dictionary of outputs by tax id.
+    """
+    def output(taxid):
+        path = os.path.join(outdir, "%s.%s.db" % (prefix, taxid))
+        return OrganismOutput(path, compress=compress,
+                              table=path + ".sqlite" if tables else None,
+                              key_column=key_column, aliases=aliases)
+
+    with open(filename, "rb") as f:
+        return split(f, taxids, output)
+
+
+def split_buffered(filename, taxids, outdir, prefix):
+    """
+    The former implementation (for comparison): test each line against
+    all tax ids and buffer the lines before writing them.
+    """
+    genes = dict((taxid, []) for taxid in taxids)
+    with open(filename, "rb") as f:
+        for gi in f:
+            if any(gi.startswith(id + b"\t") for id in genes):
+                genes[gi.split(b"\t", 1)[0]].append(gi.strip())
+    for taxid, lines in genes.items():
+        path = os.path.join(outdir, "%s.%s.db" % (prefix, taxid.decode()))
+        with open(path, "wb") as f:
+            f.write(b"\n".join(lines))
+
+
+def synthetic_gene_info(filename, nlines, taxids, rand):
+    """
+    Write a synthetic gene_info file of `nlines` lines where about one
+    third of the lines belong to `taxids`.
+    """
+    with open(filename, "wb") as f:
+        f.write(b"#tax_id\tGeneID\tSymbol\tLocusTag\tSynonyms\tdbXrefs\t"
+                b"chromosome\tmap_location\tdescription\ttype_of_gene\n")
+        for i in range(nlines):
+            if rand.random() < 0.33:
+                taxid = rand.choice(taxids)
+            else:
+                taxid = str(rand.randrange(1000, 2000000))
+            line = "%s\t%i\tSYM%i\tLOC%i\tS%i|T%i\tHGNC:%i\t%i\t%iq%i\t" \
+                   "hypothetical protein %i\tprotein-coding\n" % (
+                       taxid, i, i, i, i, i, i, i % 22, i % 22, i % 40, i)
+            f.write(line.encode("ascii"))
+
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--lines", type=int, default=5000000,
+                        help="number of lines of the synthetic file")
+    parser.add_argument("--taxids", type=int, default=20,
+                        help="number of split organisms")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rand = random.Random(args.seed)
+    taxids = [str(id) for id in rand.sample(range(1000, 2000000),
+                                            args.taxids)]
+    tmpdir = tempfile.mkdtemp()
+    try:
+        source = os.path.join(tmpdir, "gene_info")
+        synthetic_gene_info(source, args.lines, taxids, rand)
+        print("synthetic gene_info: %i lines, %.1f MB" %
+              (args.lines, os.path.getsize(source) / 2.0 ** 20))
+
+        def timed(name, func, *fargs, **kwargs):
+            outdir = tempfile.mkdtemp(dir=tmpdir)
+            start = time.time()
+            func(source, *fargs + (outdir,), **kwargs)
+            print("%s: %.2f s" % (name, time.time() - start))
+
+        timed("buffered (former)", split_buffered,
+              [id.encode() for id in taxids], prefix="gene_info")
+        timed("streaming", split_file, taxids, prefix="gene_info")
+        timed("streaming, gzip", split_file, taxids, prefix="gene_info",
+              compress=True)
+        timed("streaming, with tables", split_file, taxids,
+              prefix="gene_info", tables=True, aliases=True)
+    finally:
+        shutil.rmtree(tmpdir)
+
+
+if __name__ == "__main__":
+    main()
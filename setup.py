@@ -118,6 +118,9 @@ ENTRY_POINTS = {
     'orange.addons': (
         'bio = orangecontrib.bio',
     ),
+    'console_scripts': (
+        'orange-bio-prefetch = orangecontrib.bio.utils.serverfiles:main',
+    ),
     'orange.widgets': (
         ('Bioinformatics = orangecontrib.bio.widgets',
          'Prototypes = orangecontrib.bio.widgets.prototypes')